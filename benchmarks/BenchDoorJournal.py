@@ -0,0 +1,88 @@
+'''
+Door journal benchmark for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.DoorJournal import DoorJournal, JournalKinds
+from gserv.DoorStateMachine import DoorStates, DoorEvents
+from benchmarks.BenchScheduler import percentile
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+'''
+Door journal appends and queries over years of history. A journal of made up door traffic
+(opens and closes, holds, the odd forced close) is written, then random "opens in a day" and
+"last N transitions" queries are timed against it.
+
+  python -m benchmarks.BenchDoorJournal --years 10
+'''
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Door journal benchmark')
+  parser.add_argument('--years', type=float, default=5)
+  parser.add_argument('--per-day', type=int, default=20, help='door openings a day')
+  parser.add_argument('--queries', type=int, default=2000)
+  parser.add_argument('--seed', type=int, default=1)
+  args = parser.parse_args()
+
+  rng = random.Random(args.seed)
+  directory = tempfile.mkdtemp(prefix='journal')
+  try:
+    journal = DoorJournal(directory)
+    start = t = 1500000000.0
+    end = start + args.years * 365 * 86400
+    gap = 86400.0 / args.per_day
+    count = 0
+    t0 = time.perf_counter()
+    while t < end:
+      t += rng.uniform(0, 2 * gap)
+      journal.append(t, JournalKinds.TRANSITION, None, DoorEvents.SENSE_OPENED, DoorStates.CLOSED, DoorStates.OPENED)
+      if rng.random() < 0.05:
+        journal.append(t + 5, JournalKinds.HOLD_ON, None, None, DoorStates.OPENED)
+      if rng.random() < 0.01:
+        journal.append(t + 600, JournalKinds.FORCED_CLOSE, None, None, DoorStates.OPENED)
+      journal.append(t + rng.uniform(30, 700), JournalKinds.TRANSITION, None, DoorEvents.SENSE_CLOSED, DoorStates.OPENED,
+        DoorStates.CLOSED)
+      count += 2
+    elapsed = time.perf_counter() - t0
+    print("append {:>9} records {:>8.3f} s {:>10.0f} records/s in {} segments".format(count, elapsed,
+      count / elapsed, len(journal.segments)))
+
+    def opens_in_a_day():
+      since = rng.uniform(start, end - 86400)
+      return journal.query(since=since, until=since + 86400, kinds=[JournalKinds.TRANSITION],
+        states=[DoorStates.OPENED])
+
+    for name, query in (
+        ('opens in a day', opens_in_a_day),
+        ('last 10', lambda: journal.query(last=10, kinds=[JournalKinds.TRANSITION]))):
+      times = []
+      for i in range(args.queries):
+        t0 = time.perf_counter_ns()
+        query()
+        times.append(time.perf_counter_ns() - t0)
+      print("{:<15} p50 {:>8.1f} us p99 {:>8.1f} us max {:>8.1f} us".format(name, percentile(times, 50) / 1000,
+        percentile(times, 99) / 1000, max(times) / 1000))
+    journal.close()
+  finally:
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,104 @@
+'''
+Door state machine benchmark for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.DoorStateMachine import DoorStateMachine, DoorStates, DoorEvents, hall_event
+from benchmarks.BenchScheduler import percentile
+import argparse
+import random
+import time
+
+'''
+The cost of a door event in the controller, less the actions themselves: a random storm of
+hall sensor changes, hold presses and timer expiries is dispatched against a handler whose
+actions do nothing, and the time of each dispatch is reported per event, along with what the
+machine recorded in handler_stats.
+
+  python -m benchmarks.BenchDoorStateMachine --events 200000
+'''
+
+
+class Idle():
+  def force_closing(self, door):
+    return False
+
+  def held(self, door):
+    return False
+
+  def __getattr__(self, name):
+    if name.startswith('_'):
+      raise AttributeError(name)
+    return lambda door: None
+
+
+class Door():
+  __slots__ = ('state',)
+
+  def __init__(self):
+    self.state = DoorStates.UNKNOWN
+
+
+def storm(count, seed):
+  rng = random.Random(seed)
+  levels = ("LOW", "HIGH")
+  close_state = open_state = "HIGH"
+  events = []
+  for i in range(count):
+    if rng.random() < 0.8:
+      close_changed = rng.random() < 0.5
+      if close_changed:
+        close_state = rng.choice(levels)
+      else:
+        open_state = rng.choice(levels)
+      events.append(hall_event(close_state, open_state, close_changed))
+    else:
+      events.append(rng.choice((DoorEvents.HOLD, DoorEvents.ALARM_TIMER, DoorEvents.CLOSE_TIMER,
+        DoorEvents.MOVE_TIMEOUT)))
+  return events
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Door state machine dispatch benchmark')
+  parser.add_argument('--events', type=int, default=100000)
+  parser.add_argument('--seed', type=int, default=1)
+  args = parser.parse_args()
+
+  events = storm(args.events, args.seed)
+  machine = DoorStateMachine(Idle())
+  door = Door()
+  times = {}
+  clock = time.perf_counter_ns
+  start = clock()
+  for event in events:
+    t0 = clock()
+    machine.dispatch(door, event)
+    times.setdefault(event, []).append(clock() - t0)
+  total = clock() - start
+
+  print("{} events in {:.3f} s, {:.0f} events/s".format(len(events), total / 1e9, len(events) / (total / 1e9)))
+  print("{:<14} {:>8} {:>9} {:>9} {:>9}".format('', 'count', 'p50 us', 'p99 us', 'max us'))
+  for event in DoorEvents:
+    t = times.get(event, [])
+    print("{:<14} {:>8} {:>9.3f} {:>9.3f} {:>9.3f}".format(event.name, len(t), percentile(t, 50) / 1000,
+      percentile(t, 99) / 1000, max(t) / 1000 if t else 0.0))
+
+  stats = machine.handler_stats()
+  worst = max(stats.items(), key=lambda kv: kv[1]['max_us'])
+  print("slowest handler {} max {:.3f} us over {} dispatches".format(worst[0], worst[1]['max_us'], worst[1]['count']))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,166 @@
+'''
+GPIO input benchmark for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.Debouncer import Debouncer
+from gserv.GPIOInputEngine import GPIOInputEngine
+from gserv.GPIOLines import PipeLine
+import argparse
+import multiprocessing
+import os
+import select
+import threading
+import time
+
+'''
+Memory and CPU of the two input engines, with PipeLines standing in for the pins. The process
+engine is laid out the way GPIOInputModule runs it: a forked process per input with its own
+debounce thread, a Pipe back to the parent and a reader thread per pipe there. The epoll engine
+is one GPIOInputEngine thread. Both get the same bursts of bouncing edges on every input.
+
+Memory is the proportional set size (shared pages split between the processes sharing them)
+of the parent and every child, over what the parent used before the inputs were started.
+
+  python -m benchmarks.BenchGPIOInput --inputs 4 --bursts 200 --bounce 8
+'''
+
+
+def pss_kb(pid):
+  with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+    for line in f:
+      if line.startswith('Pss:'):
+        return int(line.split()[1])
+  return 0
+
+
+def cpu_seconds(pid):
+  with open('/proc/{}/stat'.format(pid)) as f:
+    fields = f.read().rsplit(')', 1)[1].split()
+  return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def input_process(line, debounce_time, topic, pipe):
+  # The child sees the pin through the edges, the way the ISR does
+  level = [line.value()]
+  debouncer = Debouncer(debounce_time, lambda: level[0], lambda state: pipe.send([topic, state]))
+  debouncer.start()
+  while True:
+    select.select([line], [], [])
+    for timestamp, rising in line.read_events():
+      level[0] = 1 if rising else 0
+      debouncer.edge()
+
+
+class ProcessEngine():
+  def __init__(self, lines, debounce_time, received):
+    self.children = []
+    context = multiprocessing.get_context('fork')
+    for idx, line in enumerate(lines):
+      parent_pipe, child_pipe = context.Pipe()
+      p = context.Process(target=input_process, args=(line, debounce_time, 'input{}'.format(idx), child_pipe))
+      p.daemon = True
+      p.start()
+      self.children.append(p)
+      t = threading.Thread(target=self._reader, args=(parent_pipe, received))
+      t.daemon = True
+      t.start()
+
+  def _reader(self, pipe, received):
+    try:
+      while True:
+        received.append(pipe.recv())
+    except EOFError:
+      pass
+
+  def pids(self):
+    return [p.pid for p in self.children]
+
+  def stop(self):
+    for p in self.children:
+      p.terminate()
+      p.join()
+
+
+class EpollEngine():
+  def __init__(self, lines, debounce_time, received):
+    self.engine = GPIOInputEngine(received.append, stats_interval=3600)
+    for idx, line in enumerate(lines):
+      self.engine.add_input('input{}'.format(idx), line, debounce_time)
+    self.engine.start()
+    # start publishes the initial states, which the process engine doesn't
+    del received[:]
+
+  def pids(self):
+    return []
+
+  def stop(self):
+    self.engine.stop()
+
+
+def run(engine_type, inputs, bursts, bounce, debounce_time, idle):
+  received = []
+  lines = [PipeLine() for i in range(inputs)]
+  base_pss = pss_kb(os.getpid())
+  cpu = time.process_time()
+
+  engine = engine_type(lines, debounce_time, received)
+  time.sleep(0.2)
+  pids = engine.pids()
+  child_cpu = [cpu_seconds(pid) for pid in pids]
+
+  idle_cpu = time.process_time()
+  time.sleep(idle)
+  idle_cpu = time.process_time() - idle_cpu + sum(cpu_seconds(pid) - c for pid, c in zip(pids, child_cpu))
+
+  start = time.monotonic()
+  for b in range(bursts):
+    for line in lines:
+      for x in range(bounce):
+        line.set(1)
+        line.set(0)
+      line.set(1 - b % 2)
+    time.sleep(debounce_time * 2)
+
+  while len(received) < bursts * inputs and time.monotonic() - start < 30:
+    time.sleep(0.01)
+
+  memory = pss_kb(os.getpid()) - base_pss + sum(pss_kb(pid) for pid in pids)
+  busy_cpu = time.process_time() - cpu + sum(cpu_seconds(pid) for pid in pids)
+  engine.stop()
+  for line in lines:
+    line.close()
+
+  return len(received), memory, idle_cpu, busy_cpu
+
+
+def main():
+  parser = argparse.ArgumentParser(description='GPIO input engine benchmark')
+  parser.add_argument('--inputs', type=int, default=4)
+  parser.add_argument('--bursts', type=int, default=200)
+  parser.add_argument('--bounce', type=int, default=8, help='extra edge pairs in each burst')
+  parser.add_argument('--debounce', type=float, default=5, help='debounce time in ms')
+  parser.add_argument('--idle', type=float, default=1.0, help='seconds with no edges to measure idle CPU')
+  args = parser.parse_args()
+
+  print("{:<10} {:>10} {:>10} {:>12} {:>10}".format('', 'published', 'PSS kB', 'idle cpu s', 'cpu s'))
+  for name, engine_type in (('process', ProcessEngine), ('epoll', EpollEngine)):
+    published, memory, idle_cpu, busy_cpu = run(engine_type, args.inputs, args.bursts, args.bounce,
+      args.debounce / 1000.0, args.idle)
+    print("{:<10} {:>10} {:>10} {:>12.3f} {:>10.3f}".format(name, published, memory, idle_cpu, busy_cpu))
+
+
+if __name__ == "__main__":
+  main()
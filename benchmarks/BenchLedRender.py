@@ -0,0 +1,94 @@
+'''
+LED render benchmark for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.LedRenderer import LedRenderer
+from gserv.led_patterns.PatternLibrary import load_patterns
+from benchmarks.BenchScheduler import percentile
+import argparse
+import itertools
+import threading
+import time
+
+'''
+Frame timing of the fixed rate render loop against the old scheme of starting a new
+threading.Timer after every frame. Both drive the same spin pattern into a writer that
+only timestamps the frame.
+
+  python -m benchmarks.BenchLedRender --seconds 5 --leds 144
+'''
+
+PATTERNS_FILE = 'config/led_patterns.yaml'
+PATTERN = 'GREEN_CLOCKWISE'
+
+
+def timer_chain(config, write, stop):
+  table = load_patterns(PATTERNS_FILE, config)[PATTERN]
+  frames = itertools.cycle(table.frames)
+
+  def tick():
+    if stop.is_set():
+      return
+    write(next(frames))
+    threading.Timer(table.frame_period, tick).start()
+
+  tick()
+
+
+def render_loop(config, write, stop):
+  renderer = LedRenderer(load_patterns(PATTERNS_FILE, config), write)
+  renderer.start()
+  renderer.change_pattern(PATTERN)
+  stop.wait()
+  renderer.stop()
+
+
+def measure(driver, seconds, leds):
+  stamps = []
+  stop = threading.Event()
+  config = {'num_leds': leds, 'top_led': 0}
+
+  def write(frame, changed=None):
+    if not stop.is_set():
+      stamps.append(time.monotonic())
+
+  cpu = time.process_time()
+  threading.Timer(seconds, stop.set).start()
+  driver(config, write, stop)
+  stop.wait()
+  cpu = time.process_time() - cpu
+
+  period = load_patterns(PATTERNS_FILE, {'num_leds': leds, 'top_led': 0})[PATTERN].frame_period
+  errors = [abs((b - a) - period) for a, b in zip(stamps, stamps[1:])]
+  drift = (stamps[-1] - stamps[0]) - period * (len(stamps) - 1)
+  return len(stamps), errors, drift, cpu
+
+
+def main():
+  parser = argparse.ArgumentParser(description='LED frame timing benchmark')
+  parser.add_argument('--seconds', type=float, default=5.0)
+  parser.add_argument('--leds', type=int, default=8)
+  args = parser.parse_args()
+
+  print("{:<16} {:>8} {:>10} {:>10} {:>10} {:>8}".format('', 'frames', 'p50 ms', 'p99 ms', 'drift ms', 'cpu s'))
+  for name, driver in (('Timer per frame', timer_chain), ('Render loop', render_loop)):
+    frames, errors, drift, cpu = measure(driver, args.seconds, args.leds)
+    print("{:<16} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>8.3f}".format(name, frames,
+      percentile(errors, 50) * 1000, percentile(errors, 99) * 1000, drift * 1000, cpu))
+
+
+if __name__ == "__main__":
+  main()
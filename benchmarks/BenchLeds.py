@@ -0,0 +1,159 @@
+'''
+LED benchmark suite for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.LedRenderer import LedRenderer
+from gserv.led_backends.Recording import RecordingBackend
+from gserv.led_patterns.PatternLibrary import load_patterns
+from benchmarks.BenchScheduler import percentile
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+'''
+Runs every pattern in led_patterns.yaml into the recording backend, so it needs no hardware.
+
+The accelerated pass drives LedRenderer.tick() against a virtual clock that jumps straight to
+each frame's deadline, so the full ten minute COUNTDOWN (and its hand off to RED_CLOCKWISE) takes
+well under a second. It reports how many frames per second of wall time the render path can
+produce, the CPU time per frame, and the memory left allocated per frame; recorded frames are
+interned, so that last number only climbs if frames stop being shared.
+
+The realtime pass runs the real render thread for a few seconds per animated pattern and reports
+how far each pushed frame landed from its slot on the frame_period grid.
+
+  python -m benchmarks.BenchLeds --leds 144 --json --max-jitter-ms 5 --min-fps 2000
+'''
+
+PATTERNS_FILE = 'config/led_patterns.yaml'
+
+
+class VirtualClock():
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+def accelerated(frame_tables, config, pattern_name, seconds):
+  clock = VirtualClock()
+  backend = RecordingBackend(config, clock)
+  backend.begin()
+  renderer = LedRenderer(frame_tables, backend.write, clock)
+  renderer.change_pattern(pattern_name)
+
+  tracemalloc.start()
+  start_mem = tracemalloc.get_traced_memory()[0]
+  cpu = time.process_time()
+  wall = time.perf_counter()
+
+  while clock.now < seconds:
+    deadline = renderer.tick()
+    if deadline is None:
+      break
+    clock.now = deadline
+
+  wall = time.perf_counter() - wall
+  cpu = time.process_time() - cpu
+  end_mem = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+
+  frames = renderer.frames_rendered
+  return {
+    'frames': frames,
+    'pushed': renderer.frames_pushed,
+    'final_pattern': renderer.current_pattern.pattern_name if renderer.current_pattern else None,
+    'fps': frames / wall if wall > 0 else 0.0,
+    'cpu_us_per_frame': cpu / frames * 1e6 if frames else 0.0,
+    'bytes_per_frame': (end_mem - start_mem) / frames if frames else 0.0
+  }
+
+
+def realtime(frame_tables, config, pattern_name, seconds):
+  backend = RecordingBackend(config)
+  backend.begin()
+  renderer = LedRenderer(frame_tables, backend.write)
+  renderer.start()
+  renderer.change_pattern(pattern_name)
+  time.sleep(seconds)
+  renderer.stop()
+
+  # Frames with no changes are never pushed, so measure against the grid rather than the gaps
+  period = frame_tables[pattern_name].frame_period
+  stamps = backend.timestamps()
+  errors = []
+  for t in stamps[1:]:
+    offset = t - stamps[0]
+    errors.append(abs(offset - round(offset / period) * period))
+
+  return {
+    'jitter_p50_ms': percentile(errors, 50) * 1000,
+    'jitter_p95_ms': percentile(errors, 95) * 1000,
+    'jitter_p99_ms': percentile(errors, 99) * 1000
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description='LED pattern benchmark suite')
+  parser.add_argument('--leds', type=int, default=8)
+  parser.add_argument('--seconds', type=float, default=60.0,
+    help='virtual seconds to run each looping pattern for')
+  parser.add_argument('--realtime-seconds', type=float, default=1.0,
+    help='wall seconds per animated pattern for the jitter pass, 0 to skip it')
+  parser.add_argument('--json', action='store_true')
+  parser.add_argument('--max-jitter-ms', type=float, help='fail if any pattern\'s p99 jitter is above this')
+  parser.add_argument('--min-fps', type=float, help='fail if any pattern renders fewer frames per second than this')
+  args = parser.parse_args()
+
+  config = {'num_leds': args.leds, 'top_led': 0}
+  frame_tables = load_patterns(PATTERNS_FILE, config)
+
+  results = {}
+  for name, table in sorted(frame_tables.items()):
+    # One shot patterns run to the end of their table, plus a little of what they hand off to
+    seconds = args.seconds if table.loop else table.duration() + 1.0
+    results[name] = accelerated(frame_tables, config, name, seconds)
+    results[name]['virtual_seconds'] = seconds
+    if args.realtime_seconds > 0 and len(table) > 1:
+      results[name].update(realtime(frame_tables, config, name, args.realtime_seconds))
+
+  failures = []
+  for name, r in results.items():
+    if args.min_fps is not None and r['fps'] < args.min_fps:
+      failures.append("{} renders {:.0f} frames/s, below {:.0f}".format(name, r['fps'], args.min_fps))
+    if args.max_jitter_ms is not None and r.get('jitter_p99_ms', 0.0) > args.max_jitter_ms:
+      failures.append("{} p99 jitter {:.3f} ms, above {:.3f}".format(name, r['jitter_p99_ms'], args.max_jitter_ms))
+
+  if args.json:
+    print(json.dumps({'leds': args.leds, 'patterns': results, 'failures': failures}, indent=2, sort_keys=True))
+  else:
+    print("{:<20} {:>8} {:>8} {:>10} {:>8} {:>8} {:>8} {:>8} {:>8}".format('', 'frames', 'pushed', 'frames/s',
+      'cpu us', 'B/frame', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name, r in sorted(results.items()):
+      print("{:<20} {:>8} {:>8} {:>10.0f} {:>8.2f} {:>8.1f} {:>8} {:>8} {:>8}".format(name, r['frames'], r['pushed'],
+        r['fps'], r['cpu_us_per_frame'], r['bytes_per_frame'],
+        *["{:.3f}".format(r[k]) if k in r else '-' for k in ('jitter_p50_ms', 'jitter_p95_ms', 'jitter_p99_ms')]))
+    for failure in failures:
+      print(failure)
+
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
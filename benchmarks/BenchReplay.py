@@ -0,0 +1,99 @@
+'''
+MQTT replay benchmark for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.MQTTRecording import RecordingWriter, read_recording
+from gserv.Replay import replay, controller, light, gpiooutput
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+'''
+Throughput of recording and replaying MQTT traffic. Days of made up garage traffic (the door
+opening and closing, the lux sensor every minute, motion, the lights) are written to a
+recording, read back, and replayed as fast as possible into the controller, light and gpio
+output modules. Give it a real recording with --recording to replay that instead.
+
+  python -m benchmarks.BenchReplay --days 30
+'''
+
+
+def garage_traffic(days, seed):
+  rng = random.Random(seed)
+  messages = []
+  t = 1500000000.0
+  end = t + days * 86400
+  minute = t
+  while minute < end:
+    messages.append((minute, 'gserv/sensors/lux', '{:.1f}'.format(rng.uniform(0, 200))))
+    minute += 60
+
+  while t < end:
+    t += rng.uniform(1800, 7200)
+    open_for = rng.choice((rng.uniform(30, 300), rng.uniform(600, 700)))
+    for offset, topic, payload in ((0, 'close_hall', 'HIGH'), (12, 'open_hall', 'LOW'), (open_for, 'open_hall', 'HIGH'),
+        (open_for + 12, 'close_hall', 'LOW')):
+      messages.append((t + offset, 'gserv/gpioinput/' + topic, payload))
+    messages.append((t + 20, 'gserv/gpioinput/pir', 'HIGH'))
+    messages.append((t + 21, 'gserv/light', 'ON'))
+    messages.append((t + 25, 'gserv/gpiooutput/door', 'HIGH'))
+  return sorted(messages, key=lambda m: m[0])
+
+
+def main():
+  parser = argparse.ArgumentParser(description='MQTT record and replay throughput')
+  parser.add_argument('--days', type=float, default=7)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--recording', help='replay this recording instead of made up traffic')
+  parser.add_argument('--secure', default='config/secure.yaml.sample')
+  args = parser.parse_args()
+  logging.disable(logging.CRITICAL)
+
+  path = args.recording
+  if path is None:
+    messages = garage_traffic(args.days, args.seed)
+    fd, path = tempfile.mkstemp(suffix='.rec')
+    os.close(fd)
+    os.unlink(path)
+    start = time.perf_counter()
+    writer = RecordingWriter(path)
+    for t, topic, payload in messages:
+      writer.write(t, topic, payload)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    print("write   {:>8} messages {:>8.3f} s {:>10.0f} messages/s {:>8.1f} bytes/message".format(len(messages),
+      elapsed, len(messages) / elapsed, os.path.getsize(path) / len(messages)))
+
+  start = time.perf_counter()
+  messages = list(read_recording(path))
+  elapsed = time.perf_counter() - start
+  print("read    {:>8} messages {:>8.3f} s {:>10.0f} messages/s".format(len(messages), elapsed, len(messages) / elapsed))
+  if args.recording is None:
+    os.unlink(path)
+
+  for name, factory, config_file in (('controller', controller, 'config/controller.yaml'),
+      ('light', light, 'config/light.yaml'), ('gpiooutput', gpiooutput, 'config/gpiooutput.yaml')):
+    build, outputs = factory(config_file, args.secure)
+    result = replay(build, messages)
+    print("{:<10} {:>8} delivered {:>8.3f} s {:>10.0f} messages/s {:>8} published".format(name, result.delivered,
+      result.elapsed, len(messages) / result.elapsed, len(result.published)))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,88 @@
+'''
+Scheduler benchmark for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.Scheduler import Scheduler
+import argparse
+import threading
+import time
+
+'''
+Compares one threading.Timer per delayed call against the shared Scheduler. Both runs
+fire the same set of short delays spread over a window, the same way the LED patterns
+and the momentary outputs do, and report the peak thread count and how late each call ran.
+
+  python -m benchmarks.BenchScheduler --timers 2000 --window 2.0
+'''
+
+
+def percentile(values, pct):
+  ordered = sorted(values)
+  if not ordered:
+    return 0.0
+  idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+  return ordered[idx]
+
+
+def run(start_timer, count, window):
+  lateness = []
+  done = threading.Event()
+  lock = threading.Lock()
+  peak_threads = [threading.active_count()]
+
+  def fired(deadline):
+    late = time.monotonic() - deadline
+    with lock:
+      lateness.append(late)
+      if len(lateness) == count:
+        done.set()
+
+  base = time.monotonic() + 0.05
+  for i in range(count):
+    deadline = base + window * i / count
+    start_timer(deadline - time.monotonic(), fired, deadline)
+    peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+  while not done.wait(0.005):
+    peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+  return peak_threads[0], lateness
+
+
+def thread_timer(delay, function, deadline):
+  threading.Timer(delay, function, args=[deadline]).start()
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Timer thread vs shared scheduler benchmark')
+  parser.add_argument('--timers', type=int, default=2000)
+  parser.add_argument('--window', type=float, default=2.0)
+  args = parser.parse_args()
+
+  scheduler = Scheduler()
+  results = [
+    ('threading.Timer', run(thread_timer, args.timers, args.window)),
+    ('Scheduler', run(scheduler.call_later, args.timers, args.window))
+  ]
+
+  print("{:<16} {:>12} {:>10} {:>10} {:>10}".format('', 'peak threads', 'p50 ms', 'p99 ms', 'max ms'))
+  for name, (threads, lateness) in results:
+    print("{:<16} {:>12} {:>10.3f} {:>10.3f} {:>10.3f}".format(name, threads,
+      percentile(lateness, 50) * 1000, percentile(lateness, 99) * 1000, max(lateness) * 1000))
+
+
+if __name__ == "__main__":
+  main()
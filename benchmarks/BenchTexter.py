@@ -0,0 +1,128 @@
+'''
+Texter SMTP benchmark for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.SMTPSession import SMTPSession
+from benchmarks.BenchScheduler import percentile
+import argparse
+import smtplib
+import socketserver
+import threading
+import time
+
+'''
+Time to send a burst of alerts, against a local SMTP stand-in that takes setup_delay seconds to
+greet a connection and login_delay to log in, standing in for the TCP, TLS and authentication
+round trips to the real server. A connection per alert (how Texter used to send) is compared
+with an SMTPSession logged in ahead of the burst. Each alert's time is from the start of the
+burst to the stand-in having the whole message.
+
+  python -m benchmarks.BenchTexter --alerts 5 --setup-delay 0.5 --login-delay 0.5
+'''
+
+
+class StandIn(socketserver.ThreadingTCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self, setup_delay, login_delay):
+    socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+    self.setup_delay = setup_delay
+    self.login_delay = login_delay
+    self.received = []
+
+
+class StandInHandler(socketserver.StreamRequestHandler):
+  def reply(self, line):
+    self.wfile.write(line.encode('ascii') + b'\r\n')
+
+  def handle(self):
+    time.sleep(self.server.setup_delay)
+    self.reply('220 standin ESMTP')
+    while True:
+      line = self.rfile.readline()
+      if not line:
+        return
+      command = line.decode('ascii', 'replace').strip().upper()
+      if command.startswith('EHLO'):
+        self.wfile.write(b'250-standin\r\n250 AUTH PLAIN\r\n')
+      elif command.startswith('AUTH'):
+        time.sleep(self.server.login_delay)
+        self.reply('235 Authenticated')
+      elif command == 'DATA':
+        self.reply('354 End data with <CR><LF>.<CR><LF>')
+        while self.rfile.readline() not in (b'.\r\n', b''):
+          pass
+        self.server.received.append(time.perf_counter())
+        self.reply('250 OK')
+      elif command == 'QUIT':
+        self.reply('221 Bye')
+        return
+      else:
+        self.reply('250 OK')
+
+
+def mail_per_alert(port, count):
+  for i in range(count):
+    s = smtplib.SMTP('127.0.0.1', port, timeout=20)
+    s.login('user', 'password')
+    s.sendmail('user', ['phone'], 'alert {}'.format(i))
+    s.quit()
+
+
+def mail_on_session(session, count):
+  for i in range(count):
+    session.send('user', ['phone'], 'alert {}'.format(i))
+
+
+def report(name, server, start, count):
+  deadline = time.monotonic() + 60
+  while len(server.received) < count and time.monotonic() < deadline:
+    time.sleep(0.001)
+  times = [(t - start) * 1000 for t in server.received]
+  server.received.clear()
+  print("{:<12} {:>3} alerts first {:>8.1f} ms last {:>8.1f} ms p50 {:>8.1f} ms".format(name, len(times),
+    times[0], times[-1], percentile(times, 50)))
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Texter SMTP session benchmark')
+  parser.add_argument('--alerts', type=int, default=5)
+  parser.add_argument('--setup-delay', type=float, default=0.2)
+  parser.add_argument('--login-delay', type=float, default=0.2)
+  args = parser.parse_args()
+
+  server = StandIn(args.setup_delay, args.login_delay)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  port = server.server_address[1]
+
+  start = time.perf_counter()
+  mail_per_alert(port, args.alerts)
+  report('per alert', server, start, args.alerts)
+
+  session = SMTPSession('127.0.0.1', port, 'user', 'password', starttls=False)
+  session.start()
+  while session.connects == 0:
+    time.sleep(0.001)
+  start = time.perf_counter()
+  mail_on_session(session, args.alerts)
+  report('session', server, start, args.alerts)
+  session.close()
+  server.shutdown()
+
+
+if __name__ == "__main__":
+  main()
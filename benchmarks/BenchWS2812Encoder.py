@@ -0,0 +1,70 @@
+'''
+WS2812 encoder benchmark for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.WS2812Encoder import WS2812Encoder, grb_to_spi_reference
+import argparse
+import timeit
+
+'''
+Time to turn one frame into SPI bytes with the old bit at a time encoder and with the
+lookup table encoder, both when every Led changes (a spin step) and when one Led changes
+(a countdown step)
+
+  python -m benchmarks.BenchWS2812Encoder
+'''
+
+
+def reference_encode(frame):
+  outbytes = [0] * (1 + len(frame) * 9)
+  byte_idx = 1
+  for l in frame:
+    outbytes[byte_idx:byte_idx + 9] = grb_to_spi_reference(l)
+    byte_idx += 9
+  return bytes(outbytes)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='WS2812 SPI encoder benchmark')
+  parser.add_argument('--number', type=int, default=20000)
+  parser.add_argument('--leds', type=int, default=8)
+  args = parser.parse_args()
+
+  leds = args.leds
+  spin = [tuple((x * 37 + i * 11) & 0xFF for x in range(3)) for i in range(leds)]
+  rotations = [spin[i:] + spin[:i] for i in range(8)]
+  rotation_bytes = [bytes(c for grb in frame for c in grb) for frame in rotations]
+
+  encoder = WS2812Encoder(leds)
+  state = {'i': 0}
+
+  def table_encode(changed):
+    state['i'] = (state['i'] + 1) & 7
+    return bytes(encoder.encode(rotation_bytes[state['i']], changed))
+
+  cases = [
+    ('reference, all leds', lambda: reference_encode(rotations[state['i']])),
+    ('table, all leds', lambda: table_encode(None)),
+    ('table, two leds', lambda: table_encode([1, 2]))
+  ]
+
+  for name, case in cases:
+    seconds = timeit.timeit(case, number=args.number)
+    print("{:<22} {:>8.2f} us/frame".format(name, seconds / args.number * 1e6))
+
+
+if __name__ == "__main__":
+  main()
@@ -15,6 +15,7 @@ Copyright (C) 2018 Kevin Kessler
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+from gserv.Tracing import Tracer, TRACE_PREFIX
 import paho.mqtt.client as mqtt
 import sys
 import os
@@ -48,11 +49,27 @@ def merge_yaml(config_file, secure_file):
   return yaml.safe_load(config_str)
 
 
+'''
+A module normally loads config_file, merged with secure_file, and connects to the broker on
+localhost. For running a module off the Pi, config_file can be the config as a dict, and
+mqtt_client anything with a publish(topic, payload) method, in which case nothing connects and
+the messages are handed to receive by whoever is driving the module
+
+With trace_dir in the config, the module's tracer (see Tracing) writes its spans there, and the
+module subscribes to the trace sidecars of its sub_topic as well. A message that comes with a
+sidecar is handled in a span carrying on the sidecar's trace, and publish_traced hands the
+current trace on with what it publishes
+'''
+
+
 class BaseModule(object):
-  def __init__(self, config_file, secure_file):
+  def __init__(self, config_file, secure_file, mqtt_client=None):
     self.is_connected = False
 
-    self.config = merge_yaml(config_file, secure_file)
+    if isinstance(config_file, dict):
+      self.config = config_file
+    else:
+      self.config = merge_yaml(config_file, secure_file)
     if 'Error' in self.config:
       print("Error {}".format(self.config['Error']))
       sys.exit(2)
@@ -60,9 +77,16 @@ class BaseModule(object):
     if 'logging' in self.config:
       logging.config.dictConfig(self.config['logging'])
 
+    self.tracer = Tracer.from_config(self.config, self.config.get('mqtt_client_name', self.__class__.__name__))
+
+    if mqtt_client is not None:
+      self.mqtt_client = mqtt_client
+      self.is_connected = True
+      return
+
     self.mqtt_client = mqtt.Client(self.config['mqtt_client_name'])
     self.mqtt_client.on_connect = self.__on_connect
-    self.mqtt_client.on_message = self.on_message
+    self.mqtt_client.on_message = self.receive
     self.mqtt_client.on_subscribe = self.__on_subscribe
     self.mqtt_client.connect('localhost')
 
@@ -75,9 +99,34 @@ class BaseModule(object):
 
     if 'sub_topic' in self.config:
       self.mqtt_client.subscribe(self.config['sub_topic'], qos=1)
+      if self.tracer.enabled:
+        self.mqtt_client.subscribe(TRACE_PREFIX + self.config['sub_topic'], qos=1)
 
     self.is_connected = True
 
+  def receive(self, client, userdata, message):
+    if not self.tracer.enabled:
+      self.on_message(client, userdata, message)
+      return
+
+    if message.topic.startswith(TRACE_PREFIX):
+      self.tracer.received_sidecar(message.topic[len(TRACE_PREFIX):], message.payload)
+      return
+    context = self.tracer.extract(message.topic)
+    if context is None:
+      self.on_message(client, userdata, message)
+      return
+    with self.tracer.span('on_message ' + message.topic, context):
+      self.on_message(client, userdata, message)
+
+  '''
+  publish_traced publishes payload on topic, with the current trace, if there is one, on its
+  sidecar
+  '''
+  def publish_traced(self, topic, payload, context=None):
+    self.tracer.inject(self.mqtt_client, topic, context)
+    self.mqtt_client.publish(topic, payload)
+
   def on_message(self, client, userdata, message):
     print("Wrong")
     pass
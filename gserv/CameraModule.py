@@ -32,7 +32,8 @@ import logging
 '''
 Module to take a photo from a USB camera, when a '?' is sent as an MQTT message on the
 configured camera topic. Published the file name and local path on the same topic when
-complete.
+complete. The capture and the upload are spans of the trace the request came with, if it came
+with one (see Tracing), and the trace is carried on with the picture.
 '''
 
 
@@ -76,14 +77,16 @@ class CameraModule(BaseModule):
 
     filename = self.picture_prefix + "{:%Y%m%d%H%M%S}.jpg".format(datetime.datetime.now())
     pPath = os.path.join(self.picture_path, filename)
-    with picamera.PiCamera() as camera:
-      camera.resolution = (self.image_width, self.image_height)
-      camera.start_preview()
-      time.sleep(2)
-      camera.capture(pPath)
-
-    self.mqtt_client.publish(self.camera_topic, pPath)
-    self._google_upload_photo(pPath)
+    with self.tracer.span('capture'):
+      with picamera.PiCamera() as camera:
+        camera.resolution = (self.image_width, self.image_height)
+        camera.start_preview()
+        time.sleep(2)
+        camera.capture(pPath)
+
+    self.publish_traced(self.camera_topic, pPath)
+    with self.tracer.span('drive upload'):
+      self._google_upload_photo(pPath)
 
   '''
   _get_google_credentials stolen from Google's example app and slightly modified.
@@ -18,33 +18,147 @@ Copyright (C) 2018 Kevin Kessler
 from gserv.BaseModule import BaseModule
 from gserv.Texter import Texter
 from gserv.PIR import PIR
+from gserv.Scheduler import get_scheduler
+from gserv.DoorStateMachine import DoorStateMachine, DoorStates, DoorEvents, hall_event
+from gserv.StateSnapshot import save_snapshot, load_snapshot
+from gserv.DoorJournal import DoorJournal, JournalKinds
+from gserv.TravelStats import TravelStats
 import sys
+import json
 import logging
-import enum
-import threading
+import time
+
+'''
+One controller runs every door in the garage. Without a doors list in controller.yaml there is
+the one door, set up by the top level close_input, open_input, hold_input, door_control_topic,
+hold_led, led_topic and piezo_topic. With one, each entry is a door:
+
+  doors:
+    - name: left
+      close_input: 'close_hall_left'
+      open_input: 'open_hall_left'
+      door_control_topic: 'gserv/gpiooutput/door_left'
+
+and any of those keys a door leaves out comes from the top level, so doors can share a hold
+button, an LED ring or the piezo. With more than one door, texts and the door_state log say
+which door they are about.
+
+Each door's state is a Door, and they all share the one DoorStateMachine and the Scheduler.
+Which door, and which of its inputs, an input topic belongs to is worked out once at startup.
+
+With snapshot_file set, every door's state, flags, sensor readings and pending timers (as wall
+clock deadlines) are saved there after each event, and again every stats_interval seconds, so
+a door left on hold or in error for hours still has a fresh snapshot. A restart within
+snapshot_max_age seconds of the last save picks the doors up from it: the timers carry on from where they were, and the LEDs go straight
+to the pattern they were showing. The '?' to the input module still goes out, and a sensor
+that answers with what the snapshot had is taken as confirmation, while one that has changed is
+handled as the door having moved while the controller was down.
+
+With journal_dir set, every change of door state, hold toggle, forced close and failure is
+written to a DoorJournal there. The journal is asked about on journal_query_topic, with a JSON
+object of the DoorJournal.query arguments, by name (kinds and states by name too), and an id
+to tell the answer by:
+
+  {"id": "opens", "since": 1530000000, "until": 1530086400, "kinds": ["TRANSITION"],
+    "states": ["OPENED"]}
+  {"id": "recent", "last": 10}
+
+The answer goes to journal_response_topic, as {"id": ..., "entries": [...], "elapsed_us": ...},
+or {"id": ..., "error": ...} if the question couldn't be answered. last and limit are whole
+numbers, and an answer has at most max_journal_entries entries whichever is given.
+
+The time each door takes to open (from OPENING to OPENED) and close (CLOSING to CLOSED), and to
+start moving after the controller closes it, is kept in TravelStats and published with the
+other metrics on stats_topic/travel. A time more than travel_sigma standard deviations from the
+door's usual is reported on travel_warning_topic.
+
+Each close command carries an id, sent just before it on door_control_topic/id along with when
+it was sent. The output module answers on command_ack_topic with when it got the command and
+when it wrote the pin, and the input module puts out when a sensor's edge was and when it was
+published on input_timing_topic/<input>, just before the sensor's new state. When the first
+sensor change after the command gets here, the time each hop took is published on
+stats_topic/latency, in milliseconds:
+
+  to_output      controller publish to the output module getting the command
+  pin_write      the output module writing the pin
+  movement       the pin to the sensor's last edge, the door starting to move and the bounce
+  debounce       the sensor's last edge to the input module publishing it
+  to_controller  the input module publishing to the controller getting it
+  total          the command to the controller seeing the door move
+  ack            the pin write to the controller getting the ack
+
+Any hop a module didn't time is null, as is everything after the pin if the door didn't move.
+'''
+
+# The most entries one answer to a journal query carries
+max_journal_entries = 1000
+
+door_keys = ('close_input', 'open_input', 'hold_input', 'door_control_topic', 'hold_led', 'led_topic', 'piezo_topic')
+
+
+class Door():
+  __slots__ = ('name', 'close_input', 'open_input', 'hold_input', 'door_control_topic', 'hold_led', 'led_topic',
+    'piezo_topic', 'state', 'close_state', 'open_state', 'on_hold', 'error_state', 'force_close', 'door_close_timer',
+    'command_response_timer', 'restoring', 'travel_start', 'command')
+
+  def __init__(self, name, config):
+    self.name = name
+    for key in door_keys:
+      setattr(self, key, config[key])
+
+    self.state = DoorStates.UNKNOWN
+    self.open_state = "XX"
+    self.close_state = "XX"
+    self.on_hold = False
+    self.error_state = False
+    self.force_close = False
+    self.door_close_timer = None
+    self.command_response_timer = None
+    # input to the state the snapshot had it in, until the input module answers the '?'
+    self.restoring = None
+    # When the door started moving, and the hops of the close command waiting for it to move
+    self.travel_start = None
+    self.command = None
 
 
 class ControllerModule(BaseModule):
 
-  def __init__(self, config_file, secure_file):
+  '''
+  mqtt_client, scheduler, texter and clock (the wall clock snapshots are timed by) are for
+  running the controller in simulation (see ControllerSimulation); by default it connects to the
+  broker, uses the shared Scheduler and texts over SMTP
+  '''
+  def __init__(self, config_file, secure_file, mqtt_client=None, scheduler=None, texter=None, clock=time.time):
     # Initialize self.ready to False before mqtt is initialized and
     # starts getting messages
     self.ready = False
-    BaseModule.__init__(self, config_file, secure_file)
+    BaseModule.__init__(self, config_file, secure_file, mqtt_client=mqtt_client)
 
     try:
       self.input_topic = self.config['input_topic']
-      self.piezo_topic = self.config['piezo_topic']
       self.camera_topic = self.config['camera_topic']
-      self.close_input = self.config['close_input']
-      self.open_input = self.config['open_input']
-      self.hold_input = self.config['hold_input']
       self.pir_input = self.config['pir_input']
       self.light_level_topic = self.config['light_level_topic']
-      self.hold_led = self.config['hold_led']
-      self.led_topic = self.config['led_topic']
-      self.piezo_topic = self.config['piezo_topic']
-      self.door_control_topic = self.config['door_control_topic']
+      # Optional names of piezo sequences (see gpiooutput.yaml) to play instead of a steady tone
+      self.piezo_alarm_sequence = self.config.get('piezo_alarm_sequence')
+      self.piezo_error_sequence = self.config.get('piezo_error_sequence')
+      # Time spent handling each (door state, event) is published here
+      self.stats_topic = self.config.get('stats_topic', 'gserv/metrics/controller')
+      self.stats_interval = self.config.get('stats_interval', 60)
+      self.snapshot_file = self.config.get('snapshot_file')
+      self.snapshot_max_age = self.config.get('snapshot_max_age', 3600)
+      self.journal_query_topic = self.config.get('journal_query_topic', 'gserv/journal/query')
+      self.journal_response_topic = self.config.get('journal_response_topic', 'gserv/journal/response')
+      self.travel_warning_topic = self.config.get('travel_warning_topic', 'gserv/error')
+      self.command_ack_topic = self.config.get('command_ack_topic', 'gserv/timing/gpiooutput')
+      self.input_timing_topic = self.config.get('input_timing_topic', 'gserv/timing/gpioinput')
+      self.travel = TravelStats(sigma=self.config.get('travel_sigma', 3.0), alpha=self.config.get('travel_alpha', 0.05),
+        warmup=self.config.get('travel_warmup', 10))
+
+      if 'doors' in self.config:
+        self.doors = [Door(d['name'], dict(self.config, **d)) for d in self.config['doors']]
+      else:
+        self.doors = [Door(None, self.config)]
     except KeyError as e:
       logger = logging.getLogger(__name__)
       err = "Key error in Controller Init: {}".format(e)
@@ -52,18 +166,14 @@ class ControllerModule(BaseModule):
       self.mqtt_client.publish('gserv/error', err)
       sys.exit(2)
 
-    self.open_state = "XX"
-    self.close_state = "XX"
-
-    self.door_close_timer = None
-    self.command_response_timer = None
-    self.on_hold = False
-    self.error_state = False
-
-    self.states = enum.Enum('DoorStates', 'CLOSED OPENED CLOSING OPENING UNKNOWN')
-    self.current_state = self.states.UNKNOWN
+    # input name to the (door, handler) pairs it's an input of
+    self.routes = {}
+    for door in self.doors:
+      self.routes.setdefault(door.close_input, []).append((door, self._process_hall_sensors))
+      self.routes.setdefault(door.open_input, []).append((door, self._process_hall_sensors))
+      self.routes.setdefault(door.hold_input, []).append((door, self._process_hold))
 
-    self.force_close = False
+    self.states = DoorStates
 
     self.led_mapping = {
       "CLOSED": "GREEN_CLOCKWISE",
@@ -75,15 +185,41 @@ class ControllerModule(BaseModule):
       "ERROR": "RED_CLOCKWISE"
     }
 
-    self.texter = Texter(self.mqtt_client)
-    self.PIR = PIR(self.config, self.mqtt_client)
+    try:
+      self.machine = DoorStateMachine(self)
+    except ValueError as e:
+      logger = logging.getLogger(__name__)
+      err = "Door state machine error in Controller Init: {}".format(e)
+      logger.error(err)
+      self.mqtt_client.publish('gserv/error', err)
+      sys.exit(2)
+
+    # The doors are still looked after without a journal, so a broken one is reported and left out
+    self.journal = None
+    if self.config.get('journal_dir'):
+      try:
+        self.journal = DoorJournal(self.config['journal_dir'], self.config.get('journal_segment_records', 65536),
+          self.config.get('journal_max_segments'))
+      except (OSError, ValueError) as e:
+        logger = logging.getLogger(__name__)
+        err = "Door journal error in Controller Init: {}".format(e)
+        logger.error(err)
+        self.mqtt_client.publish('gserv/error', err)
+
+    self.scheduler = scheduler or get_scheduler()
+    self.texter = texter or Texter(self.mqtt_client, scheduler=self.scheduler, tracer=self.tracer)
+    self.PIR = PIR(self.config, self.mqtt_client, scheduler=self.scheduler, tracer=self.tracer)
 
     self.initial_close_time = 570.0
     self.alarm_close_time = 30.0
     self.door_move_timer = 10.0
 
+    self.clock = clock
+    self._restore()
+
     self.ready = True
     self._get_door_state()
+    self.scheduler.call_later(self.stats_interval, self._publish_stats)
 
   '''
   MQTT Message Handler
@@ -97,6 +233,12 @@ class ControllerModule(BaseModule):
         self.texter.receive_picture(msg)
     elif message.topic == self.light_level_topic:
       self.PIR.light_level(msg)
+    elif message.topic == self.journal_query_topic:
+      self._answer_query(msg)
+    elif message.topic == self.command_ack_topic:
+      self._command_timing(msg, None)
+    elif message.topic.startswith(self.input_timing_topic + '/'):
+      self._command_timing(msg, message.topic.split('/')[-1])
     elif message.topic.startswith(self.input_topic):
       input_list = message.topic.split('/')
       input = input_list[len(input_list) - 1]
@@ -108,173 +250,444 @@ class ControllerModule(BaseModule):
   the door position
   '''
   def _get_door_state(self):
-    self.mqtt_client.publish(self.input_topic + '/' + self.close_input, '?')
-    self.mqtt_client.publish(self.input_topic + '/' + self.open_input, '?')
+    for door in self.doors:
+      self.mqtt_client.publish(self.input_topic + '/' + door.close_input, '?')
+      self.mqtt_client.publish(self.input_topic + '/' + door.open_input, '?')
 
   '''
   _process_inputs handles the input messages from the MQTT handler.
   '''
   def _process_inputs(self, input, state):
-    if input == self.hold_input:
-      if state == "LOW":
-        self._process_hold()
-    elif input == self.pir_input:
+    if input == self.pir_input:
       self.PIR.motion_detected(state)
-    elif input == self.close_input or input == self.open_input:
-      self._process_hall_sensors(input, state)
+      return
+    for door, handler in self.routes.get(input, ()):
+      handler(door, input, state)
+
+  def _process_hold(self, door, input, state):
+    if state == "LOW":
+      self._dispatch(door, DoorEvents.HOLD)
 
   '''
-  _process_hall_sensors evaluates state changes to the door sensors and set the led
-  ring display to the appropriate pattern. If the door is opened, the auto close timer is
-  started. If closed, the timer is canceled. If the state change is was the result of a
-  auto close timer, the appropriate text message is sent: OPENED after a force close means
-  a problem occurred.
+  _process_hall_sensors records the new state of a door sensor and hands the state machine
+  the event the pair of them make (see DoorStateMachine for what each event does in each
+  state)
   '''
-  def _process_hall_sensors(self, input, state):
-    if self.command_response_timer is not None:
+  def _process_hall_sensors(self, door, input, state):
+    # A query for the input module, this controller's own included, not a reading
+    if state == '?':
+      return
+
+    with self.machine.lock:
+      if door.restoring is not None and input in door.restoring:
+        expected = door.restoring.pop(input)
+        if not door.restoring:
+          door.restoring = None
+        if state == expected:
+          return
+
+      if door.command is not None:
+        door.command['changed'] = self.clock()
+        self._travel(door, 'command', door.command['changed'] - door.command['sent'])
+        self._command_done(door, 'moved')
+
+      if input == door.close_input:
+        door.close_state = state
+      elif input == door.open_input:
+        door.open_state = state
+
+      self._dispatch(door, hall_event(door.close_state, door.open_state, input == door.close_input))
+
+  def _dispatch(self, door, event):
+    with self.machine.lock:
+      state = door.state
+      self.machine.dispatch(door, event)
+      if door.state != state:
+        self._journal(door, JournalKinds.TRANSITION, event, state)
+        self._time_travel(door, state)
+      self._save()
+
+  '''
+  _time_travel times the door from when it starts to move to when it gets to the other end
+  '''
+  def _time_travel(self, door, state):
+    now = self.scheduler.clock()
+    if door.travel_start is not None:
+      if state == DoorStates.OPENING and door.state == DoorStates.OPENED:
+        self._travel(door, 'open', now - door.travel_start)
+      elif state == DoorStates.CLOSING and door.state == DoorStates.CLOSED:
+        self._travel(door, 'close', now - door.travel_start)
+    door.travel_start = now if door.state in (DoorStates.OPENING, DoorStates.CLOSING) else None
+
+  def _travel(self, door, measure, seconds):
+    out_of_line = self.travel.add(measure if door.name is None else door.name + '/' + measure, seconds)
+    if out_of_line is not None:
+      deviation, usual = out_of_line
+      warning = self._about(door, "Garage Door {} took {:.1f} s, {:+.1f} sd from the usual {:.1f} s".format(
+        {'open': 'opening', 'close': 'closing', 'command': 'response to close'}[measure], seconds, deviation, usual))
       logger = logging.getLogger(__name__)
-      logger.debug("Command Delay Timer canceled")
-      self.command_response_timer.cancel()
-      self.command_response_timer = None
-
-    if input == self.close_input:
-      self.close_state = state
-    elif input == self.open_input:
-      self.open_state = state
-
-    if self.close_state == "LOW" and self.open_state == "HIGH":
-      self.current_state = self.states.CLOSED
-      self._stop_timer()
-      if self.force_close:
-        self.texter.send_text("Garage Door Closed Successfully", True)
-        self.force_close = False
-    elif self.close_state == "HIGH" and self.open_state == "LOW":
-      self.current_state = self.states.OPENED
-      if self.force_close:
-        self.error_state = True
-        self.force_close = False
-        logger = logging.getLogger(__name__)
-        logger.error("Force Close Failed")
-        self.texter.send_text("Garage Door Closing FAILED", True)
-      else:
-        self._start_timer()
-    elif self.close_state == "HIGH" and self.open_state == "HIGH":
-      self._stop_timer()
-      if input == self.close_input:
-        self.current_state = self.states.OPENING
-      else:
-        self.current_state = self.states.CLOSING
-    else:
-      self._stop_timer()
-      self.current_state = self.states.UNKNOWN
+      logger.warning(warning)
+      self.mqtt_client.publish(self.travel_warning_topic, warning)
 
-    logger = logging.getLogger('door_state')
-    logger.info(self.current_state.name)
+  def _journal(self, door, kind, event=None, from_state=None):
+    if self.journal is None:
+      return
+    try:
+      self.journal.append(self.clock(), kind, door.name, event, from_state or door.state, door.state)
+    except OSError as e:
+      logger = logging.getLogger(__name__)
+      logger.error("Cannot write to the door journal: {}".format(e))
 
-    self._set_ring_leds(self.current_state.name)
+  '''
+  _command_timing adds the times in an ack from the output module (input None) or a sensor's
+  timing from the input module to the close command they're for
+  '''
+  def _command_timing(self, msg, input):
+    try:
+      timing = json.loads(msg)
+      with self.machine.lock:
+        if input is None:
+          for door in self.doors:
+            if door.command is not None and door.command['id'] == timing['id']:
+              door.command.update(received=float(timing['received']), written=float(timing['written']),
+                acked=self.clock())
+        else:
+          for door, handler in self.routes.get(input, ()):
+            # Only the first sensor edge after the pin was written
+            if (handler == self._process_hall_sensors and door.command is not None and 'edge' not in door.command and
+                float(timing['edge']) >= door.command.get('written', door.command['sent'])):
+              door.command.update(edge=float(timing['edge']), published=float(timing['published']))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+      logger = logging.getLogger(__name__)
+      logger.warning("Bad command timing {}: {}".format(msg, e))
+
+  def _command_done(self, door, outcome):
+    command = door.command
+    door.command = None
+
+    def hop(start, end):
+      if start in command and end in command:
+        return round((command[end] - command[start]) * 1000, 1)
+      return None
+
+    self.mqtt_client.publish(self.stats_topic + '/latency', json.dumps({
+      'id': command['id'],
+      'door': door.name,
+      'outcome': outcome,
+      'hops_ms': {
+        'to_output': hop('sent', 'received'),
+        'pin_write': hop('received', 'written'),
+        'movement': hop('written', 'edge'),
+        'debounce': hop('edge', 'published'),
+        'to_controller': hop('published', 'changed'),
+        'total': hop('sent', 'changed'),
+        'ack': hop('written', 'acked')
+      }
+    }))
+
+  '''
+  _answer_query answers a question about the journal, sent on journal_query_topic
+  '''
+  '''
+  _entry_count checks a journal query's last or limit, and caps it at max_journal_entries
+  '''
+  def _entry_count(self, request, key):
+    count = request.get(key)
+    if count is None:
+      return None
+    if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+      raise ValueError("{} must be a whole number, not {!r}".format(key, count))
+    return min(count, max_journal_entries)
+
+  def _answer_query(self, msg):
+    start = time.perf_counter()
+    reply = {'id': None}
+    try:
+      request = json.loads(msg)
+      reply['id'] = request.get('id')
+      if self.journal is None:
+        raise ValueError("There is no door journal")
+      kinds = [JournalKinds[k] for k in request['kinds']] if 'kinds' in request else None
+      states = [DoorStates[s] for s in request['states']] if 'states' in request else None
+      limit = self._entry_count(request, 'limit')
+      entries = self.journal.query(since=request.get('since'), until=request.get('until'), kinds=kinds,
+        doors=request.get('doors'), states=states, last=self._entry_count(request, 'last'),
+        limit=max_journal_entries if limit is None else limit)
+      reply['entries'] = [e.as_dict() for e in entries]
+      reply['elapsed_us'] = round((time.perf_counter() - start) * 1000000, 1)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+      logger = logging.getLogger(__name__)
+      logger.warning("Bad door journal query {}: {}".format(msg, e))
+      reply['error'] = "{}: {}".format(type(e).__name__, e)
+    self.mqtt_client.publish(self.journal_response_topic, json.dumps(reply))
+
+  @property
+  def current_state(self):
+    return self.doors[0].state
 
   '''
-  _stop_timer cancels the timer thread, if it exists
+  _about puts the door's name on a text or log message, when there's more than one door
+  '''
+  def _about(self, door, message):
+    if door.name is None or len(self.doors) == 1:
+      return message
+    return "{}: {}".format(door.name, message)
+
   '''
-  def _stop_timer(self):
+  The guards and actions named in door_rules. They run with the state machine lock held, after
+  the machine has moved the door to its new state
+  '''
+  def force_closing(self, door):
+    return door.force_close
+
+  def held(self, door):
+    return door.on_hold
+
+  def cancel_move_timer(self, door):
+    if door.command_response_timer is not None:
+      logger = logging.getLogger(__name__)
+      logger.debug(self._about(door, "Command Delay Timer canceled"))
+      door.command_response_timer.cancel()
+      door.command_response_timer = None
+
+  '''
+  confirm_force_close and fail_force_close send the text for how the auto close turned out:
+  OPENED after a force close means a problem occurred.
+  '''
+  def confirm_force_close(self, door):
+    self.texter.send_text(self._about(door, "Garage Door Closed Successfully"), True)
+    door.force_close = False
+
+  def fail_force_close(self, door):
+    door.error_state = True
+    door.force_close = False
+    self._journal(door, JournalKinds.CLOSE_FAILED)
     logger = logging.getLogger(__name__)
-    logger.debug("Stopping Door Timer")
-    self._piezo("OFF")
-    self.on_hold = False
-    self.mqtt_client.publish(self.hold_led, "LOW")
-    if self.door_close_timer is not None:
-      logger.debug("Stopping timer {}".format(self.door_close_timer.getName()))
-      self.door_close_timer.cancel()
-    self.door_close_timer = None
+    logger.error(self._about(door, "Force Close Failed"))
+    self.texter.send_text(self._about(door, "Garage Door Closing FAILED"), True)
+    self._piezo(door, "ERROR")
+
+  def show_state(self, door):
+    logger = logging.getLogger('door_state')
+    logger.info(self._about(door, door.state.name))
+    self._set_ring_leds(door, door.state.name)
+
+  '''
+  stop_timer cancels the auto close timer, if it exists
+  '''
+  def stop_timer(self, door):
+    logger = logging.getLogger(__name__)
+    logger.debug(self._about(door, "Stopping Door Timer"))
+    self._piezo(door, "OFF")
+    door.on_hold = False
+    self.mqtt_client.publish(door.hold_led, "LOW")
+    if door.door_close_timer is not None:
+      logger.debug("Stopping timer {}".format(door.door_close_timer.name))
+      door.door_close_timer.cancel()
+    door.door_close_timer = None
 
   '''
-  _start_timer starts the 9 minute 30 second timer, during which the auto close waits
+  start_timer starts the 9 minute 30 second timer, during which the auto close waits
   in silence. The final 30 second wait has the piezo alarm sounding
   '''
-  def _start_timer(self):
-    if not self.on_hold and self.door_close_timer is None:
-      self.door_close_timer = threading.Timer(self.initial_close_time, self._nine_thirty_timer)
-      self.door_close_timer.start()
+  def start_timer(self, door):
+    if not door.on_hold and door.door_close_timer is None:
+      door.door_close_timer = self.scheduler.call_later(self.initial_close_time, self._dispatch, door,
+        DoorEvents.ALARM_TIMER)
       logger = logging.getLogger(__name__)
-      logger.debug("Starting Door Timer {}".format(self.door_close_timer.getName()))
+      logger.debug(self._about(door, "Starting Door Timer {}".format(door.door_close_timer.name)))
 
   '''
-  _process_hold toggle the state of the hold input. If turned ON, the auto close timer
-  is canceled, if running, the led ring display shows the HOLD pattern, and the HOLD Led
-  is turned on. If turned OFF, the timer is started is the door is opened, the ring LED
-  display is set to the display pattern appropriate for the current door state, and the
-  hold led is turned off. Toggling Hold also clears the error state
+  The hold input toggles hold. Turned ON, the auto close timer is canceled, if running, the
+  led ring display shows the HOLD pattern, and the HOLD Led is turned on. Turned OFF, the
+  timer is started if the door is opened, the ring LED display is set to the display pattern
+  appropriate for the current door state, and the hold led is turned off. Toggling Hold also
+  clears the error state
   '''
-  def _process_hold(self):
-    self.error_state = False
+  def clear_error(self, door):
+    door.error_state = False
+
+  def hold_on(self, door):
+    door.on_hold = True
+    self._set_ring_leds(door, "HOLD")
+    self.mqtt_client.publish(door.hold_led, "HIGH")
+    self._journal(door, JournalKinds.HOLD_ON)
     logger = logging.getLogger('door_state')
-    if self.on_hold is False:
-      self._stop_timer()
-      self.on_hold = True
-      self._set_ring_leds("HOLD")
-      self.mqtt_client.publish(self.hold_led, "HIGH")
-      logger.info("HOLD ON")
-    else:
-      self.on_hold = False
-      if self.current_state == self.states.OPENED:
-        self._start_timer()
-      self._set_ring_leds(self.current_state.name)
-      self.mqtt_client.publish(self.hold_led, "LOW")
-      logger.info("HOLD OFF")
+    logger.info(self._about(door, "HOLD ON"))
+
+  def release_hold(self, door):
+    door.on_hold = False
+
+  def show_hold_off(self, door):
+    self._set_ring_leds(door, door.state.name)
+    self.mqtt_client.publish(door.hold_led, "LOW")
+    self._journal(door, JournalKinds.HOLD_OFF)
+    logger = logging.getLogger('door_state')
+    logger.info(self._about(door, "HOLD OFF"))
 
   '''
-  _nine_thirty_timer is executed after 9 minutes 30 seconds of waiting for the auto close
+  sound_alarm is run after 9 minutes 30 seconds of waiting for the auto close
   timer. The piezo alarm is sounded for the last 30 seconds.
   '''
-  def _nine_thirty_timer(self):
+  def sound_alarm(self, door):
     logger = logging.getLogger(__name__)
-    logger.debug("9:30 Timer Expired")
-    self._piezo("ON")
-    self.door_close_timer = threading.Timer(self.alarm_close_time, self._final_close_timer)
-    self.door_close_timer.start()
+    logger.debug(self._about(door, "9:30 Timer Expired"))
+    self._piezo(door, "ON")
+    door.door_close_timer = self.scheduler.call_later(self.alarm_close_time, self._dispatch, door,
+      DoorEvents.CLOSE_TIMER)
 
   '''
-  _final_close_timer is run at the expiration of the auto close timer. It sends the command
+  close_door is run at the expiration of the auto close timer. It sends the command
   to close the door, turns off the piezo alarm and sets the force_close flag. Launches
   a timer which generates an error state if the door doesn't start moving within 10 seconds
   of the command to close the door
   '''
-  def _final_close_timer(self):
+  def close_door(self, door):
     logger = logging.getLogger(__name__)
-    logger.debug("Final Timer expired")
-    self.countdown_timer = None
-    self.mqtt_client.publish(self.door_control_topic, "HIGH")
-    self._piezo("OFF")
-    self.force_close = True
-    self.command_response_timer = threading.Timer(self.door_move_timer,
-      self._door_move_failed)
-    self.command_response_timer.start()
+    logger.debug(self._about(door, "Final Timer expired"))
+    sent = self.clock()
+    door.command = {'id': "{}-{}".format(door.name or 'door', int(sent * 1000)), 'sent': sent}
+    self.mqtt_client.publish(door.door_control_topic + '/id', json.dumps(door.command))
+    self.mqtt_client.publish(door.door_control_topic, "HIGH")
+    self._piezo(door, "OFF")
+    door.force_close = True
+    self._journal(door, JournalKinds.FORCED_CLOSE)
+    door.command_response_timer = self.scheduler.call_later(self.door_move_timer, self._dispatch, door,
+      DoorEvents.MOVE_TIMEOUT)
 
   '''
-  _door_move_failed is called if the door was told to close, but did not
+  move_failed is called if the door was told to close, but did not
   respond within 10 seconds
   '''
-  def _door_move_failed(self):
+  def move_failed(self, door):
     logger = logging.getLogger(__name__)
-    logger.error("Garage Door did not respond to close")
-    self.texter.send_text("Garage Door did not respond to close command", True)
-    self.force_close = False
-    self.error_state = True
-    self._set_ring_leds("ERROR")
+    logger.error(self._about(door, "Garage Door did not respond to close"))
+    self.texter.send_text(self._about(door, "Garage Door did not respond to close command"), True)
+    door.force_close = False
+    door.error_state = True
+    if door.command is not None:
+      self._command_done(door, 'no movement')
+    self._journal(door, JournalKinds.MOVE_FAILED)
+    self._set_ring_leds(door, "ERROR")
+    self._piezo(door, "ERROR")
+
+  '''
+  _save writes the snapshot, if there is a snapshot_file. Timers are saved as (event, wall clock
+  deadline), leaving out ones that have already fired
+  '''
+  def _save(self):
+    if self.snapshot_file is None:
+      return
+
+    now = self.clock()
+    doors = {}
+    for door in self.doors:
+      timers = []
+      for handle in (door.door_close_timer, door.command_response_timer):
+        if handle is not None and handle.queued and not handle.cancelled:
+          timers.append((handle.args[1].name, now + handle.remaining()))
+      doors[door.name or 'door'] = {
+        'state': door.state.name,
+        'close_state': door.close_state,
+        'open_state': door.open_state,
+        'on_hold': door.on_hold,
+        'error_state': door.error_state,
+        'force_close': door.force_close,
+        'timers': timers
+      }
+
+    try:
+      save_snapshot(self.snapshot_file, {'saved': now, 'doors': doors})
+    except OSError as e:
+      logger = logging.getLogger(__name__)
+      logger.error("Cannot save controller snapshot: {}".format(e))
+
+  '''
+  _restore picks the doors up from the snapshot, if there's a recent enough one. An open door
+  has its countdown shown from how long ago its close timer started, not from the beginning
+  '''
+  def _restore(self):
+    if self.snapshot_file is None:
+      return
+    logger = logging.getLogger(__name__)
+    snapshot = load_snapshot(self.snapshot_file)
+    if snapshot is None:
+      return
+
+    now = self.clock()
+    try:
+      if now - snapshot['saved'] > self.snapshot_max_age:
+        logger.info("Controller snapshot is too old to restore")
+        return
+      restored = []
+      for door in self.doors:
+        saved = snapshot['doors'].get(door.name or 'door')
+        if saved is not None:
+          timers = [(DoorEvents[event], deadline) for event, deadline in saved['timers']]
+          restored.append((door, DoorStates[saved['state']], saved, timers))
+    except (KeyError, TypeError, ValueError) as e:
+      logger.warning("Ignoring controller snapshot: {}".format(e))
+      return
+
+    for door, state, saved, timers in restored:
+      door.state = state
+      for key in ('close_state', 'open_state', 'on_hold', 'error_state', 'force_close'):
+        setattr(door, key, saved[key])
+      door.restoring = {door.close_input: door.close_state, door.open_input: door.open_state}
+
+      countdown = None
+      for event, deadline in timers:
+        handle = self.scheduler.call_later(max(0.0, deadline - now), self._dispatch, door, event)
+        if event == DoorEvents.MOVE_TIMEOUT:
+          door.command_response_timer = handle
+        else:
+          door.door_close_timer = handle
+          countdown = now - (deadline - self.initial_close_time)
+          if event == DoorEvents.CLOSE_TIMER:
+            countdown += self.alarm_close_time
+            self._piezo(door, "ON")
+
+      if door.on_hold:
+        self._set_ring_leds(door, "HOLD")
+        self.mqtt_client.publish(door.hold_led, "HIGH")
+      elif countdown is not None and door.state == DoorStates.OPENED and not door.error_state:
+        self.mqtt_client.publish(door.led_topic, "{}@{:.1f}".format(self.led_mapping["OPENED"], max(0.0, countdown)))
+      else:
+        self._set_ring_leds(door, door.state.name)
+      logger = logging.getLogger('door_state')
+      logger.info(self._about(door, "RESTORED " + door.state.name))
+
+  def _publish_stats(self):
+    self.mqtt_client.publish(self.stats_topic, json.dumps(self.machine.handler_stats()))
+    self.mqtt_client.publish(self.stats_topic + '/travel', json.dumps(self.travel.summary()))
+    # Keeps the snapshot's saved time current while nothing is happening
+    with self.machine.lock:
+      self._save()
+    self.scheduler.call_later(self.stats_interval, self._publish_stats)
+
   '''
   _set_ring_leds sets the ring leds to the appropriate pattern
   '''
-  def _set_ring_leds(self, state):
-    if self.error_state is True:
-      self.mqtt_client.publish(self.led_topic, self.led_mapping["ERROR"])
+  def _set_ring_leds(self, door, state):
+    if door.error_state is True:
+      self.mqtt_client.publish(door.led_topic, self.led_mapping["ERROR"])
     else:
-      self.mqtt_client.publish(self.led_topic, self.led_mapping[state])
+      self.mqtt_client.publish(door.led_topic, self.led_mapping[state])
 
-  def _piezo(self, state):
+  '''
+  _piezo turns the piezo OFF or ON, where ON plays piezo_alarm_sequence if there is one, and
+  sounds ERROR if piezo_error_sequence is set
+  '''
+  def _piezo(self, door, state):
     if state == "OFF":
-      self.mqtt_client.publish(self.piezo_topic, "LOW")
+      self.mqtt_client.publish(door.piezo_topic, "LOW")
+    elif state == "ERROR":
+      if self.piezo_error_sequence is not None:
+        self.mqtt_client.publish(door.piezo_topic, self.piezo_error_sequence)
+    elif self.piezo_alarm_sequence is not None:
+      self.mqtt_client.publish(door.piezo_topic, self.piezo_alarm_sequence)
     else:
-      self.mqtt_client.publish(self.piezo_topic, "HIGH")
+      self.mqtt_client.publish(door.piezo_topic, "HIGH")
 
   '''
   Test helper to speed up tests by shorting up the close timers
@@ -0,0 +1,211 @@
+'''
+Controller Simulation for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.BaseModule import merge_yaml
+from gserv.ControllerModule import ControllerModule
+from gserv.Scheduler import VirtualScheduler
+from gserv.Texter import Texter
+from paho.mqtt.client import topic_matches_sub
+from collections import deque
+import argparse
+import logging
+import sys
+import time
+import yaml
+
+'''
+The real ControllerModule, PIR and Texter, run on a VirtualScheduler with no broker and no SMTP.
+Everything the controller publishes is kept with the virtual time it was published, texts are
+kept instead of mailed, and what it publishes to a topic it subscribes to comes back to it, the
+way it does through the broker. The door timers run as fast as their callbacks, so the whole
+ten minute auto close takes a few milliseconds, and always plays out the same way.
+
+Scenarios are a yaml list, each a name, optional timer settings and a list of steps:
+
+  - name: auto close
+    times: {initial: 570, alarm: 30, door_move: 10, camera_delay: 120}   # optional
+    steps:
+      - input: [[gserv/gpioinput/close_hall, LOW], [gserv/gpioinput/open_hall, HIGH]]
+      - expect: [[gserv/leds, GREEN_CLOCKWISE]]
+      - wait: 570
+      - absent: [[gserv/gpiooutput/door, HIGH]]
+      - text: Garage Door Closed Successfully
+
+input hands the controller messages, in order, the way the input module would. wait moves the
+clock on. expect and absent check what the controller published since the last check: every
+message in expect must be there, none of absent. text checks a text went out since the last
+text check.
+
+  python -m gserv.ControllerSimulation config/controller_scenarios.yaml --repeat 100
+'''
+
+
+class SimMessage():
+  def __init__(self, topic, payload):
+    self.topic = topic
+    self.payload = payload if isinstance(payload, bytes) else str(payload).encode('utf-8')
+
+
+class SimClient():
+  def __init__(self, scheduler, subscription):
+    self.scheduler = scheduler
+    self.subscription = subscription
+    self.published = []
+    self.inbox = deque()
+
+  def publish(self, topic, payload=None, qos=0, retain=False):
+    self.published.append((self.scheduler.now, topic, payload))
+    if topic_matches_sub(self.subscription, topic):
+      self.inbox.append((topic, payload))
+
+
+class ControllerSimulation():
+  def __init__(self, config, texter_config, start=0.0):
+    self.scheduler = VirtualScheduler(start=start)
+    self.client = SimClient(self.scheduler, config.get('sub_topic', '#'))
+    self.texts = []
+    texter = Texter(self.client, scheduler=self.scheduler, config=texter_config, mailer=self._mailer)
+    self.controller = ControllerModule(config, None, mqtt_client=self.client, scheduler=self.scheduler,
+      texter=texter, clock=self.scheduler.clock)
+    self.deliver()
+
+  def _mailer(self, message_text, picture_path):
+    self.texts.append((self.scheduler.now, message_text, picture_path))
+
+  def deliver(self):
+    while self.client.inbox:
+      topic, payload = self.client.inbox.popleft()
+      self.controller.receive(self.client, None, SimMessage(topic, payload))
+
+  '''
+  input hands the controller a message from another module
+  '''
+  def input(self, topic, payload):
+    self.client.inbox.append((topic, payload))
+    self.deliver()
+
+  '''
+  advance moves the clock on by seconds, delivering what each timer publishes before the next
+  one runs
+  '''
+  def advance(self, seconds):
+    target = self.scheduler.now + seconds
+    while True:
+      deadline = self.scheduler.next_deadline()
+      if deadline is None or deadline > target:
+        break
+      self.scheduler.run_until(deadline)
+      self.deliver()
+    self.scheduler.run_until(target)
+
+
+def load_configs(config_file='config/controller.yaml', texter_file='config/texter.yaml',
+    secure_file='config/secure.yaml.sample'):
+  config = merge_yaml(config_file, secure_file)
+  texter_config = merge_yaml(texter_file, secure_file)
+  for c in (config, texter_config):
+    if 'Error' in c:
+      raise ValueError(c['Error'])
+  # The simulation logs wherever the caller has logging going, not to loggly, and doesn't touch
+  # the Pi's snapshot, journal or traces
+  config.pop('logging', None)
+  for key in ('snapshot_file', 'journal_dir', 'trace_dir'):
+    config.pop(key, None)
+  return config, texter_config
+
+
+def pairs(step, key):
+  return [(str(topic), str(payload)) for topic, payload in step[key]]
+
+
+'''
+run_scenario plays one scenario on a new ControllerSimulation. Returns the list of what didn't
+turn out as expected, empty if the scenario passed
+'''
+
+
+def run_scenario(scenario, config, texter_config):
+  sim = ControllerSimulation(config, texter_config)
+  times = scenario.get('times')
+  if times is not None:
+    sim.controller.set_alarm_times(times.get('initial', 570.0), times.get('alarm', 30.0),
+      times.get('door_move', 10.0), times.get('camera_delay', sim.controller.texter.camera_delay))
+
+  failures = []
+  published = 0
+  texted = 0
+  for idx, step in enumerate(scenario['steps']):
+    if 'input' in step:
+      for topic, payload in pairs(step, 'input'):
+        sim.input(topic, payload)
+    if 'wait' in step:
+      sim.advance(step['wait'])
+
+    since = [(topic, str(payload)) for t, topic, payload in sim.client.published[published:]]
+    if 'expect' in step or 'absent' in step:
+      published = len(sim.client.published)
+    for msg in pairs(step, 'expect') if 'expect' in step else []:
+      if msg not in since:
+        failures.append("step {} at {:.1f}s: {} not in {}".format(idx, sim.scheduler.now, msg, since))
+    for msg in pairs(step, 'absent') if 'absent' in step else []:
+      if msg in since:
+        failures.append("step {} at {:.1f}s: {} was published".format(idx, sim.scheduler.now, msg))
+
+    if 'text' in step:
+      sent = [text for t, text, picture in sim.texts[texted:]]
+      texted = len(sim.texts)
+      if step['text'] not in sent:
+        failures.append("step {} at {:.1f}s: text {} not in {}".format(idx, sim.scheduler.now, step['text'], sent))
+
+  return failures
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Run door scenarios against a simulated ControllerModule')
+  parser.add_argument('scenarios', nargs='?', default='config/controller_scenarios.yaml')
+  parser.add_argument('--repeat', type=int, default=1)
+  parser.add_argument('--verbose', action='store_true', help='show the controller logging')
+  args = parser.parse_args()
+
+  if args.verbose:
+    logging.basicConfig(level=logging.DEBUG)
+  else:
+    logging.disable(logging.CRITICAL)
+
+  with open(args.scenarios, 'r') as f:
+    scenarios = yaml.safe_load(f)
+  config, texter_config = load_configs()
+
+  failed = 0
+  start = time.perf_counter()
+  for r in range(args.repeat):
+    for scenario in scenarios:
+      failures = run_scenario(scenario, config, texter_config)
+      if r == 0:
+        print("{:<40} {}".format(scenario['name'], 'FAIL' if failures else 'ok'))
+        for failure in failures:
+          print("  " + failure)
+      failed += 1 if failures else 0
+  elapsed = time.perf_counter() - start
+
+  runs = args.repeat * len(scenarios)
+  print("{} scenarios, {} failed, {:.3f} s, {:.0f} scenarios/s".format(runs, failed, elapsed, runs / elapsed))
+  sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+  main()
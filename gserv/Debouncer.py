@@ -0,0 +1,144 @@
+'''
+Input debounce for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import threading
+import time
+import logging
+
+'''
+Debounce for one input. The first edge of a burst samples the pin and arms the debounce
+thread; every later edge only moves the deadline out. The thread sleeps on a Condition
+until debounce_time has passed since the last edge, then samples the pin again, and the
+state is published if it matches the one sampled on the first edge. Nothing runs between
+bursts.
+
+Every edge that doesn't turn into a publish is counted as suppressed, and the time from the
+last edge of a burst to its publish is kept, for the input's metrics.
+'''
+
+
+class Debouncer():
+  def __init__(self, debounce_time, read_pin, publish, clock=time.monotonic, record=None):
+    self.debounce_time = debounce_time
+    self.read_pin = read_pin
+    self.publish = publish
+    self.record = record
+    self.clock = clock
+
+    self.pin_state = 0
+    self.armed = False
+    self.last_edge = 0.0
+    self.burst_edges = 0
+    self._condition = threading.Condition(threading.RLock())
+
+    self.edges = 0
+    self.suppressed = 0
+    self.published = 0
+    self.latency_total = 0.0
+    self.latency_max = 0.0
+    self.latency_last = 0.0
+
+  def start(self):
+    t = threading.Thread(name='Debouncer', target=self._run)
+    t.daemon = True
+    t.start()
+
+  '''
+  edge is the interrupt callback. level is what the edge went to, when the caller knows it;
+  otherwise the pin is read, which is only right if the edge is handled as it happens
+  '''
+  def edge(self, level=None):
+    with self._condition:
+      self.last_edge = self.clock()
+      self.edges += 1
+      self.burst_edges += 1
+      if not self.armed:
+        self.armed = True
+        self.pin_state = self.read_pin() if level is None else level
+        self._condition.notify()
+
+  '''
+  settle waits out one burst of edges and returns the state read on its first edge, the
+  edge count, and when the burst's last edge came in
+  '''
+  def settle(self):
+    with self._condition:
+      while not self.armed:
+        self._condition.wait()
+
+      while True:
+        remaining = self.deadline() - self.clock()
+        if remaining <= 0:
+          break
+        self._condition.wait(remaining)
+
+      return self.take()
+
+  '''
+  deadline is when the current burst settles, or None when there isn't one. The
+  GPIOInputEngine uses it, with take, to run the debounce of every input from its own loop
+  '''
+  def deadline(self):
+    if not self.armed:
+      return None
+    return self.last_edge + self.debounce_time
+
+  def take(self):
+    with self._condition:
+      self.armed = False
+      burst = (self.pin_state, self.burst_edges, self.last_edge)
+      self.burst_edges = 0
+      return burst
+
+  '''
+  finish publishes a settled burst. Whether or not it's published, the state the pin settled
+  in goes to record, along with the time of the burst's last edge
+  '''
+  def finish(self, pin_state, burst_edges, last_edge):
+    settled = self.read_pin()
+    if self.record is not None:
+      self.record(settled, last_edge)
+
+    if settled != pin_state:
+      self.suppressed += burst_edges
+      return
+
+    self.publish(pin_state)
+    latency = self.clock() - last_edge
+    self.suppressed += burst_edges - 1
+    self.published += 1
+    self.latency_last = latency
+    self.latency_total += latency
+    self.latency_max = max(self.latency_max, latency)
+
+  def stats(self):
+    return {
+      'edges': self.edges,
+      'suppressed': self.suppressed,
+      'published': self.published,
+      'latency_last_ms': round(self.latency_last * 1000, 3),
+      'latency_mean_ms': round(self.latency_total / self.published * 1000, 3) if self.published else 0.0,
+      'latency_max_ms': round(self.latency_max * 1000, 3)
+    }
+
+  def _run(self):
+    logger = logging.getLogger(__name__)
+    while True:
+      try:
+        self.finish(*self.settle())
+      except Exception:
+        logger.exception("Debounce failed")
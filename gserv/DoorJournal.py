@@ -0,0 +1,245 @@
+'''
+Door Journal for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.DoorStateMachine import DoorStates, DoorEvents
+import bisect
+import enum
+import mmap
+import os
+import struct
+import threading
+
+'''
+The history of the doors, kept in an append only journal of fixed size records:
+
+  time (float64, seconds since the epoch), kind (uint8), event (uint8, a DoorEvents value or 0),
+  from state (uint8), to state (uint8, both DoorStates values), door name (12 bytes, utf-8,
+  cut short if it's longer, empty for the only door)
+
+24 bytes each, little endian. The journal is a directory of segment files, 00000000.journal,
+00000001.journal and so on, each starting with MAGIC padded out to a record, and a segment is
+closed and the next one started after segment_records records. With max_segments set, the
+oldest segments past that many are deleted.
+
+Records are appended in time order (a wall clock that steps back is held at the last time
+written), so each segment, memory mapped, is its own time index: finding a time is a binary
+search of the segment's records, after a binary search of the segments by their first time. A
+query costs the two searches plus the records it returns, however long the journal has been
+kept. A record cut short by a crash is dropped when the journal is opened again.
+'''
+
+MAGIC = b'GSJRN1\n'
+RECORD = struct.Struct('<dBBBB12s')
+TIME = struct.Struct('<d')
+HEADER = MAGIC + bytes(RECORD.size - len(MAGIC))
+
+
+class JournalKinds(enum.Enum):
+  TRANSITION = 1
+  HOLD_ON = 2
+  HOLD_OFF = 3
+  FORCED_CLOSE = 4
+  CLOSE_FAILED = 5
+  MOVE_FAILED = 6
+
+
+class JournalEntry():
+  __slots__ = ('time', 'kind', 'event', 'from_state', 'to_state', 'door')
+
+  def __init__(self, time, kind, event, from_state, to_state, door):
+    self.time = time
+    self.kind = kind
+    self.event = event
+    self.from_state = from_state
+    self.to_state = to_state
+    self.door = door
+
+  def as_dict(self):
+    return {
+      'time': self.time,
+      'kind': self.kind.name,
+      'event': self.event.name if self.event is not None else None,
+      'from': self.from_state.name,
+      'to': self.to_state.name,
+      'door': self.door
+    }
+
+
+def _unpack(buf, offset):
+  t, kind, event, from_state, to_state, door = RECORD.unpack_from(buf, offset)
+  return JournalEntry(t, JournalKinds(kind), DoorEvents(event) if event else None, DoorStates(from_state),
+    DoorStates(to_state), door.rstrip(b'\0').decode('utf-8', 'replace') or None)
+
+
+class Segment():
+  def __init__(self, path):
+    self.path = path
+    self.map = None
+    self.mapped = 0
+    with open(path, 'r+b') as f:
+      head = f.read(RECORD.size)
+      if len(head) < RECORD.size and HEADER.startswith(head):
+        # Cut short while it was being started
+        f.seek(0)
+        f.write(HEADER)
+      elif head != HEADER:
+        raise ValueError("{} is not a door journal".format(path))
+      size = f.seek(0, os.SEEK_END)
+      self.count = size // RECORD.size - 1
+      if size != (self.count + 1) * RECORD.size:
+        f.truncate((self.count + 1) * RECORD.size)
+    self.first_time = self.time_at(0) if self.count else None
+
+  '''
+  view returns the segment's memory map, mapped again if records were added since it was last
+  mapped
+  '''
+  def view(self):
+    if self.mapped != self.count:
+      if self.map is not None:
+        self.map.close()
+      with open(self.path, 'rb') as f:
+        self.map = mmap.mmap(f.fileno(), (self.count + 1) * RECORD.size, access=mmap.ACCESS_READ)
+      self.mapped = self.count
+    return self.map
+
+  def time_at(self, index):
+    return TIME.unpack_from(self.view(), (index + 1) * RECORD.size)[0]
+
+  '''
+  bisect returns the index of the first record at or after t
+  '''
+  def bisect(self, t):
+    view = self.view()
+    lo = 0
+    hi = self.count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      at = TIME.unpack_from(view, (mid + 1) * RECORD.size)[0]
+      if at < t:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  def entry(self, index):
+    return _unpack(self.view(), (index + 1) * RECORD.size)
+
+  def close(self):
+    if self.map is not None:
+      self.map.close()
+      self.map = None
+      self.mapped = 0
+
+
+class DoorJournal():
+  def __init__(self, directory, segment_records=65536, max_segments=None):
+    self.directory = directory
+    self.segment_records = segment_records
+    self.max_segments = max_segments
+    self._lock = threading.Lock()
+    os.makedirs(directory, exist_ok=True)
+
+    self.segments = [Segment(os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+      if name.endswith('.journal')]
+
+    if self.segments:
+      self.number = int(os.path.basename(self.segments[-1].path).split('.')[0])
+      self.file = open(self.segments[-1].path, 'ab', buffering=0)
+    else:
+      self.number = -1
+      self._start_segment()
+    active = self.segments[-1]
+    self.last_time = active.time_at(active.count - 1) if active.count else 0.0
+
+  def _start_segment(self):
+    self.number += 1
+    segment_path = os.path.join(self.directory, '{:08d}.journal'.format(self.number))
+    self.file = open(segment_path, 'wb', buffering=0)
+    self.file.write(HEADER)
+    self.segments.append(Segment(segment_path))
+
+    if self.max_segments is not None:
+      while len(self.segments) > self.max_segments:
+        oldest = self.segments.pop(0)
+        oldest.close()
+        os.unlink(oldest.path)
+
+  def append(self, t, kind, door=None, event=None, from_state=DoorStates.UNKNOWN, to_state=None):
+    if to_state is None:
+      to_state = from_state
+    name = (door or '').encode('utf-8')[:12]
+    with self._lock:
+      active = self.segments[-1]
+      if active.count >= self.segment_records:
+        self.file.close()
+        self._start_segment()
+        active = self.segments[-1]
+      t = max(t, self.last_time)
+      self.file.write(RECORD.pack(t, kind.value, event.value if event is not None else 0, from_state.value,
+        to_state.value, name))
+      active.count += 1
+      if active.first_time is None:
+        active.first_time = t
+      self.last_time = t
+
+  '''
+  query returns the entries from since up to and not including until, oldest first, keeping
+  only those of the given kinds, doors and to states where those are given. With last, it's the
+  last that many of them, otherwise the first limit
+  '''
+  def query(self, since=None, until=None, kinds=None, doors=None, states=None, last=None, limit=1000):
+    def wanted(entry):
+      return ((kinds is None or entry.kind in kinds) and (doors is None or entry.door in doors) and
+        (states is None or entry.to_state in states))
+
+    with self._lock:
+      segments = [s for s in self.segments if s.count]
+      # The segments the range starts and ends in, by their first times
+      first_times = [s.first_time for s in segments]
+      first = max(0, bisect.bisect_right(first_times, since) - 1) if since is not None else 0
+      end = bisect.bisect_left(first_times, until) if until is not None else len(segments)
+
+      ranges = []
+      for idx in range(first, end):
+        segment = segments[idx]
+        lo = segment.bisect(since) if since is not None and idx == first else 0
+        hi = segment.bisect(until) if until is not None and idx == end - 1 else segment.count
+        ranges.append((segment, lo, hi))
+
+      if last is not None:
+        indexes = ((segment, index) for segment, lo, hi in reversed(ranges) for index in range(hi - 1, lo - 1, -1))
+        limit = last
+      else:
+        indexes = ((segment, index) for segment, lo, hi in ranges for index in range(lo, hi))
+
+      entries = []
+      for segment, index in indexes:
+        if len(entries) >= limit:
+          break
+        entry = segment.entry(index)
+        if wanted(entry):
+          entries.append(entry)
+      if last is not None:
+        entries.reverse()
+      return entries
+
+  def close(self):
+    with self._lock:
+      self.file.close()
+      for segment in self.segments:
+        segment.close()
@@ -0,0 +1,197 @@
+'''
+Door State Machine for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import enum
+import threading
+import time
+
+'''
+The door controller as a table. Every event the controller reacts to (the hall sensors, the
+hold button and its own timers) is looked up by (current state, event), which gives the state
+to move to and the actions to run, in order. Where what happens depends on something other
+than the state (a forced close in progress, hold being on), the entry is a list of guarded
+transitions and the first one whose guard is true is taken.
+
+door_rules is the table as written: a rule applies to a tuple of states, or to ANY state that
+has no rule of its own for the same event. Guards and actions are the names of methods on
+the handler (the ControllerModule). The rules are compiled once, when the machine is built,
+into a dict holding the bound methods, and compiling checks that every (state, event) pair has
+a transition that is always taken, that no rule can never be reached, and that every guard and
+action exists, so a broken table stops the controller at startup rather than on the day the
+door is left open.
+
+One machine runs every door. The state is kept on the door, any object with a state
+attribute, and each guard and action is called with the door it's for.
+
+The time spent dispatching each (state, event) is kept in handler_stats().
+'''
+
+
+class DoorStates(enum.Enum):
+  CLOSED = 1
+  OPENED = 2
+  CLOSING = 3
+  OPENING = 4
+  UNKNOWN = 5
+
+
+class DoorEvents(enum.Enum):
+  SENSE_CLOSED = 1
+  SENSE_OPENED = 2
+  SENSE_OPENING = 3
+  SENSE_CLOSING = 4
+  SENSE_UNKNOWN = 5
+  HOLD = 6
+  ALARM_TIMER = 7
+  CLOSE_TIMER = 8
+  MOVE_TIMEOUT = 9
+
+
+ANY = None
+STAY = None
+
+S = DoorStates
+E = DoorEvents
+
+# Every hall sensor message cancels the wait for the door to respond to a close command
+door_rules = (
+  (ANY, E.SENSE_CLOSED, 'force_closing', S.CLOSED,
+    ('cancel_move_timer', 'stop_timer', 'confirm_force_close', 'show_state')),
+  (ANY, E.SENSE_CLOSED, None, S.CLOSED, ('cancel_move_timer', 'stop_timer', 'show_state')),
+  (ANY, E.SENSE_OPENED, 'force_closing', S.OPENED, ('cancel_move_timer', 'fail_force_close', 'show_state')),
+  (ANY, E.SENSE_OPENED, None, S.OPENED, ('cancel_move_timer', 'start_timer', 'show_state')),
+  (ANY, E.SENSE_OPENING, None, S.OPENING, ('cancel_move_timer', 'stop_timer', 'show_state')),
+  (ANY, E.SENSE_CLOSING, None, S.CLOSING, ('cancel_move_timer', 'stop_timer', 'show_state')),
+  (ANY, E.SENSE_UNKNOWN, None, S.UNKNOWN, ('cancel_move_timer', 'stop_timer', 'show_state')),
+
+  ((S.OPENED,), E.HOLD, 'held', STAY, ('clear_error', 'release_hold', 'start_timer', 'show_hold_off')),
+  ((S.OPENED,), E.HOLD, None, STAY, ('clear_error', 'stop_timer', 'hold_on')),
+  (ANY, E.HOLD, 'held', STAY, ('clear_error', 'release_hold', 'show_hold_off')),
+  (ANY, E.HOLD, None, STAY, ('clear_error', 'stop_timer', 'hold_on')),
+
+  # The close timers only run while the door is open; one that fires anywhere else lost a race
+  # with being cancelled
+  ((S.OPENED,), E.ALARM_TIMER, None, STAY, ('sound_alarm',)),
+  (ANY, E.ALARM_TIMER, None, STAY, ()),
+  ((S.OPENED,), E.CLOSE_TIMER, None, STAY, ('close_door',)),
+  (ANY, E.CLOSE_TIMER, None, STAY, ()),
+  (ANY, E.MOVE_TIMEOUT, None, STAY, ('move_failed',)),
+)
+
+
+class Transition():
+  __slots__ = ('guard', 'target', 'actions', 'guard_name', 'action_names')
+
+  def __init__(self, guard_name, guard, target, action_names, actions):
+    self.guard_name = guard_name
+    self.guard = guard
+    self.target = target
+    self.action_names = action_names
+    self.actions = actions
+
+
+def compile_rules(rules, handler):
+  table = {}
+  explicit = {(state, event) for states, event, guard, target, actions in rules if states is not ANY
+    for state in states}
+
+  for states, event, guard, target, actions in rules:
+    for name in ((guard,) if guard is not None else ()) + tuple(actions):
+      if not callable(getattr(handler, name, None)):
+        raise ValueError("Door rule for {} names {}, which the controller doesn't have".format(event.name, name))
+
+    for state in (DoorStates if states is ANY else states):
+      if states is ANY and (state, event) in explicit:
+        continue
+      entry = table.setdefault((state, event), [])
+      if entry and entry[-1].guard is None:
+        raise ValueError("Door rule for {} in {} can never be reached".format(event.name, state.name))
+      entry.append(Transition(guard, getattr(handler, guard) if guard is not None else None, target, tuple(actions),
+        tuple(getattr(handler, a) for a in actions)))
+
+  for state in DoorStates:
+    for event in DoorEvents:
+      entry = table.get((state, event))
+      if not entry:
+        raise ValueError("No door rule for {} in {}".format(event.name, state.name))
+      if entry[-1].guard is not None:
+        raise ValueError("Door rule for {} in {} isn't always taken".format(event.name, state.name))
+      table[(state, event)] = tuple(entry)
+
+  return table
+
+
+class DoorStateMachine():
+  def __init__(self, handler, rules=door_rules):
+    self.table = compile_rules(rules, handler)
+    # Reentrant, since the controller holds it around updating its sensor states and dispatching
+    self.lock = threading.RLock()
+    self.timing = {}
+
+  def transitions(self):
+    for (state, event), entry in self.table.items():
+      for t in entry:
+        yield state, event, t.guard_name, t.target if t.target is not None else state, t.action_names
+
+  def dispatch(self, door, event):
+    with self.lock:
+      start = time.perf_counter_ns()
+      state = door.state
+      for t in self.table[(state, event)]:
+        if t.guard is None or t.guard(door):
+          break
+
+      if t.target is not None:
+        door.state = t.target
+      for action in t.actions:
+        action(door)
+
+      elapsed = time.perf_counter_ns() - start
+      timing = self.timing.get((state, event))
+      if timing is None:
+        self.timing[(state, event)] = [1, elapsed, elapsed]
+      else:
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+      return t
+
+  def handler_stats(self):
+    with self.lock:
+      return {"{}/{}".format(state.name, event.name): {
+        'count': count,
+        'mean_us': round(total / count / 1000, 3),
+        'max_us': round(most / 1000, 3)
+      } for (state, event), (count, total, most) in self.timing.items()}
+
+
+'''
+hall_event turns the two hall sensor states into an event. With both sensors HIGH the door is
+between them, and which one changed last says which way it's going
+'''
+
+
+def hall_event(close_state, open_state, close_changed):
+  if close_state == "LOW" and open_state == "HIGH":
+    return DoorEvents.SENSE_CLOSED
+  elif close_state == "HIGH" and open_state == "LOW":
+    return DoorEvents.SENSE_OPENED
+  elif close_state == "HIGH" and open_state == "HIGH":
+    return DoorEvents.SENSE_OPENING if close_changed else DoorEvents.SENSE_CLOSING
+  else:
+    return DoorEvents.SENSE_UNKNOWN
@@ -0,0 +1,144 @@
+'''
+Edge recorder for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import json
+import math
+import threading
+
+'''
+Keeps every edge an input sees, before debounce, with its nanosecond timestamp, and the
+statistics of the pulses between them. Nothing is stored per edge beyond the current batch,
+so an input toggling hundreds of times a second costs a few additions per edge.
+
+A batch is published as one compact JSON record,
+
+  {"t0": 81234567890123, "us": [0, 1520, 38], "v": "101"}
+
+t0 is the timestamp in ns of the first edge, us the microseconds from each edge to the one
+after it (the first is always 0), and v the level each edge went to. JSON rather than a
+packed binary, since every consumer of the MQTT topics decodes payloads as utf-8.
+
+Pulse widths (how long the line stayed high or low) are kept as a running mean and variance
+(Welford), the edge rate as an exponentially decaying count with a time constant of
+rate_window seconds, and any pulse shorter than bounce_time is counted as a bounce.
+'''
+
+
+class PulseStats():
+  def __init__(self):
+    self.count = 0
+    self.mean = 0.0
+    self.m2 = 0.0
+    self.min = None
+    self.max = None
+
+  def add(self, width):
+    self.count += 1
+    delta = width - self.mean
+    self.mean += delta / self.count
+    self.m2 += delta * (width - self.mean)
+    self.min = width if self.min is None else min(self.min, width)
+    self.max = width if self.max is None else max(self.max, width)
+
+  def stats(self):
+    return {
+      'count': self.count,
+      'mean_ms': round(self.mean * 1000, 3),
+      'std_ms': round(math.sqrt(self.m2 / (self.count - 1)) * 1000, 3) if self.count > 1 else 0.0,
+      'min_ms': round(self.min * 1000, 3) if self.min is not None else None,
+      'max_ms': round(self.max * 1000, 3) if self.max is not None else None
+    }
+
+
+class EdgeRecorder():
+  def __init__(self, bounce_time, batch_size=500, rate_window=10.0):
+    self.bounce_time = bounce_time
+    self.batch_size = batch_size
+    self.rate_window = rate_window
+    self._lock = threading.Lock()
+
+    self.edges = 0
+    self.bounces = 0
+    self.high = PulseStats()
+    self.low = PulseStats()
+    self.rate_count = 0.0
+    self.last_ns = None
+    self.last_level = None
+
+    self.batch_t0 = None
+    self.batch_us = []
+    self.batch_levels = []
+
+  '''
+  record adds one edge. Returns True once the batch is full and should be flushed
+  '''
+  def record(self, timestamp_ns, level):
+    with self._lock:
+      self.edges += 1
+      if self.last_ns is not None:
+        dt = (timestamp_ns - self.last_ns) / 1e9
+        self.rate_count *= math.exp(-dt / self.rate_window)
+        # A repeated level means an edge was missed, so there is no pulse to measure
+        if level != self.last_level:
+          (self.high if self.last_level else self.low).add(dt)
+          if dt < self.bounce_time:
+            self.bounces += 1
+
+      self.rate_count += 1.0
+
+      if self.batch_t0 is None:
+        self.batch_t0 = timestamp_ns
+        self.batch_us.append(0)
+      else:
+        self.batch_us.append((timestamp_ns - self.last_ns) // 1000)
+      self.batch_levels.append('1' if level else '0')
+
+      self.last_ns = timestamp_ns
+      self.last_level = level
+      return len(self.batch_us) >= self.batch_size
+
+  '''
+  flush returns the batch as a JSON record and starts a new one, or None if there were no edges
+  '''
+  def flush(self):
+    with self._lock:
+      if self.batch_t0 is None:
+        return None
+
+      record = json.dumps({'t0': self.batch_t0, 'us': self.batch_us, 'v': ''.join(self.batch_levels)},
+        separators=(',', ':'))
+      self.batch_t0 = None
+      self.batch_us = []
+      self.batch_levels = []
+      return record
+
+  def rate(self, now_ns):
+    with self._lock:
+      if self.last_ns is None:
+        return 0.0
+      return self.rate_count * math.exp(-max(0, now_ns - self.last_ns) / 1e9 / self.rate_window) / self.rate_window
+
+  def stats(self, now_ns):
+    rate = self.rate(now_ns)
+    with self._lock:
+      return {
+        'raw_edges': self.edges,
+        'bounces': self.bounces,
+        'edge_rate': round(rate, 3),
+        'high': self.high.stats(),
+        'low': self.low.stats()
+      }
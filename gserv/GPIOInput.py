@@ -15,21 +15,33 @@ Copyright (C) 2018 Kevin Kessler
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
-import wiringpi
+from gserv.Debouncer import Debouncer
+from gserv.EdgeRecorder import EdgeRecorder
+from gserv.gpio_backends import LOW
+from gserv.gpio_backends.WiringPi import WiringPiBackend
 import threading
 import multiprocessing
+import json
 import time
 import logging
 
 """
 Had to spawn these off as processes, because wiringpi segfaults on the ISR when the MQTT thread is started,
 or time.sleep is run in the same process
+
+Debounce waits on a Condition (see Debouncer) rather than spinning, and every stats_interval
+seconds the debounce counters go up the pipe to be published on stats_topic. Every settled
+state is also written to the input's slot in state_table, which the parent reads directly.
+Every edge the ISR sees goes to an EdgeRecorder, and the batches of edges are sent up to be
+published on edges_topic every edges_interval seconds, or as soon as a batch fills up.
+The pin itself is read and watched through backend, wiringpi unless the module says otherwise
 """
 
 
 class GPIOInput(multiprocessing.Process):
 
-  def __init__(self, pin, edge_type, debounce_time, pull_resistor, topic, pipe):
+  def __init__(self, pin, edge_type, debounce_time, pull_resistor, topic, pipe, stats_topic=None, stats_interval=60,
+    state_table=None, edges_topic=None, edges_interval=10, backend=None):
     multiprocessing.Process.__init__(self)
     self.daemon = True
     self.pin = pin
@@ -38,52 +50,74 @@ class GPIOInput(multiprocessing.Process):
     self.pull_resistor = pull_resistor
     self.topic = topic
     self.pipe = pipe
-    self.timer = None
-    self.pin_state = 0
-    self.timer_target = 0
+    self.stats_topic = stats_topic
+    self.stats_interval = stats_interval
+    self.state_table = state_table
+    self.edges_topic = edges_topic
+    self.edges_interval = edges_interval
+    self.backend = backend if backend is not None else WiringPiBackend({})
+    self.debouncer = Debouncer(debounce_time, self._read_pin, self._publish_state, record=self._record_state)
+    self.recorder = EdgeRecorder(debounce_time)
+    # The ISR, debounce and query threads all send on the pipe
+    self._send_lock = threading.Lock()
 
   def run(self):
     logger = logging.getLogger(__name__)
     logger.debug("Setting up Button {} on pin {}".format(self.topic, self.pin))
 
-    wiringpi.wiringPiSetup()
-    wiringpi.pinMode(self.pin, wiringpi.GPIO.INPUT)
-    wiringpi.pullUpDnControl(self.pin, getattr(wiringpi.GPIO, self.pull_resistor))
-    wiringpi.wiringPiISR(self.pin, getattr(wiringpi.GPIO, self.edge_type), self._button_callback)
+    self.backend.begin()
+    self.backend.input(self.pin, self.pull_resistor)
+    self.debouncer.start()
+    self.backend.on_edge(self.pin, self.edge_type, self._button_callback)
 
     # Force sending state info on MQTT Topic on startup
-    self.pipe.send([self.topic, self._readString(wiringpi.digitalRead(self.pin))])
+    state = self.backend.read(self.pin)
+    self._record_state(state, time.monotonic())
+    self._send([self.topic, self._readString(state)])
 
     t = threading.Thread(target=self._queue_thread)
     t.setDaemon(True)
     t.start()
 
+    seconds = 0
     while True:
-      wiringpi.delay(1000)
+      self.backend.delay(1000)
+      seconds += 1
+      if seconds % self.edges_interval == 0:
+        self._flush_edges()
+      if self.stats_topic is not None and seconds % self.stats_interval == 0:
+        stats = self.debouncer.stats()
+        stats.update(self.recorder.stats(time.monotonic_ns()))
+        self._send([self.stats_topic, json.dumps(stats)])
 
-  def _timer_thread(self):
-    while True:
-      if self.timer_target < time.time():
-        break
+  def _button_callback(self):
+    level = self.backend.read(self.pin)
+    if self.recorder.record(time.monotonic_ns(), level):
+      self._flush_edges()
+    self.debouncer.edge(level)
 
-    self._timer_callback()
+  def _flush_edges(self):
+    record = self.recorder.flush()
+    if record is not None and self.edges_topic is not None:
+      self._send([self.edges_topic, record])
 
-  def _button_callback(self):
-    self.timer_target = time.time() + self.debounce_time
-    if self.timer is None:
-      self.pin_state = wiringpi.digitalRead(self.pin)
-      self.timer = threading.Thread(target=self._timer_thread)
-      self.timer.start()
-
-  def _timer_callback(self):
-    pin_value = wiringpi.digitalRead(self.pin)
-    self.timer = None
-    if self.pin_state == pin_value:
-      self.pipe.send([self.topic, self._readString(self.pin_state)])
+  def _send(self, msg):
+    with self._send_lock:
+      self.pipe.send(msg)
+
+  def _read_pin(self):
+    return self.backend.read(self.pin)
+
+  def _record_state(self, state, edge_time):
+    if self.state_table is not None:
+      self.state_table.update(self.topic, state, int(edge_time * 1e9))
+
+  def _publish_state(self, state):
+    self._send([self.topic, self._readString(state)])
 
   def _readString(self, state):
       mes = "HIGH"
-      if state == wiringpi.GPIO.LOW:
+      if state == LOW:
         mes = "LOW"
 
       return mes
@@ -92,4 +126,4 @@ class GPIOInput(multiprocessing.Process):
     while True:
       msg = self.pipe.recv()
       if isinstance(msg, str) and msg == '?':
-        self.pipe.send([self.topic, self._readString(wiringpi.digitalRead(self.pin))])
+        self._send([self.topic, self._readString(self.backend.read(self.pin))])
@@ -0,0 +1,187 @@
+'''
+GPIO Input Engine for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.Debouncer import Debouncer
+from gserv.EdgeRecorder import EdgeRecorder
+import json
+import os
+import select
+import threading
+import time
+import logging
+
+'''
+Watches every input from one thread. Each input is a line (see GPIOLines) whose file descriptor
+is registered with one epoll; the loop sleeps in epoll until an edge arrives or the next
+debounce deadline is due, so the whole set of inputs costs one thread and no extra processes.
+Debounce is the same Debouncer the per process GPIOInput uses, driven by the loop rather than
+by a thread of its own.
+
+Messages go out through send as [topic, payload], the same lists the GPIOInput processes put
+on their pipes, and settled states go into state_table the same way too. Every edge goes to
+the input's EdgeRecorder, and the batches are sent on the input's edges_topic every
+edges_interval seconds.
+
+The kernel's edge timestamps are CLOCK_REALTIME on kernels before 5.7 and CLOCK_MONOTONIC
+after, so they're moved onto the monotonic clock as they're read: the newest edge of a read is
+stamped with time.monotonic_ns() and the others keep their spacing from it.
+'''
+
+
+class EngineInput():
+  def __init__(self, topic, line, debounce_time, stats_topic, edges_topic, send, clock, state_table,
+      both_edges=True):
+    self.topic = topic
+    self.line = line
+    self.stats_topic = stats_topic
+    self.edges_topic = edges_topic
+    self.send = send
+    self.state_table = state_table
+    # The level of the last edge read. On a line that sees both edges, debounce only settles
+    # once every queued edge has been read, so at that point it is the pin's level, without
+    # another ioctl to read it. A line that sees only rising or only falling edges never hears
+    # the pin go back, so its pin is read when debounce settles
+    self.level = line.value()
+    read_pin = (lambda: self.level) if both_edges else line.value
+    self.debouncer = Debouncer(debounce_time, read_pin, self.publish, clock, self.record)
+    self.recorder = EdgeRecorder(debounce_time)
+
+  def record(self, state, edge_time):
+    if self.state_table is not None:
+      self.state_table.update(self.topic, state, int(edge_time * 1e9))
+
+  def publish(self, state):
+    self.send([self.topic, read_string(state)])
+
+  def flush_edges(self):
+    record = self.recorder.flush()
+    if record is not None and self.edges_topic is not None:
+      self.send([self.edges_topic, record])
+
+
+def read_string(state):
+  return "LOW" if state == 0 else "HIGH"
+
+
+class GPIOInputEngine():
+  def __init__(self, send, stats_interval=60, clock=time.monotonic, state_table=None, edges_interval=10):
+    self.send = send
+    self.stats_interval = stats_interval
+    self.edges_interval = edges_interval
+    self.clock = clock
+    self.state_table = state_table
+    self.inputs = {}
+    self.topics = {}
+    self.epoll = select.epoll()
+    self._wake_read, self._wake_write = os.pipe()
+    self.epoll.register(self._wake_read, select.EPOLLIN)
+    self._running = False
+    self._thread = None
+
+  def add_input(self, topic, line, debounce_time, stats_topic=None, edges_topic=None, both_edges=True):
+    engine_input = EngineInput(topic, line, debounce_time, stats_topic, edges_topic, self.send, self.clock,
+      self.state_table, both_edges)
+    self.inputs[line.fileno()] = engine_input
+    self.topics[topic] = engine_input
+    self.epoll.register(line.fileno(), select.EPOLLIN)
+
+  '''
+  start publishes the state of every input, the same as each GPIOInput process does when it
+  starts, then starts watching them
+  '''
+  def start(self):
+    for topic in self.topics:
+      self.query(topic)
+
+    self._running = True
+    self._thread = threading.Thread(name='GPIOInputEngine', target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    self._running = False
+    os.write(self._wake_write, b'\0')
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+
+  def query(self, topic):
+    if topic in self.topics:
+      engine_input = self.topics[topic]
+      state = engine_input.line.value()
+      engine_input.level = state
+      engine_input.record(state, self.clock())
+      engine_input.publish(state)
+
+  def _publish_stats(self):
+    for engine_input in self.inputs.values():
+      if engine_input.stats_topic is not None:
+        stats = engine_input.debouncer.stats()
+        stats.update(engine_input.recorder.stats(time.monotonic_ns()))
+        self.send([engine_input.stats_topic, json.dumps(stats)])
+
+  def _next_deadline(self, stats_deadline, edges_deadline):
+    deadline = min(stats_deadline, edges_deadline)
+    for engine_input in self.inputs.values():
+      d = engine_input.debouncer.deadline()
+      if d is not None and d < deadline:
+        deadline = d
+
+    return deadline
+
+  def _run(self):
+    logger = logging.getLogger(__name__)
+    stats_deadline = self.clock() + self.stats_interval
+    edges_deadline = self.clock() + self.edges_interval
+    while self._running:
+      timeout = max(0.0, self._next_deadline(stats_deadline, edges_deadline) - self.clock())
+      for fd, event in self.epoll.poll(timeout):
+        if fd == self._wake_read:
+          os.read(self._wake_read, 64)
+          continue
+
+        engine_input = self.inputs[fd]
+        events = engine_input.line.read_events()
+        read_ns = time.monotonic_ns()
+        for timestamp, rising in events:
+          timestamp = read_ns - max(0, events[-1][0] - timestamp)
+          engine_input.level = 1 if rising else 0
+          if engine_input.recorder.record(timestamp, engine_input.level):
+            engine_input.flush_edges()
+          # Events can sit queued for a while, so the pin may have moved on since
+          engine_input.debouncer.edge(engine_input.level)
+
+      now = self.clock()
+      for engine_input in self.inputs.values():
+        deadline = engine_input.debouncer.deadline()
+        if deadline is not None and deadline <= now:
+          try:
+            engine_input.debouncer.finish(*engine_input.debouncer.take())
+          except Exception:
+            logger.exception("Debounce failed on {}".format(engine_input.topic))
+
+      if now >= edges_deadline:
+        edges_deadline = now + self.edges_interval
+        for engine_input in self.inputs.values():
+          engine_input.flush_edges()
+
+      if now >= stats_deadline:
+        stats_deadline = now + self.stats_interval
+        try:
+          self._publish_stats()
+        except Exception:
+          logger.exception("Publishing input stats failed")
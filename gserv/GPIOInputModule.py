@@ -16,11 +16,31 @@ Copyright (C) 2018 Kevin Kessler
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 from gserv.BaseModule import BaseModule
-from gserv.GPIOInput import GPIOInput
+from gserv.PinStateTable import PinStateTable, UNKNOWN
+from gserv.gpio_backends import gpio_backend, PULL_RESISTORS, EDGE_TYPES
 from multiprocessing import Pipe
-import wiringpi
 import threading
+import json
+import sys
 import logging
+import time
+
+'''
+input_engine in gpioinput.yaml picks how the inputs are watched. process (the default) forks a
+GPIOInput process per input, with its wiringpi ISR, and reads its pipe from a thread here.
+epoll watches every input from one GPIOInputEngine thread in this process, through the
+gpiochip character device, so it doesn't need wiringpi at all. Both publish the same topics.
+gpio_backend: simulator swaps the pins for the GPIO simulator, with either engine
+
+Either way, the settled state of every input is kept in a shared PinStateTable, so a '?' on an
+input topic is answered from here without a round trip to the input. An input that only
+watches one edge (INT_EDGE_RISING or INT_EDGE_FALLING, like the pir) only updates the table on
+that edge, so a '?' for it is always answered with a live read of the pin. A '?' on
+snapshot_topic publishes all of them at once, retained, as JSON
+
+Just before an input's new state is published, timing_topic/<input> gets the time of its last
+edge and of the publish, as wall clock seconds, for timing commands (see ControllerModule)
+'''
 
 
 class GPIOInputModule(BaseModule):
@@ -30,45 +50,122 @@ class GPIOInputModule(BaseModule):
 
     logger = logging.getLogger(__name__)
     if "inputs" not in self.config:
-      logger.error("No inputs Configuration in {}".config_file)
+      logger.error("No inputs Configuration in {}".format(config_file))
       self.config['inputs'] = []
 
     self.input_pipes = {}
-    (self.recvQueue, q) = Pipe()
+    self.engine = None
+    self.snapshot_topic = self.config.get('snapshot_topic', 'gserv/gpioinput/snapshot')
+    self.timing_topic = self.config.get('timing_topic', 'gserv/timing/gpioinput')
+    self.state_table = PinStateTable([b['topic'] for b in self.config['inputs']])
+    self.live_topics = set(b['topic'] for b in self.config['inputs'] if b.get('edge_type') != 'INT_EDGE_BOTH')
+
+    try:
+      self.backend = gpio_backend(self.config)
+    except KeyError as e:
+      err = "Key error in GPIOInputModule Init: {}".format(e)
+      logger.error(err)
+      self.mqtt_client.publish('gserv/error', err)
+      sys.exit(2)
+
+    if self.config.get('input_engine', 'process') == 'epoll':
+      self._start_engine()
+    else:
+      self._start_processes()
+
+  def _stats_topic(self, topic):
+    return "{}/{}".format(self.config.get('stats_topic', 'gserv/metrics/gpioinput'), topic.split('/')[-1])
+
+  def _edges_topic(self, topic):
+    return "{}/{}".format(self.config.get('edges_topic', 'gserv/edges/gpioinput'), topic.split('/')[-1])
+
+  def _start_processes(self):
+    from gserv.GPIOInput import GPIOInput
 
+    logger = logging.getLogger(__name__)
     for b in self.config["inputs"]:
-      try:
-        getattr(wiringpi.GPIO, b["pupdown"])
-      except AttributeError:
+      if b["pupdown"] not in PULL_RESISTORS:
         logger.error("Input On topic {}, pupdown value {} is invalid".format(b["topic"], b["pupdown"]))
         continue
 
-      try:
-        getattr(wiringpi.GPIO, b["edge_type"])
-      except AttributeError:
-        logger.error("Input On topic {}, pupdown value {} is invalid".format(b["topic"], b["edge_type"]))
+      if b["edge_type"] not in EDGE_TYPES:
+        logger.error("Input On topic {}, edge_type value {} is invalid".format(b["topic"], b["edge_type"]))
         continue
 
       (parent_pipe, child_pipe) = Pipe()
       self.input_pipes[b['topic']] = parent_pipe
-      bobj = GPIOInput(b["pin"], b["edge_type"], b["debounce"] / 1000.0, b["pupdown"], b["topic"], child_pipe)
+      bobj = GPIOInput(b["pin"], b["edge_type"], b["debounce"] / 1000.0, b["pupdown"], b["topic"], child_pipe,
+        self._stats_topic(b['topic']), self.config.get('stats_interval', 60), self.state_table,
+        self._edges_topic(b['topic']), self.config.get('edges_interval', 10), self.backend)
       bobj.start()
 
       t = threading.Thread(name="queueReader" + b["topic"], target=self._pipeThread, args=(b["topic"],))
       t.setDaemon(True)
       t.start()
 
+  def _start_engine(self):
+    from gserv.GPIOInputEngine import GPIOInputEngine
+
+    logger = logging.getLogger(__name__)
+    self.engine = GPIOInputEngine(self._publish, self.config.get('stats_interval', 60), state_table=self.state_table,
+      edges_interval=self.config.get('edges_interval', 10))
+    for b in self.config["inputs"]:
+      try:
+        line = self.backend.line(b)
+      except KeyError as e:
+        logger.error("Input On topic {}, value {} is invalid".format(b["topic"], e))
+        continue
+      except OSError as e:
+        logger.error("Input On topic {}, cannot request line: {}".format(b["topic"], e))
+        continue
+
+      self.engine.add_input(b['topic'], line, b["debounce"] / 1000.0, self._stats_topic(b['topic']),
+        self._edges_topic(b['topic']), b['edge_type'] == 'INT_EDGE_BOTH')
+
+    self.engine.start()
+    self.backend.begin_lines()
+
+  def _publish(self, msg):
+    if self.timing_topic is not None and msg[0] in self.state_table.slots:
+      self._publish_timing(msg[0], msg[1])
+    self.mqtt_client.publish(msg[0], msg[1], qos=1)
+
+  def _publish_timing(self, topic, state):
+    edge_ns = self.state_table.read(topic)[1]
+    if edge_ns <= 0:
+      return
+    # The edge was timed on the monotonic clock
+    now = time.time()
+    edge = now - (time.monotonic_ns() - edge_ns) / 1e9
+    self.mqtt_client.publish("{}/{}".format(self.timing_topic, topic.split('/')[-1]),
+      json.dumps({'state': state, 'edge': round(edge, 6), 'published': now}), qos=1)
+
   def on_message(self, client, userdata, message):
     msg = message.payload.decode('utf-8')
-    if msg == '?':
-      if message.topic in self.input_pipes:
-        self.input_pipes[message.topic].send('?')
+    if msg != '?':
+      return
+
+    if message.topic == self.snapshot_topic:
+      self.mqtt_client.publish(self.snapshot_topic, json.dumps(self.state_table.snapshot()), qos=1, retain=True)
+      return
+
+    state = UNKNOWN
+    if message.topic in self.state_table.slots and message.topic not in self.live_topics:
+      state = self.state_table.read(message.topic)[0]
+
+    if state != UNKNOWN:
+      self._publish([message.topic, "LOW" if state == 0 else "HIGH"])
+    elif self.engine is not None:
+      self.engine.query(message.topic)
+    elif message.topic in self.input_pipes:
+      # The input hasn't reported yet, or the table can't be trusted for it, so ask it
+      self.input_pipes[message.topic].send('?')
 
   def _pipeThread(self, topic):
     while True:
       msg = self.input_pipes[topic].recv()
       if isinstance(msg, list) and len(msg) == 2:
-        self.mqtt_client.publish(msg[0], msg[1], qos=1)
+        self._publish(msg)
 
 
 def main():
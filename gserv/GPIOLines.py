@@ -0,0 +1,164 @@
+'''
+GPIO lines for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import fcntl
+import os
+import struct
+import time
+
+'''
+Input lines for the GPIOInputEngine. A line is anything with a file descriptor that becomes
+readable when an edge arrives, read_events() to drain the edges queued on it, and value() to
+read the pin.
+
+ChipLine requests an edge event line from the kernel's gpiochip character device (the v1
+uAPI, so it works on the kernels the Pis ship with), no wiringpi involved. PipeLine is the
+same thing on top of an os.pipe, so the engine can be driven without any GPIO hardware.
+'''
+
+GPIO_GET_LINEEVENT_IOCTL = 0xC030B404
+GPIOHANDLE_GET_LINE_VALUES_IOCTL = 0xC040B408
+
+GPIOHANDLE_REQUEST_INPUT = 0x01
+GPIOHANDLE_REQUEST_BIAS_PULL_UP = 0x20
+GPIOHANDLE_REQUEST_BIAS_PULL_DOWN = 0x40
+
+GPIOEVENT_REQUEST_RISING_EDGE = 0x01
+GPIOEVENT_REQUEST_FALLING_EDGE = 0x02
+GPIOEVENT_REQUEST_BOTH_EDGES = 0x03
+
+GPIOEVENT_EVENT_RISING_EDGE = 0x01
+GPIOEVENT_EVENT_FALLING_EDGE = 0x02
+
+# struct gpioevent_request: lineoffset, handleflags, eventflags, consumer_label[32], fd
+EVENT_REQUEST = struct.Struct('<III32si')
+# struct gpioevent_data: timestamp in ns, id, padded to 8 bytes
+EVENT_DATA = struct.Struct('<QI4x')
+
+# Names used in gpioinput.yaml, the same ones wiringpi uses. PUD_OFF leaves the bias alone
+edge_flags = {
+  'INT_EDGE_RISING': GPIOEVENT_REQUEST_RISING_EDGE,
+  'INT_EDGE_FALLING': GPIOEVENT_REQUEST_FALLING_EDGE,
+  'INT_EDGE_BOTH': GPIOEVENT_REQUEST_BOTH_EDGES
+}
+
+bias_flags = {
+  'PUD_OFF': 0,
+  'PUD_UP': GPIOHANDLE_REQUEST_BIAS_PULL_UP,
+  'PUD_DOWN': GPIOHANDLE_REQUEST_BIAS_PULL_DOWN
+}
+
+# Wiring Pi pin number to Broadcom GPIO (the gpiochip0 line) on a Raspberry Pi with the 40 pin header
+WPI_TO_BCM = {
+  0: 17, 1: 18, 2: 27, 3: 22, 4: 23, 5: 24, 6: 25, 7: 4, 8: 2, 9: 3, 10: 8, 11: 7, 12: 10, 13: 9, 14: 11, 15: 14,
+  16: 15, 21: 5, 22: 6, 23: 13, 24: 19, 25: 26, 26: 12, 27: 16, 28: 20, 29: 21, 30: 0, 31: 1
+}
+
+
+class ChipLine():
+  def __init__(self, chip_path, offset, edge_type, pull_resistor, consumer='gserv'):
+    self.chip_path = chip_path
+    self.offset = offset
+
+    request = bytearray(EVENT_REQUEST.pack(offset, GPIOHANDLE_REQUEST_INPUT | bias_flags[pull_resistor],
+      edge_flags[edge_type], consumer.encode('ascii')[:31], 0))
+
+    chip_fd = os.open(chip_path, os.O_RDONLY)
+    try:
+      fcntl.ioctl(chip_fd, GPIO_GET_LINEEVENT_IOCTL, request)
+    finally:
+      os.close(chip_fd)
+
+    self.fd = EVENT_REQUEST.unpack(request)[4]
+    os.set_blocking(self.fd, False)
+
+  def fileno(self):
+    return self.fd
+
+  '''
+  read_events returns the queued edges as (timestamp ns, rising) pairs
+  '''
+  def read_events(self):
+    try:
+      data = os.read(self.fd, EVENT_DATA.size * 16)
+    except BlockingIOError:
+      return []
+
+    return [(ts, event_id == GPIOEVENT_EVENT_RISING_EDGE) for ts, event_id in EVENT_DATA.iter_unpack(data)]
+
+  def value(self):
+    data = bytearray(64)
+    fcntl.ioctl(self.fd, GPIOHANDLE_GET_LINE_VALUES_IOCTL, data)
+    return data[0]
+
+  def close(self):
+    os.close(self.fd)
+
+
+class PipeLine():
+  def __init__(self, initial=0, edges=(0, 1)):
+    self.fd, self.write_fd = os.pipe()
+    os.set_blocking(self.fd, False)
+    self.level = initial
+    self.edges = edges
+
+  def fileno(self):
+    return self.fd
+
+  '''
+  set drives the line, queueing an edge if the level changes to one of edges, the way a line
+  requested for only rising or only falling edges does
+  '''
+  def set(self, level):
+    if level == self.level:
+      return
+    self.level = level
+    if level not in self.edges:
+      return
+    os.write(self.write_fd, EVENT_DATA.pack(time.monotonic_ns(),
+      GPIOEVENT_EVENT_RISING_EDGE if level else GPIOEVENT_EVENT_FALLING_EDGE))
+
+  def read_events(self):
+    try:
+      data = os.read(self.fd, EVENT_DATA.size * 16)
+    except BlockingIOError:
+      return []
+
+    return [(ts, event_id == GPIOEVENT_EVENT_RISING_EDGE) for ts, event_id in EVENT_DATA.iter_unpack(data)]
+
+  def value(self):
+    return self.level
+
+  def close(self):
+    os.close(self.fd)
+    os.close(self.write_fd)
+
+
+'''
+chip_line opens the ChipLine for one entry of the inputs list in gpioinput.yaml. gpiochip and
+line can be given for boards where the Wiring Pi numbering doesn't map onto gpiochip0
+'''
+
+
+def chip_line(input_config):
+  if 'line' in input_config:
+    offset = input_config['line']
+  else:
+    offset = WPI_TO_BCM[input_config['pin']]
+
+  return ChipLine(input_config.get('gpiochip', '/dev/gpiochip0'), offset, input_config['edge_type'],
+    input_config['pupdown'])
@@ -16,75 +16,120 @@ Copyright (C) 2018 Kevin Kessler
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 from gserv.BaseModule import BaseModule
+from gserv.OutputBank import OutputBank
+from gserv.Scheduler import get_scheduler
+from gserv.gpio_backends import gpio_backend, LOW
 import logging
-import wiringpi
-import threading
+import json
 import sys
+import time
+
+'''
+Drives the outputs in gpiooutput.yaml from HIGH/LOW messages on their topics. The outputs and
+their pulses are kept in an OutputBank. A JSON object on batch_topic, like
+
+  {"door": "HIGH", "hold_led": "LOW"}
+
+sets several outputs in one message, by topic or by the last part of the topic. A sequence
+output (the piezo) also takes the name of one of its sequences. Write, skip and pulse counters
+are published on stats_topic every stats_interval seconds
+
+A command can be given an id by a JSON {"id": ..., "sent": ...} on the output's topic/id just
+before it. Once the command is written, ack_topic gets the id, with when the command was
+received and written, for timing the command's hops (see ControllerModule). A command that
+writes nothing isn't acked. That includes a second pulse asked for while one is still running
+on the output, which is dropped unless the output has pulse_overlap: merge (see OutputBank)
+'''
 
 
 class GPIOOutputModule(BaseModule):
 
-  def __init__(self, config_file, secure_file):
-    BaseModule.__init__(self, config_file, secure_file)
+  '''
+  mqtt_client, scheduler, backend and clock (the wall clock acks are timed by) are for running
+  the module off the Pi (see Replay)
+  '''
+  def __init__(self, config_file, secure_file, mqtt_client=None, scheduler=None, backend=None, clock=time.time):
+    BaseModule.__init__(self, config_file, secure_file, mqtt_client=mqtt_client)
 
-    wiringpi.wiringPiSetup()
+    self.scheduler = scheduler or get_scheduler()
 
     logger = logging.getLogger(__name__)
+    try:
+      self.backend = backend or gpio_backend(self.config)
+    except KeyError as e:
+      err = "Key error in GPIOOutputModule Init: {}".format(e)
+      logger.error(err)
+      self.mqtt_client.publish('gserv/error', err)
+      sys.exit(2)
+    self.backend.begin()
+
     if "outputs" not in self.config:
-      logger.error("No outputs Configuration in {}".config_file)
+      logger.error("No outputs Configuration in {}".format(config_file))
       self.config['outputs'] = []
 
-    self.outputs = {}
+    self.batch_topic = self.config.get('batch_topic', 'gserv/gpiooutput/batch')
+    self.stats_topic = self.config.get('stats_topic', 'gserv/metrics/gpiooutput')
+    self.stats_interval = self.config.get('stats_interval', 60)
+    self.ack_topic = self.config.get('ack_topic', 'gserv/timing/gpiooutput')
+    self.clock = clock
+    # output topic to the id of the command on its way to it
+    self.command_ids = {}
+
+    self.outputs = OutputBank(self.backend, self.scheduler, clock=self.scheduler.clock)
     for o in self.config['outputs']:
       try:
-        topic = o['topic']
-        logger.debug("Setting up output on {}".format(topic))
-        self.outputs[topic] = {}
-        self.outputs[topic]['type'] = o['type']
-        self.outputs[topic]['initial_state'] = o['initial_state']
-        self.outputs[topic]['pin'] = o['pin']
-        if o['type'] == 'momentary':
-          self.outputs[topic]['active_time'] = o['active_time']
-      except KeyError as e:
-        err = "Key error in GPIOOutputModule Init: {}".format(e)
+        logger.debug("Setting up output on {}".format(o['topic']))
+        self.outputs.add(o)
+      except (KeyError, ValueError) as e:
+        err = "Error in GPIOOutputModule Init: {}".format(e)
         logger.error(err)
         self.mqtt_client.publish('gserv/error', err)
         sys.exit(2)
 
-      wiringpi.pinMode(o['pin'], wiringpi.GPIO.OUTPUT)
-      wiringpi.digitalWrite(o['pin'], self._gpio_value(o['initial_state']))
-
     # Set the output enable pin to low, to let the signals flow thought the 74386 buffer
     if 'locks' in self.config:
       for l in self.config['locks']:
         if 'pin' in l:
           logger.debug('Bringing lock pin {} LOW'.format(l['pin']))
-          wiringpi.pinMode(l['pin'], wiringpi.GPIO.OUTPUT)
-          wiringpi.digitalWrite(l['pin'], wiringpi.LOW)
+          self.backend.output(l['pin'], LOW)
+
+    self.scheduler.call_later(self.stats_interval, self._publish_stats)
 
   def on_message(self, client, userdata, message):
+    received = self.clock()
     logger = logging.getLogger(__name__)
     msg = message.payload.decode('utf-8')
-    if msg != 'HIGH' and msg != 'LOW':
+    if message.topic == self.batch_topic:
+      try:
+        err = self.outputs.set_many(json.loads(msg))
+      except ValueError:
+        err = "Batch is not valid JSON"
+      if err is not None:
+        logger.error(err)
+        self.mqtt_client.publish('gserv/error', err)
       return
-    if message.topic in self.outputs:
-      output = self.outputs[message.topic]
-      logger.debug("Message {} received on {}".format(msg, message.topic))
-      if output['type'] == 'toggle':
-        wiringpi.digitalWrite(output['pin'], self._gpio_value(msg))
-      else:
-        if msg != output['initial_state']:
-          wiringpi.digitalWrite(output['pin'], self._gpio_value(msg))
-          threading.Timer(output['active_time'], self._reset_output, args=[output]).start()
-
-  def _reset_output(self, output):
-    wiringpi.digitalWrite(output['pin'], self._gpio_value(output['initial_state']))
-
-  def _gpio_value(self, string):
-    if string == "HIGH":
-      return wiringpi.HIGH
-    else:
-      return wiringpi.LOW
+
+    if message.topic.endswith('/id'):
+      try:
+        self.command_ids[message.topic[:-3]] = json.loads(msg)['id']
+      except (ValueError, KeyError, TypeError) as e:
+        logger.warning("Bad command id {}: {}".format(msg, e))
+      return
+
+    logger.debug("Message {} received on {}".format(msg, message.topic))
+    # The id goes with this message whether or not it changes anything, so it can't be acked
+    # for a later one
+    command_id = self.command_ids.pop(message.topic, None)
+    if self.outputs.set(message.topic, msg):
+      if command_id is not None:
+        self.mqtt_client.publish(self.ack_topic, json.dumps({'id': command_id, 'topic': message.topic,
+          'received': received, 'written': self.clock()}))
+    elif command_id is not None:
+      logger.debug("Command {} on {} changed nothing, not acked".format(command_id, message.topic))
+
+  def _publish_stats(self):
+    self.mqtt_client.publish(self.stats_topic, json.dumps(self.outputs.stats()))
+    self.scheduler.call_later(self.stats_interval, self._publish_stats)
 
 
 def main():
@@ -17,9 +17,9 @@ Copyright (C) 2018 Kevin Kessler
 '''
 from gserv.BaseModule import BaseModule
 from gserv.Texter import Texter
+from gserv.Scheduler import get_scheduler
 import time
 import logging
-import threading
 
 
 '''
@@ -32,12 +32,10 @@ class HeartbeatModule(BaseModule):
 
   def __init__(self, config_file, secure_file):
     BaseModule.__init__(self, config_file, secure_file)
-    self.Texter = Texter()
+    self.scheduler = get_scheduler()
+    self.Texter = Texter(scheduler=self.scheduler)
     # Wait to send text until OPI is completely up
-    threading.Timer(60, self._send_text).start()
-
-  def _send_text(self):
-    self.Texter.send_text("Heartbeat Module Started")
+    self.scheduler.call_later(60, self.Texter.send_text, "Heartbeat Module Started")
 
   def run(self):
     logger = logging.getLogger(__name__)
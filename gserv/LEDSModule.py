@@ -16,28 +16,41 @@ Copyright (C) 2018 Kevin Kessler
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 from gserv.BaseModule import BaseModule
-from gserv.led_patterns.Spin import SpinPattern
-from gserv.led_patterns.Solid import SolidPattern
-from gserv.led_patterns.Countdown import CountdownPattern
-from rpi_ws281x import Adafruit_NeoPixel
+from gserv.LedRenderer import LedRenderer
+from gserv.Scheduler import get_scheduler
+from gserv.led_patterns.PatternLibrary import load_patterns
+from gserv.led_backends.WS281x import WS281xBackend
+from gserv.led_backends.SPI import SPIBackend
+from gserv.led_backends.Recording import RecordingBackend
 import logging
+import json
 import sys
 
 '''
-Module to control 8 WS2812B LEDs. Uses the SPI pin to send out the timing based signal to
-control the LEDs. Receives the display pattern command through MQTT, and deligates the
-actual pattern generation to classes which create the list of grb data for each of the 8
-leds (ws2812b's expect the color data in grb order, not rgb order)
+Module to control a strip of num_leds WS2812B LEDs (8 by default). Receives the display pattern command
+through MQTT. The patterns are defined in led_patterns.yaml and compiled at startup into tables of grb
+frames (ws2812b's expect the color data in grb order, not rgb order). A single LedRenderer thread ticks
+the active pattern at its frame rate and hands the frames to the strip backend chosen by led_backend:
+ws281x on the Raspberry Pi, spi on the Orange Pi, or recording to run without any hardware
+
+A pattern name can be followed by @ and a number of seconds, COUNTDOWN@320.5, to start the pattern that
+far in, as the controller does to pick a countdown back up after a restart
 '''
 
+backend_types = {
+  'ws281x': WS281xBackend,
+  'spi': SPIBackend,
+  'recording': RecordingBackend
+}
+
 
 class LedsModule(BaseModule):
 
-  def __init__(self, config_file, secure_file):
+  def __init__(self, config_file, secure_file, default_backend='ws281x'):
     BaseModule.__init__(self, config_file, secure_file)
 
     try:
-      self.neopixel_pin = self.config['neopixel_pin']
+      self.backend = backend_types[self.config.get('led_backend', default_backend)](self.config)
     except KeyError as e:
       logger = logging.getLogger(__name__)
       err = "Key error in LEDS Init: {}".format(e)
@@ -45,50 +58,55 @@ class LedsModule(BaseModule):
       self.mqtt_client.publish('gserv/error', err)
       sys.exit(2)
 
-    self.pattern_classes = {
-      "BLANK": SolidPattern,
-      "GREEN_CLOCKWISE": SpinPattern,
-      "GREEN_COUNTERCLOCKWISE": SpinPattern,
-      "RED_CLOCKWISE": SpinPattern,
-      "RED_COUNTERCLOCKWISE": SpinPattern,
-      "BLUE_CLOCKWISE": SpinPattern,
-      "BLUE_COUNTERCLOCKWISE": SpinPattern,
-      "CYAN_CLOCKWISE": SpinPattern,
-      "CYAN_COUNTERCLOCKWISE": SpinPattern,
-      "COUNTDOWN": CountdownPattern
-    }
-
-    self.current_pattern = None
+    self.stats_topic = self.config.get('stats_topic', 'gserv/metrics/leds')
+    self.stats_interval = self.config.get('stats_interval', 60)
+
+    try:
+      self.frame_tables = load_patterns(self.config.get('patterns_file', 'config/led_patterns.yaml'), self.config,
+        self.config.get('pattern_cache'))
+    except (OSError, KeyError, ValueError) as e:
+      logger = logging.getLogger(__name__)
+      err = "LED pattern error in LEDS Init: {}".format(e)
+      logger.error(err)
+      self.mqtt_client.publish('gserv/error', err)
+      sys.exit(2)
+
+    self.renderer = LedRenderer(self.frame_tables, self.backend.write)
 
   def run(self):
-    self.strip = Adafruit_NeoPixel(8, self.neopixel_pin, 800000, 10, False, 255, 0)
-    self.strip.begin()
+    self.backend.begin()
+    self.renderer.start()
     self.change_pattern("BLANK")
+    self.scheduler = get_scheduler()
+    self.scheduler.call_later(self.stats_interval, self._publish_stats)
     self.mqtt_client.loop_forever()
 
-  def change_pattern(self, pattern_name):
-    if self.current_pattern is not None:
-      self.current_pattern.stop()
+  def change_pattern(self, pattern_name, offset=0.0):
+    self.renderer.change_pattern(pattern_name, offset)
 
-    if pattern_name in self.pattern_classes:
-      self.current_pattern = self.pattern_classes[pattern_name](self, pattern_name, self.config)
-      self.current_pattern.start()
-    else:
-      self.current_pattern = None
+  '''
+  _publish_stats reports how many frames were rendered and how many had changes that were
+  actually pushed out to the strip
+  '''
+  def _publish_stats(self):
+    self.mqtt_client.publish(self.stats_topic, json.dumps(self.renderer.stats()))
+    self.scheduler.call_later(self.stats_interval, self._publish_stats)
 
   def on_message(self, client, userdata, message):
     logger = logging.getLogger(__name__)
     msg = message.payload.decode('utf-8')
     logger.debug(msg)
-    self.change_pattern(msg)
-
-  def writeSPIData(self, ledList):
-    led_index = 0
-    for l in ledList:
-      self.strip.setPixelColorRGB(led_index, l[1], l[0], l[2])
-      led_index += 1
-
-    self.strip.show()
+    pattern_name, at, offset = msg.partition('@')
+    try:
+      offset = max(0.0, float(offset)) if at else 0.0
+    except ValueError:
+      pattern_name = msg
+    if pattern_name not in self.frame_tables:
+      err = "Unknown LED pattern {}".format(msg)
+      logger.error(err)
+      self.mqtt_client.publish('gserv/error', err)
+      return
+    self.change_pattern(pattern_name, offset)
 
 
 def main():
@@ -0,0 +1,183 @@
+'''
+LED Render Loop for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.led_patterns.FrameTable import FramePlayer
+import threading
+import time
+import math
+import logging
+
+'''
+Single render thread for the LED ring. The thread ticks at the active pattern's
+frame_period against absolute monotonic deadlines, so a late frame doesn't push every
+later frame back with it, and ticks that were missed entirely are dropped rather than
+replayed in a burst. The renderer is handed every pattern already compiled into a
+FrameTable, so a tick is a lookup by elapsed time.
+
+The renderer keeps the last frame it committed to the strip. A new frame is compared
+against it with frame_diff, and write_frame is only called with the Leds that actually
+changed; a frame with no changes never reaches the hardware. The counters in stats()
+show how many frames were rendered against how many were pushed.
+
+Pattern changes are only requested from other threads. The swap itself happens on the
+render thread between two frames, so once change_pattern returns the old pattern can
+produce at most the frame that was already being written. A change can start the new
+pattern offset seconds in, as if it had been playing that long.
+'''
+
+
+def frame_diff(old, new):
+  leds = len(new) // 3
+  if old is None or len(old) != len(new):
+    return list(range(leds))
+  if old == new:
+    return []
+
+  return [led for led in range(leds) if old[led * 3:led * 3 + 3] != new[led * 3:led * 3 + 3]]
+
+
+class LedRenderer():
+  def __init__(self, frame_tables, write_frame, clock=time.monotonic):
+    self.frame_tables = frame_tables
+    self.write_frame = write_frame
+    self.clock = clock
+
+    self.current_pattern = None
+    self.last_frame = None
+    self.frames_rendered = 0
+    self.frames_pushed = 0
+    self.pixels_rendered = 0
+    self.pixels_pushed = 0
+    self._pending = None
+    self._lock = threading.Lock()
+    self._wake = threading.Event()
+    self._thread = None
+    self._running = False
+    self._deadline = None
+
+  def start(self):
+    self._running = True
+    self._thread = threading.Thread(name='LedRenderer', target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    self._running = False
+    self._wake.set()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+
+  def stats(self):
+    return {
+      'frames_rendered': self.frames_rendered,
+      'frames_pushed': self.frames_pushed,
+      'pixels_rendered': self.pixels_rendered,
+      'pixels_pushed': self.pixels_pushed
+    }
+
+  def change_pattern(self, pattern_name, offset=0.0):
+    with self._lock:
+      self._pending = (pattern_name, offset)
+    self._wake.set()
+
+  def _swap_pattern(self):
+    with self._lock:
+      pending = self._pending
+      self._pending = None
+
+    if pending is None:
+      return False
+    pattern_name, offset = pending
+
+    logger = logging.getLogger(__name__)
+    if pattern_name in self.frame_tables:
+      self.current_pattern = FramePlayer(pattern_name, self.frame_tables[pattern_name], self.clock, offset)
+    else:
+      logger.error("Unknown LED pattern {}".format(pattern_name))
+      self.current_pattern = None
+
+    return True
+
+  '''
+  commit_frame writes the Leds of frame that differ from the last committed frame
+  '''
+  def commit_frame(self, frame):
+    self.frames_rendered += 1
+    self.pixels_rendered += len(frame) // 3
+    changed = frame_diff(self.last_frame, frame)
+    if changed:
+      self.write_frame(frame, changed)
+      self.frames_pushed += 1
+      self.pixels_pushed += len(changed)
+    self.last_frame = frame
+
+  '''
+  render_frame produces and commits one frame of the current pattern. A pattern hands off
+  to another one (COUNTDOWN ends in RED_CLOCKWISE) by setting next_pattern, which is
+  queued unless a newer request has already arrived
+  '''
+  def render_frame(self):
+    pattern = self.current_pattern
+    if pattern is None:
+      return
+
+    frame = pattern.next_frame()
+    if frame is not None:
+      self.commit_frame(frame)
+
+    if pattern.next_pattern is not None:
+      with self._lock:
+        if self._pending is None:
+          self._pending = (pattern.next_pattern, 0.0)
+      pattern.next_pattern = None
+      self._wake.set()
+
+  '''
+  tick is one pass of the render loop: pick up a pattern change, render a frame and work out
+  when the next one is due. Returns that deadline, or None when there is no pattern to play.
+  The render thread waits between ticks; the benchmarks call it directly against a fake clock
+  '''
+  def tick(self):
+    if self._swap_pattern() or self._deadline is None:
+      self._deadline = self.clock()
+
+    self.render_frame()
+
+    if self.current_pattern is None:
+      return None
+
+    period = self.current_pattern.frame_period
+    self._deadline += period
+    now = self.clock()
+    if self._deadline < now:
+      self._deadline += math.ceil((now - self._deadline) / period) * period
+
+    return self._deadline
+
+  def _run(self):
+    while self._running:
+      deadline = self.tick()
+
+      if not self._running:
+        break
+
+      if deadline is None:
+        self._wake.wait()
+        self._wake.clear()
+      elif self._wake.wait(deadline - self.clock()):
+        self._wake.clear()
@@ -13,16 +13,15 @@ Copyright (C) 2018 Kevin Kessler
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 from gserv.BaseModule import BaseModule
-import time
+from gserv.Scheduler import get_scheduler
 import logging
-import threading
 import sys
 
 
 class LightModule(BaseModule):
 
-  def __init__(self, config_file, secure_file):
-    BaseModule.__init__(self, config_file, secure_file)
+  def __init__(self, config_file, secure_file, mqtt_client=None, scheduler=None):
+    BaseModule.__init__(self, config_file, secure_file, mqtt_client=mqtt_client)
     self.logger = logging.getLogger(__name__)
     try:
       self.on_time = self.config['on_time']
@@ -37,6 +36,9 @@ class LightModule(BaseModule):
 
     self.cur_lux = -1
     self.lighting_timer = None
+    self.scheduler = scheduler or get_scheduler()
+    # Time to let the light come up (or go out) before checking the lux level
+    self.settle_time = 5
 
   def run(self):
     self.mqtt_client.loop_forever()
@@ -46,12 +48,9 @@ class LightModule(BaseModule):
     msg = message.payload.decode('utf-8')
     if message.topic == self.light_control_topic:
       if msg == 'ON':
-        # Cheat to spawn new thread outside the MQTT client thread
-        on_thread=threading.Timer(0.001,self._turn_on)
-        on_thread.start()
+        self._turn_on()
       elif msg == 'OFF':
-        off_thread=threading.Timer(0.001,self._turn_off)
-        off_thread.start()
+        self._turn_off()
     elif message.topic == self.light_level_topic:
       self.cur_lux = float(msg)
 
@@ -59,12 +58,13 @@ class LightModule(BaseModule):
     before_lux = self.cur_lux
     self.logger.debug("Activating Light")
     self.mqtt_client.publish(self.light_switch, "HIGH")
-    time.sleep(5)
+    self.scheduler.call_later(self.settle_time, self._check_on, before_lux)
+
+  def _check_on(self, before_lux):
     if self.cur_lux < before_lux + 1:
       self.logger.debug("Light Level went down, turning light back on")
       self.mqtt_client.publish(self.light_switch, "HIGH")
-    self.lighting_timer = threading.Timer(self.on_time, self._turn_off)
-    self.lighting_timer.start()
+    self.lighting_timer = self.scheduler.call_later(self.on_time, self._turn_off)
 
   def _turn_off(self):
     if self.lighting_timer is not None:
@@ -75,7 +75,9 @@ class LightModule(BaseModule):
     before_lux = self.cur_lux
     self.logger.debug("Deactivating Light")
     self.mqtt_client.publish(self.light_switch, "HIGH")
-    time.sleep(5)
+    self.scheduler.call_later(self.settle_time, self._check_off, before_lux)
+
+  def _check_off(self, before_lux):
     if self.cur_lux > before_lux + 1:
       self.logger.debug("Light Level went up, turning light back off")
       self.mqtt_client.publish(self.light_switch, "HIGH")
@@ -0,0 +1,127 @@
+'''
+MQTT Recording for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import struct
+import threading
+
+'''
+MQTT traffic kept in an append only file. The file starts with MAGIC, then records of two kinds:
+
+  topic    b'T', topic id (uint16), length (uint16), the topic
+  message  b'M', time (float64, seconds since the epoch), topic id (uint16), length (uint32),
+           the payload
+
+Each topic is written out once, the first time it's seen, and after that a message costs 15
+bytes plus its payload. Little endian throughout. A record cut short by a crash or a pull of
+the plug is dropped when the file is read, and cut off when it's opened to append to again.
+'''
+
+MAGIC = b'GSREC1\n'
+TOPIC = struct.Struct('<cHH')
+MESSAGE = struct.Struct('<cdHI')
+
+
+def _records(f):
+  topics = {}
+  good = f.tell()
+  while True:
+    kind = f.read(1)
+    if kind == b'T':
+      head = f.read(TOPIC.size - 1)
+      if len(head) < TOPIC.size - 1:
+        break
+      kind, topic_id, length = TOPIC.unpack(b'T' + head)
+      topic = f.read(length)
+      if len(topic) < length:
+        break
+      topics[topic_id] = topic.decode('utf-8')
+    elif kind == b'M':
+      head = f.read(MESSAGE.size - 1)
+      if len(head) < MESSAGE.size - 1:
+        break
+      kind, t, topic_id, length = MESSAGE.unpack(b'M' + head)
+      payload = f.read(length)
+      if len(payload) < length or topic_id not in topics:
+        break
+      good = f.tell()
+      yield good, topics, (t, topics[topic_id], payload)
+      continue
+    else:
+      break
+    good = f.tell()
+    yield good, topics, None
+
+
+'''
+read_recording yields (time, topic, payload bytes) for each message in the file, in the order
+they were recorded
+'''
+
+
+def read_recording(path):
+  with open(path, 'rb') as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError("{} is not an MQTT recording".format(path))
+    for good, topics, message in _records(f):
+      if message is not None:
+        yield message
+
+
+class RecordingWriter():
+  def __init__(self, path):
+    self.path = path
+    self.topics = {}
+    self._lock = threading.Lock()
+
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+      with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+          raise ValueError("{} is not an MQTT recording".format(path))
+        good = f.tell()
+        topics = {}
+        for good, topics, message in _records(f):
+          pass
+      self.topics = {topic: topic_id for topic_id, topic in topics.items()}
+      self.file = open(path, 'r+b')
+      self.file.truncate(good)
+      self.file.seek(good)
+    else:
+      self.file = open(path, 'wb')
+      self.file.write(MAGIC)
+
+  def write(self, t, topic, payload):
+    if isinstance(payload, str):
+      payload = payload.encode('utf-8')
+    with self._lock:
+      topic_id = self.topics.get(topic)
+      if topic_id is None:
+        topic_id = len(self.topics)
+        if topic_id > 0xFFFF:
+          raise ValueError("Too many topics in {}".format(self.path))
+        self.topics[topic] = topic_id
+        encoded = topic.encode('utf-8')
+        self.file.write(TOPIC.pack(b'T', topic_id, len(encoded)) + encoded)
+      self.file.write(MESSAGE.pack(b'M', t, topic_id, len(payload)) + payload)
+
+  def flush(self):
+    with self._lock:
+      self.file.flush()
+
+  def close(self):
+    with self._lock:
+      self.file.close()
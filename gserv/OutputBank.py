@@ -0,0 +1,239 @@
+'''
+GPIO output bank for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.gpio_backends import HIGH, LOW
+from gserv.SequencePlayer import SequencePlayer, compile_sequence
+import threading
+import time
+
+'''
+The outputs of GPIOOutputModule and the state they were last written to. A write that wouldn't
+change a pin is skipped. A toggle output follows its messages; a momentary output pulses away
+from its initial_state for active_time, with the end of the pulse on the shared Scheduler.
+
+A pulse requested while one is already running on the same output is rejected by default: the
+request is dropped and counted, and the running pulse ends on time. This is a change from the
+GPIOOutputModule before OutputBank, which wrote the pin again and started a second timer for
+every request, so the pulse still ended with the first timer and the second timer wrote the
+pin back to initial_state once more later. A second door press during a pulse now does nothing,
+and isn't acked. An output with pulse_overlap: merge instead has the running pulse extended to
+active_time from the new request.
+
+A sequence output is a toggle that can also be sent the name of one of its sequences (see
+SequencePlayer), which plays it and then goes back to initial_state. HIGH or LOW stops it.
+
+set_many applies several outputs as one transaction. Every entry is checked before any pin
+is touched, so a batch with a bad entry changes nothing.
+'''
+
+pulse_overlaps = ('reject', 'merge')
+
+
+def gpio_value(string):
+  if string == "HIGH":
+    return HIGH
+  else:
+    return LOW
+
+
+class Output():
+  def __init__(self, name, config):
+    self.name = name
+    self.type = config['type']
+    self.pin = config['pin']
+    self.initial_state = config['initial_state']
+    self.active_time = config['active_time'] if self.type == 'momentary' else None
+    self.pulse_overlap = config.get('pulse_overlap', 'reject')
+    if self.pulse_overlap not in pulse_overlaps:
+      raise ValueError("pulse_overlap {} on {} is not one of {}".format(self.pulse_overlap, name, pulse_overlaps))
+    self.schedules = {}
+    if self.type == 'sequence':
+      self.schedules = {seq_name: compile_sequence(seq_name, spec) for seq_name, spec in config['sequences'].items()}
+
+    self.state = None
+    self.pulse = None
+    self.pulse_end = None
+    self.playing = None
+
+    self.writes = 0
+    self.skipped = 0
+    self.pulses = 0
+    self.merged = 0
+    self.rejected = 0
+    self.pulse_late_total = 0.0
+    self.pulse_late_max = 0.0
+    self.sequences = 0
+    self.sequence_late_max = 0.0
+
+  def accepts(self, msg):
+    return msg == 'HIGH' or msg == 'LOW' or msg in self.schedules
+
+  def stats(self):
+    if self.type == 'sequence':
+      return {
+        'writes': self.writes,
+        'skipped': self.skipped,
+        'sequences': self.sequences,
+        'sequence_late_max_ms': round(self.sequence_late_max * 1000, 3)
+      }
+
+    return {
+      'writes': self.writes,
+      'skipped': self.skipped,
+      'pulses': self.pulses,
+      'merged': self.merged,
+      'rejected': self.rejected,
+      'pulse_late_mean_ms': round(self.pulse_late_total / self.pulses * 1000, 3) if self.pulses else 0.0,
+      'pulse_late_max_ms': round(self.pulse_late_max * 1000, 3)
+    }
+
+
+class OutputBank():
+  def __init__(self, backend, scheduler, clock=time.monotonic, player=None):
+    self.backend = backend
+    self.scheduler = scheduler
+    self.clock = clock
+    self.player = player
+    self.outputs = {}
+    self.names = {}
+    self.batches = 0
+    self._lock = threading.RLock()
+
+  '''
+  add sets up the output for one entry of the outputs list in gpiooutput.yaml, at its
+  initial_state. It is known both by its topic and by the last part of the topic
+  '''
+  def add(self, config):
+    output = Output(config['topic'].split('/')[-1], config)
+    if output.schedules and self.player is None:
+      self.player = SequencePlayer()
+    self.outputs[config['topic']] = output
+    self.names[output.name] = output
+    self.backend.output(output.pin, gpio_value(output.initial_state))
+    output.state = output.initial_state
+    output.writes += 1
+    return output
+
+  def lookup(self, key):
+    return self.outputs.get(key, self.names.get(key))
+
+  '''
+  set applies msg to one output, and returns whether it changed anything: a pin written, a
+  sequence started or a running pulse extended. A rejected pulse, a momentary output sent its
+  initial_state, or a pin already at msg return False, as do unknown outputs and messages
+  '''
+  def set(self, key, msg):
+    with self._lock:
+      output = self.lookup(key)
+      if output is None or not output.accepts(msg):
+        return False
+      return self._apply(output, msg)
+
+  '''
+  set_many takes a dict of output (topic or name) to HIGH/LOW. Returns None once it has been
+  applied, or the reason it wasn't
+  '''
+  def set_many(self, states):
+    if not isinstance(states, dict) or not states:
+      return "Batch must be a non empty object of output to HIGH/LOW"
+
+    with self._lock:
+      for key, msg in states.items():
+        if self.lookup(key) is None:
+          return "Unknown output {} in batch".format(key)
+        if not self.lookup(key).accepts(msg):
+          return "Invalid state {} for {} in batch".format(msg, key)
+
+      for key, msg in states.items():
+        self._apply(self.lookup(key), msg)
+      self.batches += 1
+
+    return None
+
+  def _write(self, output, msg):
+    if output.state == msg:
+      output.skipped += 1
+      return False
+    self.backend.write(output.pin, gpio_value(msg))
+    output.state = msg
+    output.writes += 1
+    return True
+
+  def _apply(self, output, msg):
+    if output.type == 'toggle':
+      return self._write(output, msg)
+
+    if output.type == 'sequence':
+      if output.playing is not None:
+        self.player.stop(output.playing)
+        output.sequence_late_max = max(output.sequence_late_max, output.playing.late_max)
+        output.playing = None
+      if msg in output.schedules:
+        output.playing = self.player.play(output.schedules[msg], self._sequence_write, self._sequence_done)
+        output.playing.output = output
+        output.sequences += 1
+        return True
+      return self._write(output, msg)
+
+    if msg == output.initial_state:
+      return False
+
+    if output.pulse is not None:
+      if output.pulse_overlap == 'merge':
+        output.pulse.cancel()
+        output.pulse_end = self.clock() + output.active_time
+        output.pulse = self.scheduler.call_at(output.pulse_end, self._end_pulse, output, output.pulse_end)
+        output.merged += 1
+        return True
+      output.rejected += 1
+      return False
+
+    written = self._write(output, msg)
+    output.pulse_end = self.clock() + output.active_time
+    output.pulse = self.scheduler.call_at(output.pulse_end, self._end_pulse, output, output.pulse_end)
+    return written
+
+  def _end_pulse(self, output, pulse_end):
+    with self._lock:
+      # A merge can move the end while this call was already on its way
+      if output.pulse is None or output.pulse_end != pulse_end:
+        return
+      late = self.clock() - output.pulse_end
+      output.pulse = None
+      output.pulses += 1
+      output.pulse_late_total += late
+      output.pulse_late_max = max(output.pulse_late_max, late)
+      self._write(output, output.initial_state)
+
+  def _sequence_write(self, playing, level):
+    with self._lock:
+      if not playing.stopped:
+        self._write(playing.output, "HIGH" if level == HIGH else "LOW")
+
+  def _sequence_done(self, playing):
+    with self._lock:
+      output = playing.output
+      if output.playing is playing:
+        output.sequence_late_max = max(output.sequence_late_max, playing.late_max)
+        output.playing = None
+        self._write(output, output.initial_state)
+
+  def stats(self):
+    with self._lock:
+      stats = {output.name: output.stats() for output in self.outputs.values()}
+      stats['batches'] = self.batches
+      return stats
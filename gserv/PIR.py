@@ -15,14 +15,19 @@ Copyright (C) 2018 Kevin Kessler
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
-
-import threading
+from gserv.Scheduler import get_scheduler
+from gserv.Tracing import Tracer
 import logging
 import sys
 
 
+'''
+Each motion starts a trace (see Tracing), carried on to the camera with the snapshot request
+'''
+
+
 class PIR():
-  def __init__(self, config, mqtt_client):
+  def __init__(self, config, mqtt_client, scheduler=None, tracer=None):
     try:
       self.camera_topic = config['camera_topic']
       self.light_switch = config['light_switch']
@@ -37,6 +42,8 @@ class PIR():
       sys.exit(2)
 
     self.mqtt_client = mqtt_client
+    self.scheduler = scheduler or get_scheduler()
+    self.tracer = tracer or Tracer('PIR')
 
     self.retrigger_timer = None
     self.snapshot_timer = None
@@ -53,10 +60,9 @@ class PIR():
     logger = logging.getLogger(__name__)
     if self.retrigger_timer is None and motion == "HIGH":
       logger.debug("PIR Detected Motion, taking snapshot, Lux {}".format(self.lux_level))
-      self.retrigger_timer = threading.Timer(self.retrigger_delay, self._retrigger_timer_expire)
-      self.retrigger_timer.start()
-      self.snapshot_timer = threading.Timer(self.snapshot_delay, self._take_snapshot)
-      self.snapshot_timer.start()
+      self.retrigger_timer = self.scheduler.call_later(self.retrigger_delay, self._retrigger_timer_expire)
+      self.snapshot_timer = self.scheduler.call_later(self.snapshot_delay, self._take_snapshot, self.tracer.root(),
+        self.tracer.clock())
       if self.lux_level is not None and self.lux_level < self.min_lux_level:
         self.mqtt_client.publish(self.light_switch, "ON")
     else:
@@ -66,7 +72,8 @@ class PIR():
   def _retrigger_timer_expire(self):
     self.retrigger_timer = None
 
-  def _take_snapshot(self):
+  def _take_snapshot(self, trace, motion_time):
     logger = logging.getLogger(__name__)
     logger.debug("Sending Camera MQTT command")
+    self.tracer.inject(self.mqtt_client, self.camera_topic, self.tracer.record('snapshot delay', trace, motion_time))
     self.mqtt_client.publish(self.camera_topic, "?")
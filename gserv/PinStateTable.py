@@ -0,0 +1,75 @@
+'''
+Pin state table for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from multiprocessing.sharedctypes import RawArray
+import time
+
+'''
+The last settled state of every input, in shared memory, so GPIOInputModule can answer a '?'
+without asking the input's process over its pipe. The table is created before the GPIOInput
+processes are forked, so they all write into the same pages.
+
+Each input has a slot of three 64 bit integers: a sequence number, the state (UNKNOWN until
+the input has reported) and the CLOCK_MONOTONIC time in ns of the edge that settled it. Every
+slot has one writer, the input that owns it. The writer makes the sequence odd while it
+updates the slot and even again when it's done, and a reader retries until it sees the same
+even sequence on both sides of its read.
+'''
+
+UNKNOWN = -1
+SLOT_SIZE = 3
+
+
+class PinStateTable():
+  def __init__(self, topics):
+    self.topics = list(topics)
+    self.slots = {topic: idx for idx, topic in enumerate(self.topics)}
+    self.array = RawArray('q', len(self.topics) * SLOT_SIZE)
+    for idx in range(len(self.topics)):
+      self.array[idx * SLOT_SIZE + 1] = UNKNOWN
+
+  def update(self, topic, state, edge_ns):
+    base = self.slots[topic] * SLOT_SIZE
+    seq = self.array[base]
+    self.array[base] = seq + 1
+    self.array[base + 1] = state
+    self.array[base + 2] = edge_ns
+    self.array[base] = seq + 2
+
+  def read(self, topic):
+    base = self.slots[topic] * SLOT_SIZE
+    while True:
+      seq = self.array[base]
+      state = self.array[base + 1]
+      edge_ns = self.array[base + 2]
+      if seq % 2 == 0 and self.array[base] == seq:
+        return state, edge_ns
+
+  '''
+  snapshot is every input's state, and how many seconds ago its last edge was
+  '''
+  def snapshot(self):
+    now = time.monotonic_ns()
+    inputs = {}
+    for topic in self.topics:
+      state, edge_ns = self.read(topic)
+      inputs[topic] = {
+        'state': None if state == UNKNOWN else ("LOW" if state == 0 else "HIGH"),
+        'age': round((now - edge_ns) / 1e9, 3) if state != UNKNOWN else None
+      }
+
+    return inputs
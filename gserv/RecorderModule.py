@@ -0,0 +1,66 @@
+'''
+Recorder Module for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.BaseModule import BaseModule
+from gserv.MQTTRecording import RecordingWriter
+from gserv.Scheduler import get_scheduler
+import logging
+import sys
+import time
+
+
+'''
+Records everything on sub_topic, with the time it arrived, to record_file (see MQTTRecording),
+for replaying against the other modules with gserv.Replay. The file is appended to across
+restarts and flushed every flush_interval seconds
+'''
+
+
+class RecorderModule(BaseModule):
+
+  def __init__(self, config_file, secure_file):
+    BaseModule.__init__(self, config_file, secure_file)
+    logger = logging.getLogger(__name__)
+    try:
+      self.writer = RecordingWriter(self.config['record_file'])
+    except (KeyError, ValueError, OSError) as e:
+      err = "Error in RecorderModule Init: {}".format(e)
+      logger.error(err)
+      self.mqtt_client.publish('gserv/error', err)
+      sys.exit(2)
+
+    self.flush_interval = self.config.get('flush_interval', 5)
+    self.scheduler = get_scheduler()
+    self.scheduler.call_later(self.flush_interval, self._flush)
+
+  def on_message(self, client, userdata, message):
+    self.writer.write(time.time(), message.topic, message.payload)
+
+  def _flush(self):
+    self.writer.flush()
+    self.scheduler.call_later(self.flush_interval, self._flush)
+
+
+def main():
+  recMod = RecorderModule('config/recorder.yaml', 'config/secure.yaml')
+  logger = logging.getLogger(__name__)
+  logger.info("RecorderModule starting")
+  recMod.run()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,228 @@
+'''
+MQTT Replay for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.BaseModule import merge_yaml
+from gserv.ControllerSimulation import SimMessage
+from gserv.MQTTRecording import read_recording
+from gserv.Scheduler import VirtualScheduler
+from paho.mqtt.client import topic_matches_sub
+import argparse
+import logging
+import sys
+import time
+
+'''
+Plays a recording made by the RecorderModule into a module, in place of the broker, and compares
+what the module publishes with what was recorded.
+
+The module is built on a ReplayClient for its mqtt_client and a VirtualScheduler started at the
+time of the first message. Each recorded message on the module's sub_topic is handed to
+receive at its recorded time, after the clock has been moved on to it and the timers due by
+then have run. speed paces that against the wall clock: 1 is real time, 10 is ten times as
+fast, and 0 is as fast as the module can take it. The module's timers are virtual at every
+speed, so a replay always turns out the same.
+
+The recording holds everything that was on the bus, including what the live module published
+and got back from the broker, so nothing the module publishes in the replay is fed back to it.
+
+The diff matches what the module published against the recorded messages it would have
+published, by topic and payload, in order, within tolerance seconds. Each module here comes with
+the list of what it publishes; its metrics are left out, as their counts never line up.
+
+  python -m gserv.Replay gserv.rec controller --speed 0
+'''
+
+
+class ReplayClient():
+  def __init__(self, scheduler):
+    self.scheduler = scheduler
+    self.published = []
+
+  def publish(self, topic, payload=None, qos=0, retain=False):
+    if isinstance(payload, bytes):
+      payload = payload.decode('utf-8', 'replace')
+    self.published.append((self.scheduler.now, topic, str(payload)))
+
+
+class ReplayResult():
+  def __init__(self, module, client, delivered, elapsed):
+    self.module = module
+    self.published = client.published
+    self.delivered = delivered
+    self.elapsed = elapsed
+
+
+def replay(build, messages, speed=0, tail=0.0):
+  messages = list(messages)
+  start = messages[0][0] if messages else 0.0
+  scheduler = VirtualScheduler(start=start)
+  client = ReplayClient(scheduler)
+  module = build(client, scheduler)
+  subscription = module.config.get('sub_topic', '#')
+
+  delivered = 0
+  wall_start = time.monotonic()
+  for t, topic, payload in messages:
+    if speed > 0:
+      delay = wall_start + (t - start) / speed - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+    scheduler.run_until(t)
+    if topic_matches_sub(subscription, topic):
+      module.receive(client, None, SimMessage(topic, payload))
+      delivered += 1
+
+  scheduler.advance(tail)
+  return ReplayResult(module, client, delivered, time.monotonic() - wall_start)
+
+
+'''
+diff_publishes returns (missing, extra): recorded messages the replay didn't publish, and ones
+it published that weren't recorded, as lists of (time, topic, payload). Several modules publish
+on the same topics (the controller's '?' and the input module's HIGH and LOW on an input topic),
+so only the messages matching the module's outputs, a list of (topic filter, payload or None for
+any), are compared
+'''
+
+
+def diff_publishes(recorded, replayed, outputs, tolerance=1.0):
+  def compared(topic, payload):
+    return any(topic_matches_sub(pattern, topic) and (want is None or want == payload) for pattern, want in outputs)
+
+  times = {}
+  for idx, messages in enumerate((recorded, replayed)):
+    for t, topic, payload in messages:
+      if isinstance(payload, bytes):
+        payload = payload.decode('utf-8', 'replace')
+      if compared(topic, payload):
+        times.setdefault((topic, payload), ([], []))[idx].append(t)
+
+  missing = []
+  extra = []
+  for (topic, payload), (rec, rep) in times.items():
+    i = j = 0
+    while i < len(rec) and j < len(rep):
+      if abs(rec[i] - rep[j]) <= tolerance:
+        i += 1
+        j += 1
+      elif rep[j] < rec[i]:
+        extra.append((rep[j], topic, payload))
+        j += 1
+      else:
+        missing.append((rec[i], topic, payload))
+        i += 1
+    missing.extend((t, topic, payload) for t in rec[i:])
+    extra.extend((t, topic, payload) for t in rep[j:])
+
+  return sorted(missing), sorted(extra)
+
+
+def module_config(config_file, secure_file):
+  config = merge_yaml(config_file, secure_file)
+  if 'Error' in config:
+    raise ValueError("{}: {}".format(config_file, config['Error']))
+  # The module's logging config and traces are for the Pi, not for a replay
+  config.pop('logging', None)
+  config.pop('trace_dir', None)
+  return config
+
+
+'''
+Each of these returns (build, outputs) for a module: build(client, scheduler) makes the module,
+and outputs is what to compare in the diff
+'''
+
+
+def controller(config_file, secure_file):
+  from gserv.ControllerModule import ControllerModule
+  from gserv.Texter import Texter
+  config = module_config(config_file, secure_file)
+  config.pop('snapshot_file', None)
+  config.pop('journal_dir', None)
+  texter_config = module_config('config/texter.yaml', secure_file)
+
+  def build(client, scheduler):
+    texter = Texter(client, scheduler=scheduler, config=texter_config, mailer=lambda text, picture: None)
+    return ControllerModule(config, None, mqtt_client=client, scheduler=scheduler, texter=texter,
+      clock=scheduler.clock)
+
+  outputs = [(config['light_switch'], None)]
+  for door in config.get('doors', [{}]):
+    door = dict(config, **door)
+    outputs += [(door[key], None) for key in ('led_topic', 'piezo_topic', 'door_control_topic', 'hold_led')]
+  outputs += [(config['input_topic'] + '/+', '?'), (config['camera_topic'], '?')]
+  return build, outputs
+
+
+def light(config_file, secure_file):
+  from gserv.LightModule import LightModule
+  config = module_config(config_file, secure_file)
+
+  def build(client, scheduler):
+    return LightModule(config, None, mqtt_client=client, scheduler=scheduler)
+  return build, [(config['light_switch'], None)]
+
+
+def gpiooutput(config_file, secure_file):
+  from gserv.GPIOOutputModule import GPIOOutputModule
+  from gserv.gpio_backends.Simulator import SimulatorBackend
+  config = module_config(config_file, secure_file)
+
+  def build(client, scheduler):
+    return GPIOOutputModule(config, None, mqtt_client=client, scheduler=scheduler,
+      backend=SimulatorBackend(config, clock=scheduler.clock), clock=scheduler.clock)
+  # It only publishes errors and its metrics, so a replay of it is mostly for the throughput
+  return build, [('gserv/error', None)]
+
+
+modules = {
+  'controller': (controller, 'config/controller.yaml'),
+  'light': (light, 'config/light.yaml'),
+  'gpiooutput': (gpiooutput, 'config/gpiooutput.yaml')
+}
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Replay an MQTT recording against a module')
+  parser.add_argument('recording')
+  parser.add_argument('module', choices=sorted(modules))
+  parser.add_argument('--config', help='module yaml, default the one in config/')
+  parser.add_argument('--secure', default='config/secure.yaml')
+  parser.add_argument('--speed', type=float, default=0, help='1 for real time, 0 for as fast as possible')
+  parser.add_argument('--tail', type=float, default=0, help='seconds to run the timers on after the last message')
+  parser.add_argument('--tolerance', type=float, default=1.0, help='seconds a publish can be off by')
+  parser.add_argument('--show', type=int, default=20, help='differences to list')
+  args = parser.parse_args()
+
+  logging.disable(logging.CRITICAL)
+  factory, default_config = modules[args.module]
+  build, outputs = factory(args.config or default_config, args.secure)
+  messages = list(read_recording(args.recording))
+  result = replay(build, messages, speed=args.speed, tail=args.tail)
+  missing, extra = diff_publishes(messages, result.published, outputs, tolerance=args.tolerance)
+
+  print("{} messages, {} delivered, {} published in {:.3f} s ({:.0f} messages/s)".format(len(messages),
+    result.delivered, len(result.published), result.elapsed, len(messages) / result.elapsed if result.elapsed else 0))
+  print("{} missing, {} extra".format(len(missing), len(extra)))
+  for label, diffs in (('-', missing), ('+', extra)):
+    for t, topic, payload in diffs[:args.show]:
+      print("{} {:.3f} {} {}".format(label, t - messages[0][0], topic, payload))
+  sys.exit(1 if missing or extra else 0)
+
+
+if __name__ == "__main__":
+  main()
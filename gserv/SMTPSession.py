@@ -0,0 +1,167 @@
+'''
+SMTP Session for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.Tracing import Tracer
+import logging
+import queue
+import smtplib
+import threading
+
+'''
+One logged in SMTP session, kept open by a worker thread that sends the mail queued with send.
+The connect, STARTTLS and login happen when the worker starts, not when the first alert goes
+out, and the session is kept alive with a NOOP every keepalive seconds without mail. A session
+the server has dropped is opened again: straight away if a NOOP finds it gone, and once, before
+giving up on the message, if it's found gone sending one. If the server can't be reached, the
+next try is at the next keepalive.
+
+send returns as soon as the mail is queued, so whoever sends an alert is never held up by SMTP.
+connect is what opens a connection, smtplib.SMTP unless it's being run against a stand-in.
+'''
+
+
+class SMTPSession():
+  def __init__(self, server, port, user=None, password=None, starttls=True, keepalive=60.0, timeout=20,
+      connect=smtplib.SMTP, tracer=None):
+    self.server = server
+    self.port = port
+    self.user = user
+    self.password = password
+    self.starttls = starttls
+    self.keepalive = keepalive
+    self.timeout = timeout
+    self.connect = connect
+    self.tracer = tracer or Tracer('SMTPSession')
+    self.smtp = None
+    self.queue = queue.Queue()
+    self.thread = None
+    self.connects = 0
+    self.sent = 0
+    self.failed = 0
+
+  def start(self):
+    if self.thread is None:
+      self.thread = threading.Thread(name='SMTPSession', target=self._run)
+      self.thread.daemon = True
+      self.thread.start()
+
+  def send(self, from_addr, to_addrs, message, trace=None):
+    self.start()
+    self.queue.put((from_addr, to_addrs, message, trace))
+
+  '''
+  close sends what's queued, quits the session and stops the worker
+  '''
+  def close(self, timeout=None):
+    if self.thread is not None:
+      self.queue.put(None)
+      self.thread.join(timeout)
+      self.thread = None
+
+  def _run(self):
+    self._ensure()
+    while True:
+      try:
+        item = self.queue.get(timeout=self.keepalive)
+      except queue.Empty:
+        self._keep_alive()
+        continue
+      if item is None:
+        break
+      from_addr, to_addrs, message, trace = item
+      with self.tracer.span('smtp send', trace, reconnect=self.smtp is None):
+        self._deliver(from_addr, to_addrs, message)
+
+    if self.smtp is not None:
+      try:
+        self.smtp.quit()
+      except (smtplib.SMTPException, OSError):
+        pass
+      self.smtp = None
+
+  def _ensure(self):
+    if self.smtp is not None:
+      return True
+    logger = logging.getLogger(__name__)
+    try:
+      smtp = self.connect(self.server, self.port, timeout=self.timeout)
+    except (smtplib.SMTPException, OSError) as err:
+      logger.error("Texter SMTP Connect error: {}".format(err))
+      return False
+
+    try:
+      if self.starttls:
+        smtp.starttls()
+      if self.user:
+        smtp.login(self.user, self.password)
+    except smtplib.SMTPNotSupportedError as err:
+      logger.error("Texter TLS Error: {}".format(err))
+      smtp.close()
+      return False
+    except smtplib.SMTPAuthenticationError as err:
+      logger.error("Texter authentication error: {}".format(err))
+      smtp.close()
+      return False
+    except (smtplib.SMTPException, OSError) as err:
+      logger.error("Texter SMTP session error: {}".format(err))
+      smtp.close()
+      return False
+
+    self.smtp = smtp
+    self.connects += 1
+    return True
+
+  def _drop(self):
+    if self.smtp is not None:
+      try:
+        self.smtp.close()
+      except OSError:
+        pass
+      self.smtp = None
+
+  def _keep_alive(self):
+    if self.smtp is not None:
+      try:
+        code, response = self.smtp.noop()
+        if code == 250:
+          return
+      except (smtplib.SMTPException, OSError):
+        pass
+      logger = logging.getLogger(__name__)
+      logger.debug("SMTP session dropped, reconnecting")
+      self._drop()
+    self._ensure()
+
+  def _deliver(self, from_addr, to_addrs, message):
+    logger = logging.getLogger(__name__)
+    for attempt in range(2):
+      if not self._ensure():
+        break
+      try:
+        self.smtp.sendmail(from_addr, to_addrs, message)
+        self.sent += 1
+        return
+      except (smtplib.SMTPServerDisconnected, OSError) as err:
+        # Most likely a session the server closed while it sat idle
+        logger.debug("SMTP session lost sending, reconnecting: {}".format(err))
+        self._drop()
+      except smtplib.SMTPException as err:
+        logger.error("Texter Send Mail error: {}".format(err))
+        break
+
+    self.failed += 1
+    logger.error("Texter could not send mail to {}".format(to_addrs))
@@ -0,0 +1,206 @@
+'''
+Scheduler for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import heapq
+import itertools
+import threading
+import time
+import os
+import logging
+
+'''
+One timer thread per process. Every delayed call in the modules used to be its own
+threading.Timer, which is an OS thread that lives only long enough to sleep and fire once.
+The Scheduler keeps the pending calls in a heap ordered by monotonic deadline and runs them
+from a single daemon thread. Callbacks run on that thread, so they should be short; anything
+that blocks for seconds (SMTP, sleeps) holds up every other timer in the process.
+'''
+
+
+class TimerHandle():
+  def __init__(self, scheduler, deadline, function, args, kwargs):
+    self.scheduler = scheduler
+    self.deadline = deadline
+    self.function = function
+    self.args = args
+    self.kwargs = kwargs
+    self.cancelled = False
+    self.queued = False
+    self.name = getattr(function, '__name__', 'timer')
+
+  '''
+  cancel stops the call from running if it hasn't started yet. Cancelling a handle that
+  has already fired, or cancelling twice, is harmless
+  '''
+  def cancel(self):
+    if not self.cancelled:
+      self.cancelled = True
+      self.scheduler._cancelled(self)
+
+  def remaining(self):
+    return max(0.0, self.deadline - self.scheduler.clock())
+
+
+class Scheduler():
+  def __init__(self, clock=time.monotonic, name='Scheduler'):
+    self.clock = clock
+    self.name = name
+    self._queue = []
+    self._sequence = itertools.count()
+    self._condition = threading.Condition()
+    self._cancelled_count = 0
+    self._thread = None
+    self._pid = None
+
+  '''
+  call_later runs function(*args, **kwargs) on the scheduler thread after delay seconds,
+  and returns a handle that can be cancelled
+  '''
+  def call_later(self, delay, function, *args, **kwargs):
+    return self.call_at(self.clock() + delay, function, *args, **kwargs)
+
+  '''
+  call_at runs function at an absolute deadline on the scheduler's clock
+  '''
+  def call_at(self, deadline, function, *args, **kwargs):
+    handle = TimerHandle(self, deadline, function, args, kwargs)
+    with self._condition:
+      self._ensure_thread()
+      handle.queued = True
+      heapq.heappush(self._queue, (deadline, next(self._sequence), handle))
+      # Only wake the thread if the new deadline is now the earliest one
+      if self._queue[0][2] is handle:
+        self._condition.notify()
+
+    return handle
+
+  def pending(self):
+    with self._condition:
+      return len(self._queue) - self._cancelled_count
+
+  def _cancelled(self, handle):
+    with self._condition:
+      if not handle.queued:
+        return
+      self._cancelled_count += 1
+      # Drop dead entries once they make up most of the heap, so a pattern of
+      # start/cancel (the door timer, the PIR retrigger) can't grow it without bound
+      if self._cancelled_count > 32 and self._cancelled_count * 2 > len(self._queue):
+        for e in self._queue:
+          if e[2].cancelled:
+            e[2].queued = False
+        self._queue = [e for e in self._queue if not e[2].cancelled]
+        heapq.heapify(self._queue)
+        self._cancelled_count = 0
+      self._condition.notify()
+
+  '''
+  The thread is started lazily, and restarted in a forked child, since threads do not
+  survive a fork
+  '''
+  def _ensure_thread(self):
+    if self._thread is None or self._pid != os.getpid():
+      self._pid = os.getpid()
+      self._thread = threading.Thread(name=self.name, target=self._run)
+      self._thread.daemon = True
+      self._thread.start()
+
+  def _run(self):
+    logger = logging.getLogger(__name__)
+    while True:
+      with self._condition:
+        while True:
+          while self._queue and self._queue[0][2].cancelled:
+            heapq.heappop(self._queue)[2].queued = False
+            self._cancelled_count -= 1
+
+          if not self._queue:
+            self._condition.wait()
+            continue
+
+          delay = self._queue[0][0] - self.clock()
+          if delay <= 0:
+            handle = heapq.heappop(self._queue)[2]
+            handle.queued = False
+            break
+
+          self._condition.wait(delay)
+
+      try:
+        handle.function(*handle.args, **handle.kwargs)
+      except Exception:
+        logger.exception("Scheduled call {} failed".format(handle.name))
+
+
+'''
+VirtualScheduler is the Scheduler on a clock that only moves when it's told to, for running a
+module's timers in simulation. Nothing runs on a thread: advance() moves the clock forward,
+running each call that comes due, in deadline order, from the caller, with the clock set to
+the call's deadline. Ten minutes of door timers take as long as the callbacks do
+'''
+
+
+class VirtualScheduler(Scheduler):
+  def __init__(self, start=0.0, name='VirtualScheduler'):
+    Scheduler.__init__(self, clock=lambda: self.now, name=name)
+    self.now = start
+
+  def _ensure_thread(self):
+    pass
+
+  def advance(self, seconds):
+    self.run_until(self.now + seconds)
+
+  def run_until(self, deadline):
+    while True:
+      with self._condition:
+        while self._queue and self._queue[0][2].cancelled:
+          heapq.heappop(self._queue)[2].queued = False
+          self._cancelled_count -= 1
+        if not self._queue or self._queue[0][0] > deadline:
+          break
+        handle = heapq.heappop(self._queue)[2]
+        handle.queued = False
+        self.now = max(self.now, handle.deadline)
+
+      handle.function(*handle.args, **handle.kwargs)
+
+    self.now = max(self.now, deadline)
+
+  '''
+  next_deadline is when the next pending call is due, or None
+  '''
+  def next_deadline(self):
+    with self._condition:
+      live = [e[0] for e in self._queue if not e[2].cancelled]
+      return min(live) if live else None
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+'''
+get_scheduler returns the process wide scheduler shared by all the modules
+'''
+
+
+def get_scheduler():
+  global _default_scheduler
+  with _default_lock:
+    if _default_scheduler is None:
+      _default_scheduler = Scheduler()
+    return _default_scheduler
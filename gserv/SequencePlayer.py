@@ -0,0 +1,199 @@
+'''
+Output sequence player for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from gserv.gpio_backends import HIGH, LOW
+import heapq
+import itertools
+import os
+import threading
+import time
+import logging
+
+'''
+Timed on/off sequences for outputs like the piezo. A sequence in gpiooutput.yaml is a list of
+steps, each some combination of
+
+  high: 0.1             # seconds HIGH
+  low: 0.9              # then seconds LOW
+  pwm: 0.25             # or a duty cycle, switched at hz for seconds
+  hz: 400
+  seconds: 0.5
+  repeat: 10            # the whole step, this many times
+
+and an optional repeat for the whole sequence (0 plays it until it's stopped). The keys are
+high and low rather than on and off, which yaml reads as booleans. Sequences are compiled once
+at startup into a Schedule, a tuple of (offset seconds, level) transitions, so playing one is
+walking down the tuple.
+
+One SequencePlayer thread plays every running sequence against absolute monotonic deadlines.
+It asks for SCHED_FIFO when it starts, so a busy Pi doesn't push the edges around; without
+the privilege for it, it logs a warning and runs at normal priority.
+'''
+
+
+class Schedule():
+  def __init__(self, transitions, duration, repeat):
+    self.transitions = tuple(transitions)
+    self.duration = duration
+    self.repeat = repeat
+
+
+def compile_sequence(name, spec):
+  if isinstance(spec, list):
+    spec = {'steps': spec}
+
+  transitions = []
+  offset = 0.0
+
+  def add(level, seconds):
+    if seconds < 0:
+      raise ValueError("Sequence {} has a negative time".format(name))
+    if seconds == 0:
+      return
+    if not transitions or transitions[-1][1] != level:
+      transitions.append((offset, level))
+
+  for step in spec.get('steps', []):
+    if not isinstance(step, dict) or not set(step) <= {'high', 'low', 'pwm', 'hz', 'seconds', 'repeat'}:
+      raise ValueError("Sequence {} has an invalid step {}".format(name, step))
+
+    for r in range(step.get('repeat', 1)):
+      if 'pwm' in step:
+        duty = step['pwm']
+        if not 0 <= duty <= 1 or step.get('hz', 0) <= 0:
+          raise ValueError("Sequence {} needs pwm between 0 and 1 and a positive hz".format(name))
+        period = 1.0 / step['hz']
+        for cycle in range(int(round(step.get('seconds', 0) * step['hz']))):
+          add(HIGH, period * duty)
+          offset += period * duty
+          add(LOW, period * (1 - duty))
+          offset += period * (1 - duty)
+      if 'high' in step:
+        add(HIGH, step['high'])
+        offset += step['high']
+      if 'low' in step:
+        add(LOW, step['low'])
+        offset += step['low']
+
+  if not transitions:
+    raise ValueError("Sequence {} has no steps".format(name))
+
+  return Schedule(transitions, offset, spec.get('repeat', 1))
+
+
+class Playing():
+  def __init__(self, schedule, write, start, done):
+    self.schedule = schedule
+    self.write = write
+    self.start = start
+    self.done = done
+    self.idx = 0
+    self.loop = 0
+    self.stopped = False
+    self.late_max = 0.0
+
+  def deadline(self):
+    if self.idx < len(self.schedule.transitions):
+      return self.start + self.schedule.transitions[self.idx][0]
+    return self.start + self.schedule.duration
+
+
+class SequencePlayer():
+  def __init__(self, priority=50, clock=time.monotonic):
+    self.priority = priority
+    self.clock = clock
+    self._queue = []
+    self._sequence = itertools.count()
+    self._condition = threading.Condition()
+    self._thread = None
+
+  '''
+  play starts schedule, calling write(playing, level) at each transition. When it has played
+  through, done(playing) is called; it isn't if the sequence is stopped. Returns the Playing to
+  stop it with. A transition can already be on its way when stop is called, so write should
+  check playing.stopped under whatever lock the caller stops it with
+  '''
+  def play(self, schedule, write, done=None):
+    playing = Playing(schedule, write, self.clock(), done)
+    with self._condition:
+      self._ensure_thread()
+      heapq.heappush(self._queue, (playing.deadline(), next(self._sequence), playing))
+      self._condition.notify()
+    return playing
+
+  def stop(self, playing):
+    with self._condition:
+      playing.stopped = True
+      self._condition.notify()
+
+  def _ensure_thread(self):
+    if self._thread is None:
+      self._thread = threading.Thread(name='SequencePlayer', target=self._run)
+      self._thread.daemon = True
+      self._thread.start()
+
+  def _set_priority(self):
+    logger = logging.getLogger(__name__)
+    try:
+      os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+    except (AttributeError, OSError) as e:
+      logger.warning("SequencePlayer running without real time priority: {}".format(e))
+
+  def _run(self):
+    logger = logging.getLogger(__name__)
+    self._set_priority()
+    while True:
+      with self._condition:
+        while True:
+          while self._queue and self._queue[0][2].stopped:
+            heapq.heappop(self._queue)
+
+          if not self._queue:
+            self._condition.wait()
+            continue
+
+          delay = self._queue[0][0] - self.clock()
+          if delay <= 0:
+            deadline, seq, playing = heapq.heappop(self._queue)
+            break
+
+          self._condition.wait(delay)
+
+      try:
+        self._step(playing, deadline)
+      except Exception:
+        logger.exception("Sequence step failed")
+
+  def _step(self, playing, deadline):
+    schedule = playing.schedule
+    if playing.idx < len(schedule.transitions):
+      playing.late_max = max(playing.late_max, self.clock() - deadline)
+      playing.write(playing, schedule.transitions[playing.idx][1])
+      playing.idx += 1
+    else:
+      # The end of one pass through the sequence
+      playing.loop += 1
+      if schedule.repeat != 0 and playing.loop >= schedule.repeat:
+        if playing.done is not None:
+          playing.done(playing)
+        return
+      playing.start += schedule.duration
+      playing.idx = 0
+
+    with self._condition:
+      if not playing.stopped:
+        heapq.heappush(self._queue, (playing.deadline(), next(self._sequence), playing))
@@ -0,0 +1,58 @@
+'''
+State Snapshot for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import json
+import logging
+import os
+
+'''
+A small JSON file of a module's state, for picking up where it left off after a restart. The
+snapshot is written to a temporary file next to it, synced, and renamed over the old one, so
+after a crash or a power cut the file is either the old snapshot or the new one, never half of
+each.
+'''
+
+
+def save_snapshot(path, data):
+  tmp = path + '.tmp'
+  with open(tmp, 'w') as f:
+    json.dump(data, f, separators=(',', ':'))
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp, path)
+
+
+'''
+load_snapshot returns the saved dict, or None if there isn't one or it can't be read
+'''
+
+
+def load_snapshot(path):
+  logger = logging.getLogger(__name__)
+  try:
+    with open(path, 'r') as f:
+      data = json.load(f)
+  except FileNotFoundError:
+    return None
+  except (OSError, ValueError) as e:
+    logger.warning("Ignoring unreadable snapshot {}: {}".format(path, e))
+    return None
+
+  if not isinstance(data, dict):
+    logger.warning("Ignoring snapshot {}, it isn't an object".format(path))
+    return None
+  return data
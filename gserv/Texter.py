@@ -16,18 +16,34 @@ Copyright (C) 2018 Kevin Kessler
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 from gserv.BaseModule import merge_yaml
-import smtplib
+from gserv.Scheduler import get_scheduler
+from gserv.Tracing import Tracer
+from gserv.SMTPSession import SMTPSession
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
-import threading
 import os
 import logging
 
 
+'''
+Texter loads config/texter.yaml unless it's given the config as a dict. A mailer, if given, is
+called as mailer(message_text, picture_path) in place of sending over SMTP, from whichever
+thread sends the text
+
+Otherwise texts go out on an SMTPSession, logged in when the Texter is made and kept open, so a
+text is only queued by whoever sends it. smtp_starttls (default true) and smtp_keepalive, the
+seconds between NOOPs (default 60), are optional in texter.yaml
+
+A text with a picture is traced (see Tracing) from the request to the camera, through the wait
+for the picture, to sending it, carrying on the current trace if there is one
+'''
+
+
 class Texter():
-  def __init__(self, mqtt_client=None):
-    config = merge_yaml('./config/texter.yaml', './config/secure.yaml')
+  def __init__(self, mqtt_client=None, scheduler=None, config=None, mailer=None, tracer=None):
+    if config is None:
+      config = merge_yaml('./config/texter.yaml', './config/secure.yaml')
     self.smtp_user = config['smtp_user']
     self.smtp_password = config['smtp_password']
     self.to_addrs = config['to_addrs']
@@ -36,7 +52,15 @@ class Texter():
     self.camera_topic = config['camera_topic']
     self.camera_delay = config['picture_delay']
     self.mqtt_client = mqtt_client
+    self.scheduler = scheduler or get_scheduler()
     self.pic_timer = None
+    self.mailer = mailer
+    self.tracer = tracer or Tracer('Texter')
+    self.session = None
+    if mailer is None:
+      self.session = SMTPSession(self.smtp_server, self.smtp_port, self.smtp_user, self.smtp_password,
+        starttls=config.get('smtp_starttls', True), keepalive=config.get('smtp_keepalive', 60.0), tracer=self.tracer)
+      self.session.start()
 
   '''
   send_text accepts a message and a boolean to take a picture and include it in the text.
@@ -47,14 +71,15 @@ class Texter():
   def send_text(self, message_text, send_pic=False):
     if send_pic:
       if self.pic_timer is not None or self.mqtt_client is None:
-        self._mail_text(message_text, None)
+        self._send(message_text, None)
       else:
+        trace = self.tracer.current() or self.tracer.root()
+        self.tracer.inject(self.mqtt_client, self.camera_topic, trace)
         self.mqtt_client.publish(self.camera_topic, '?')
-        self.pic_timer = threading.Timer(self.camera_delay, self._failed_pic,
-          args=[message_text])
-        self.pic_timer.start()
+        self.pic_timer = self.scheduler.call_later(self.camera_delay, self._failed_pic,
+          message_text, trace, self.tracer.clock())
     else:
-      self._mail_text(message_text, None)
+      self._send(message_text, None)
 
   '''
   process_message accepts a filename and, if waiting to send a text message,
@@ -64,32 +89,24 @@ class Texter():
   def receive_picture(self, picture_path):
     if self.pic_timer is not None:
       self.pic_timer.cancel()
-      message_text = self.pic_timer.args[0]
+      message_text, trace, requested = self.pic_timer.args
       self.pic_timer = None
-      self._mail_text(message_text, picture_path)
+      waited = self.tracer.record('picture wait', trace, requested)
+      # The picture's own trace, through the camera, if it came with one
+      self._send(message_text, picture_path, self.tracer.current() or waited)
+
+  def _send(self, message_text, picture_path, trace=None):
+    with self.tracer.span('send text', trace, picture=picture_path is not None):
+      if self.mailer is not None:
+        self.mailer(message_text, picture_path)
+      else:
+        self._mail_text(message_text, picture_path, self.tracer.current())
 
   '''
-  _mail_text connects to the smtp server and sends the mms email
+  _mail_text queues the mms email on the SMTP session
   '''
-  def _mail_text(self, message_text, picture_path):
+  def _mail_text(self, message_text, picture_path, trace=None):
     logger = logging.getLogger(__name__)
-    try:
-      s = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=20)
-    except Exception as err:
-      logger.error("Texter SMTP Connect error: {}".format(err))
-      return
-
-    try:
-      s.starttls()
-    except smtplib.SMTPNotSupportedError as err:
-      logger.error("Texter TLS Error: {}".format(err))
-      return
-
-    try:
-      s.login(self.smtp_user, self.smtp_password)
-    except smtplib.SMTPAuthenticationError as err:
-      logger.error("Texter authentication error: {}".format(err))
-
     msg = MIMEMultipart()
     msg.attach(MIMEText(message_text, 'plain'))
     if picture_path is not None:
@@ -100,19 +117,14 @@ class Texter():
       else:
         logger.error("Texter Picture Path {} is not a file".format(picture_path))
 
-    try:
-      s.sendmail(self.smtp_user, self.to_addrs, msg.as_string())
-    except Exception as err:
-      logger.error("Texter Send Mail error: {}".format(err))
-
-    s.quit()
+    self.session.send(self.smtp_user, self.to_addrs, msg.as_string(), trace)
 
   '''
   _failed_pic is called after the timeout waiting for a picture response. The message text
   without the picture is sent
   '''
-  def _failed_pic(self, message_text):
+  def _failed_pic(self, message_text, trace, requested):
     logger = logging.getLogger(__name__)
     logger.error("Texter timed out waiting for picture")
     self.pic_timer = None
-    self._mail_text(message_text, None)
+    self._send(message_text, None, self.tracer.record('picture wait', trace, requested, timed_out=True))
@@ -0,0 +1,241 @@
+'''
+Tracing for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+'''
+Follows one piece of work (a motion snapshot, a text with a picture) across the modules it
+passes through, as a trace made of spans. Every span has the trace's id, its own id and its
+parent's, and is timed on the monotonic clock, which all the modules on the Pi share.
+
+A trace crosses from one module to the next on a sidecar: just before publishing the message
+that hands the work on, inject publishes the trace and span on TRACE_PREFIX + the topic. The
+receiving module's BaseModule keeps it, and runs on_message for the message itself in a span
+that carries on the trace (see BaseModule.receive). While a span is open, current() is its
+context, on that thread.
+
+Spans are written to path in the Chrome trace event format (JSON array format, a record per
+line, which the format allows to be left without its closing bracket), as complete events,
+with a flow event from each inject to the span that picks it up. Once the file is over
+max_bytes it's moved to path.1 and a new one started. A Tracer without a path records nothing.
+
+Each module writes its own file, so merge them into one to see the whole path as a waterfall in
+chrome://tracing or Perfetto:
+
+  python -m gserv.Tracing /home/gserv/trace -o trace.json
+'''
+
+TRACE_PREFIX = 'gserv/trace/'
+
+
+class TraceContext():
+  __slots__ = ('trace_id', 'span_id')
+
+  def __init__(self, trace_id, span_id=None):
+    self.trace_id = trace_id
+    self.span_id = span_id
+
+
+def new_id():
+  return os.urandom(8).hex()
+
+
+class Tracer():
+  def __init__(self, module, path=None, max_bytes=10000000, clock=time.monotonic_ns):
+    self.module = module
+    self.path = path
+    self.max_bytes = max_bytes
+    self.clock = clock
+    self.enabled = path is not None
+    # topic to the context sent on its sidecar, until the message itself arrives
+    self.pending = {}
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self._file = None
+
+  @classmethod
+  def from_config(cls, config, module):
+    trace_dir = config.get('trace_dir')
+    if not trace_dir:
+      return cls(module)
+    return cls(module, os.path.join(trace_dir, module + '.json'), config.get('trace_max_bytes', 10000000))
+
+  def root(self):
+    return TraceContext(new_id())
+
+  def current(self):
+    return getattr(self._local, 'context', None)
+
+  '''
+  span times the block it wraps as a child of context (the current span if not given), and is
+  the child's context. With no context at all, it starts a trace
+  '''
+  def span(self, name, context=None, **args):
+    return _Span(self, name, context, args)
+
+  '''
+  record writes a span that's already happened, from start (a clock() time) to end or now, and
+  returns its context
+  '''
+  def record(self, name, context, start, end=None, **args):
+    if context is None:
+      context = self.root()
+    child = TraceContext(context.trace_id, new_id())
+    if self.enabled:
+      end = self.clock() if end is None else end
+      self._write(name, 'X', start, child, context.span_id, dur=end - start, args=args)
+    return child
+
+  '''
+  inject publishes context on topic's sidecar, for the module that gets the message published
+  on topic next
+  '''
+  def inject(self, mqtt_client, topic, context=None):
+    context = context or self.current()
+    if not self.enabled or context is None:
+      return
+    flow = new_id()
+    self._write('mqtt ' + topic, 's', self.clock(), context, None, flow=flow)
+    mqtt_client.publish(TRACE_PREFIX + topic, json.dumps({'trace': context.trace_id, 'span': context.span_id,
+      'flow': flow}))
+
+  def received_sidecar(self, topic, payload):
+    try:
+      sidecar = json.loads(payload)
+      self.pending[topic] = (TraceContext(sidecar['trace'], sidecar.get('span')), sidecar.get('flow'))
+    except (ValueError, KeyError, TypeError) as e:
+      logger = logging.getLogger(__name__)
+      logger.warning("Bad trace sidecar on {}: {}".format(topic, e))
+
+  '''
+  extract returns the context that came on topic's sidecar, if one did, and ends its flow
+  '''
+  def extract(self, topic):
+    pending = self.pending.pop(topic, None)
+    if pending is None:
+      return None
+    context, flow = pending
+    if flow is not None:
+      self._write('mqtt ' + topic, 'f', self.clock(), context, None, flow=flow)
+    return context
+
+  def _write(self, name, phase, ts, context, parent, dur=None, flow=None, args=None):
+    event = {'name': name, 'cat': self.module, 'ph': phase, 'ts': ts / 1000.0, 'pid': os.getpid(),
+      'tid': threading.get_ident()}
+    if dur is not None:
+      event['dur'] = dur / 1000.0
+    if flow is not None:
+      event['id'] = flow
+      if phase == 'f':
+        event['bp'] = 'e'
+    event['args'] = dict(args or {}, trace=context.trace_id, span=context.span_id, parent=parent)
+
+    try:
+      with self._lock:
+        if self._file is None or self._file.tell() > self.max_bytes:
+          self._open()
+        self._file.write(json.dumps(event) + ',\n')
+        self._file.flush()
+    except OSError as e:
+      logger = logging.getLogger(__name__)
+      logger.error("Cannot write trace to {}: {}".format(self.path, e))
+
+  def _open(self):
+    if self._file is not None:
+      self._file.close()
+      os.replace(self.path, self.path + '.1')
+    directory = os.path.dirname(self.path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._file = open(self.path, 'a')
+    if self._file.tell() == 0:
+      self._file.write('[\n')
+      self._file.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+        'args': {'name': self.module}}) + ',\n')
+
+
+class _Span():
+  def __init__(self, tracer, name, context, args):
+    self.tracer = tracer
+    self.name = name
+    self.context = context
+    self.args = args
+
+  def __enter__(self):
+    self.parent = self.context or self.tracer.current() or self.tracer.root()
+    self.child = TraceContext(self.parent.trace_id, new_id())
+    self.saved = self.tracer.current()
+    self.tracer._local.context = self.child
+    self.start = self.tracer.clock()
+    return self.child
+
+  def __exit__(self, exc_type, exc, tb):
+    self.tracer._local.context = self.saved
+    if self.tracer.enabled:
+      args = dict(self.args, error=repr(exc)) if exc is not None else self.args
+      self.tracer._write(self.name, 'X', self.start, self.child, self.parent.span_id,
+        dur=self.tracer.clock() - self.start, args=args)
+    return False
+
+
+'''
+read_trace returns the events in a trace file, leaving off a line cut short by a crash
+'''
+
+
+def read_trace(path):
+  events = []
+  with open(path, 'r') as f:
+    for line in f:
+      line = line.strip().rstrip(',')
+      if line in ('', '[', ']'):
+        continue
+      try:
+        events.append(json.loads(line))
+      except ValueError:
+        break
+  return events
+
+
+def merge_traces(paths):
+  events = []
+  for path in paths:
+    events.extend(read_trace(path))
+  return sorted(events, key=lambda e: e.get('ts', 0))
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Merge the modules\' trace files into one')
+  parser.add_argument('trace_dir')
+  parser.add_argument('-o', '--output', default='trace.json')
+  args = parser.parse_args()
+
+  paths = sorted(os.path.join(args.trace_dir, name) for name in os.listdir(args.trace_dir)
+    if name.endswith('.json') or name.endswith('.json.1'))
+  events = merge_traces(paths)
+  with open(args.output, 'w') as f:
+    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+  print("{} events from {} files in {}".format(len(events), len(paths), args.output))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,145 @@
+'''
+Travel Statistics for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import math
+import threading
+
+'''
+How long the doors take to move, kept in fixed memory however long the controller runs.
+
+Each measure (a door opening, closing, or answering a close command) has a Histogram of
+log spaced buckets, each growth times as wide as the one before, from low to high seconds, with
+one more bucket either side for anything outside them. Quantiles come from the bucket counts,
+so are good to within a bucket, about 10% with the default growth.
+
+Each measure also has a Baseline, an exponentially weighted mean and variance of its times,
+which follows the door as it slowly changes over the seasons. After warmup times, a time more
+than sigma standard deviations from the baseline is reported, so a motor wearing out or a
+sensor knocked out of line shows up before the door stops closing. The standard deviation is
+never taken as less than min_sd seconds, so a door that always takes the same time isn't
+reported for being a fraction of a second out.
+'''
+
+
+class Histogram():
+  def __init__(self, low=0.05, high=120.0, growth=1.1):
+    self.low = low
+    self.growth = growth
+    self.log_growth = math.log(growth)
+    self.counts = [0] * (int(math.ceil(math.log(high / low) / self.log_growth)) + 2)
+    self.count = 0
+    self.min = None
+    self.max = None
+
+  def add(self, value):
+    if value < self.low:
+      idx = 0
+    else:
+      idx = min(len(self.counts) - 1, 1 + int(math.log(value / self.low) / self.log_growth))
+    self.counts[idx] += 1
+    self.count += 1
+    self.min = value if self.min is None else min(self.min, value)
+    self.max = value if self.max is None else max(self.max, value)
+
+  def quantile(self, q):
+    if self.count == 0:
+      return None
+    target = q * self.count
+    seen = 0
+    for idx, count in enumerate(self.counts):
+      if count and seen + count >= target:
+        lower = self.min if idx == 0 else self.low * self.growth ** (idx - 1)
+        upper = self.max if idx == len(self.counts) - 1 else self.low * self.growth ** idx
+        lower = max(lower, self.min)
+        upper = min(upper, self.max)
+        # Spread evenly, on a log scale, across the bucket
+        value = lower * (upper / lower) ** ((target - seen) / count) if lower > 0 else upper
+        return min(max(value, self.min), self.max)
+      seen += count
+    return self.max
+
+
+class Baseline():
+  def __init__(self, alpha=0.05, warmup=10, min_sd=0.25):
+    self.alpha = alpha
+    self.warmup = warmup
+    self.min_sd = min_sd
+    self.count = 0
+    self.mean = 0.0
+    self.variance = 0.0
+
+  @property
+  def sd(self):
+    return max(math.sqrt(self.variance), self.min_sd)
+
+  '''
+  update adds a time to the baseline, and returns how many standard deviations it was from the
+  baseline before it, or None while the baseline is warming up
+  '''
+  def update(self, value):
+    if self.count == 0:
+      self.mean = value
+      self.count = 1
+      return None
+
+    deviation = (value - self.mean) / self.sd if self.count >= self.warmup else None
+    diff = value - self.mean
+    increment = self.alpha * diff
+    self.mean += increment
+    self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+    self.count += 1
+    return deviation
+
+
+class TravelStats():
+  def __init__(self, sigma=3.0, alpha=0.05, warmup=10, min_sd=0.25):
+    self.sigma = sigma
+    self.alpha = alpha
+    self.warmup = warmup
+    self.min_sd = min_sd
+    self.measures = {}
+    self._lock = threading.Lock()
+
+  '''
+  add records a time for a measure. If it's out of line with the baseline it returns (standard
+  deviations out, baseline mean), otherwise None
+  '''
+  def add(self, measure, seconds):
+    with self._lock:
+      entry = self.measures.get(measure)
+      if entry is None:
+        entry = self.measures[measure] = (Histogram(), Baseline(self.alpha, self.warmup, self.min_sd))
+      histogram, baseline = entry
+      mean = baseline.mean
+      histogram.add(seconds)
+      deviation = baseline.update(seconds)
+      if deviation is not None and abs(deviation) > self.sigma:
+        return deviation, mean
+      return None
+
+  def summary(self):
+    with self._lock:
+      return {measure: {
+        'count': histogram.count,
+        'p50': round(histogram.quantile(0.5), 3),
+        'p90': round(histogram.quantile(0.9), 3),
+        'p99': round(histogram.quantile(0.99), 3),
+        'min': round(histogram.min, 3),
+        'max': round(histogram.max, 3),
+        'baseline': round(baseline.mean, 3),
+        'sd': round(baseline.sd, 3)
+      } for measure, (histogram, baseline) in self.measures.items()}
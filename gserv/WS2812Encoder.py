@@ -0,0 +1,104 @@
+'''
+WS2812 SPI Encoder for Garage Server
+Copyright (C) 2018 Kevin Kessler
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Convert the grb ws2812b data to a string of spi data.  Each bit is 0.4 uS (1/2,500,000 Hz) to get each bit of the
+ws2812b data to be 1.20uS long (3 bits).  1's are encoded as 110, .80uS high, .4 uS low. 0's are encoded as 100,
+.40uS high, .80uS low.  The orange Pi has a weird long starting bit (10uS longer than it is supposed to), which throws off the timing,
+so a 0 byte is sent out the SPI pin first, before the actual bit stream is sent
+
+Every color byte becomes exactly 24 SPI bits, 3 whole bytes, so the encoding of a byte never depends on its neighbours.
+SPI_TABLE holds the 3 SPI bytes for each of the 256 values, and the encoder just copies table entries into a buffer that
+is allocated once.
+'''
+
+
+def _encode_byte(value):
+  bits = 0
+  for b in range(7, -1, -1):
+    if value & 1 << b:
+      bits = bits << 3 | 6
+    else:
+      bits = bits << 3 | 4
+
+  return bits.to_bytes(3, 'big')
+
+
+SPI_TABLE = tuple(_encode_byte(v) for v in range(256))
+
+
+class WS2812Encoder():
+  def __init__(self, num_leds):
+    self.num_leds = num_leds
+    # Each Led takes 9 SPI byes and 1 extra to supress the long initial SPI bit with the OPi
+    self.buffer = bytearray(1 + num_leds * 9)
+
+  '''
+  encode writes the SPI data for a frame (3 bytes of grb per Led) into the buffer and returns it. If changed is
+  given, only those Leds are re-encoded and the rest of the buffer is left as it was
+  '''
+  def encode(self, frame, changed=None):
+    buffer = self.buffer
+    table = SPI_TABLE
+    if changed is None:
+      changed = range(len(frame) // 3)
+
+    for led in changed:
+      idx = led * 3
+      byte_idx = 1 + led * 9
+      buffer[byte_idx:byte_idx + 3] = table[frame[idx]]
+      buffer[byte_idx + 3:byte_idx + 6] = table[frame[idx + 1]]
+      buffer[byte_idx + 6:byte_idx + 9] = table[frame[idx + 2]]
+
+    return buffer
+
+
+'''
+grb_to_spi_reference is the original bit at a time encoder, kept to check the table against
+'''
+
+
+def grb_to_spi_reference(grb):
+  retbytes = [0] * 9
+  shift_bit = 5
+  idx = 0
+  for x in grb:
+    for b in range(7, -1, -1):
+      if x & 1 << b:
+        bit_pat = 6
+      else:
+        bit_pat = 4
+
+      if shift_bit > -1:
+        retbytes[idx] |= bit_pat << shift_bit
+        shift_bit -= 3
+      else:
+        '''
+        shift bits right to fill out the last of the byte (shift_byte is negitive here)
+        '''
+        retbytes[idx] |= bit_pat >> -shift_bit
+
+        '''
+        get the remainder by masking out the bits from the last byte (2 ^ bits) -1, and shift
+        the remainder to the front of the next byte
+        '''
+        idx += 1
+        retbytes[idx] |= ((pow(2, -shift_bit) - 1) & bit_pat) << 8 + shift_bit
+        shift_bit = 8 + shift_bit - 3
+
+  return retbytes
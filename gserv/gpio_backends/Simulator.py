@@ -0,0 +1,138 @@
+from gserv.GPIOLines import PipeLine
+import threading
+import time
+import yaml
+
+'''
+Pins that only exist in memory, for running the input and output modules off the Pi. Inputs
+are driven with set(), or by a script of steps played from a thread, and every edge calls the
+pin's edge callbacks and feeds its PipeLines the same way an interrupt or a gpiochip event
+would. Every write to an output is kept, with the time it was made, in writes.
+
+A script is a list of steps, from a yaml file named by gpio_script or passed to play():
+
+  - at: 1.5            # seconds after the script starts
+    pin: 0
+    level: 1
+    bounce: 6          # optional, the line chatters this many times before it settles
+    spacing: 0.0005    # optional, seconds between the bounce edges
+
+A step with bounce goes to level, back, and so on, so its first and last edges are both
+to the new level, 2 * bounce * spacing seconds apart.
+'''
+
+edge_levels = {
+  'INT_EDGE_RISING': (1,),
+  'INT_EDGE_FALLING': (0,),
+  'INT_EDGE_BOTH': (0, 1),
+  'INT_EDGE_SETUP': ()
+}
+
+
+def load_script(script_file):
+  with open(script_file, 'r') as f:
+    return yaml.safe_load(f)
+
+
+class SimulatorBackend():
+  def __init__(self, config, clock=time.monotonic):
+    self.clock = clock
+    self.script = config.get('gpio_script')
+    self.script_start = None
+    self.levels = {}
+    self.callbacks = {}
+    self.lines = {}
+    self.writes = []
+    self._lock = threading.Lock()
+
+  '''
+  begin plays gpio_script, if there is one, from script_start, or from now. Returns the
+  player thread, or None
+  '''
+  def begin(self):
+    if self.script is not None:
+      return self.play(load_script(self.script) if isinstance(self.script, str) else self.script, self.script_start)
+    return None
+
+  def begin_lines(self):
+    return self.begin()
+
+  def output(self, pin, value):
+    self.write(pin, value)
+
+  def write(self, pin, value):
+    with self._lock:
+      self.levels[pin] = value
+      self.writes.append((self.clock(), pin, value))
+
+  def input(self, pin, pull_resistor):
+    with self._lock:
+      self.levels.setdefault(pin, 1 if pull_resistor == 'PUD_UP' else 0)
+
+  def read(self, pin):
+    return self.levels.get(pin, 0)
+
+  def on_edge(self, pin, edge_type, callback):
+    with self._lock:
+      self.callbacks.setdefault(pin, []).append((edge_levels[edge_type], callback))
+
+  def delay(self, ms):
+    time.sleep(ms / 1000.0)
+
+  def line(self, input_config):
+    pin = input_config['pin']
+    self.input(pin, input_config.get('pupdown', 'PUD_OFF'))
+    line = PipeLine(self.read(pin), edge_levels[input_config.get('edge_type', 'INT_EDGE_BOTH')])
+    with self._lock:
+      self.lines.setdefault(pin, []).append(line)
+    return line
+
+  '''
+  set drives an input pin. A change of level is an edge
+  '''
+  def set(self, pin, level):
+    with self._lock:
+      if self.levels.get(pin, 0) == level:
+        return
+      self.levels[pin] = level
+      callbacks = [callback for levels, callback in self.callbacks.get(pin, []) if level in levels]
+      lines = list(self.lines.get(pin, []))
+
+    for line in lines:
+      line.set(level)
+    for callback in callbacks:
+      callback()
+
+  def run_step(self, step):
+    level = step['level']
+    for x in range(step.get('bounce', 0)):
+      self.set(step['pin'], level)
+      self._wait(step.get('spacing', 0.0005))
+      self.set(step['pin'], 1 - level)
+      self._wait(step.get('spacing', 0.0005))
+    self.set(step['pin'], level)
+
+  '''
+  play runs the steps from a thread, each at its time after start (default now). Returns the thread
+  '''
+  def play(self, steps, start=None):
+    if start is None:
+      start = self.clock()
+
+    def player():
+      for step in sorted(steps, key=lambda s: s['at']):
+        self._wait(start + step['at'] - self.clock())
+        self.run_step(step)
+
+    t = threading.Thread(name='GPIOSimulator', target=player)
+    t.daemon = True
+    t.start()
+    return t
+
+  def _wait(self, seconds):
+    # Sleeping is too coarse for bounce spacing under a millisecond, so the end of the wait spins
+    deadline = self.clock() + seconds
+    if seconds > 0.002:
+      time.sleep(seconds - 0.002)
+    while self.clock() < deadline:
+      pass
@@ -0,0 +1,46 @@
+from gserv.GPIOLines import chip_line
+
+'''
+The real pins, through wiringpi with its Wiring Pi pin numbering. wiringpi is only imported
+when the backend is started, so the modules load on a machine without it. line() hands the
+epoll input engine a gpiochip line for the same pin instead
+'''
+
+
+class WiringPiBackend():
+  def __init__(self, config):
+    self.wiringpi = None
+
+  def begin(self):
+    import wiringpi
+    self.wiringpi = wiringpi
+    wiringpi.wiringPiSetup()
+
+  '''
+  begin_lines is begin for a module that only uses line(). gpiochip needs no setup
+  '''
+  def begin_lines(self):
+    pass
+
+  def output(self, pin, value):
+    self.wiringpi.pinMode(pin, self.wiringpi.GPIO.OUTPUT)
+    self.wiringpi.digitalWrite(pin, value)
+
+  def write(self, pin, value):
+    self.wiringpi.digitalWrite(pin, value)
+
+  def input(self, pin, pull_resistor):
+    self.wiringpi.pinMode(pin, self.wiringpi.GPIO.INPUT)
+    self.wiringpi.pullUpDnControl(pin, getattr(self.wiringpi.GPIO, pull_resistor))
+
+  def read(self, pin):
+    return self.wiringpi.digitalRead(pin)
+
+  def on_edge(self, pin, edge_type, callback):
+    self.wiringpi.wiringPiISR(pin, getattr(self.wiringpi.GPIO, edge_type), callback)
+
+  def delay(self, ms):
+    self.wiringpi.delay(ms)
+
+  def line(self, input_config):
+    return chip_line(input_config)
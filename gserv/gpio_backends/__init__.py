@@ -0,0 +1,23 @@
+'''
+GPIO backends for the input and output modules. gpio_backend in the module's yaml picks one:
+wiringpi (the default) for the real pins, or simulator to run without any GPIO hardware
+'''
+
+LOW = 0
+HIGH = 1
+
+# The names the yaml files use for pull resistors and interrupt edges, which are wiringpi's
+PULL_RESISTORS = ('PUD_OFF', 'PUD_DOWN', 'PUD_UP')
+EDGE_TYPES = ('INT_EDGE_SETUP', 'INT_EDGE_FALLING', 'INT_EDGE_RISING', 'INT_EDGE_BOTH')
+
+
+def gpio_backend(config):
+  from gserv.gpio_backends.WiringPi import WiringPiBackend
+  from gserv.gpio_backends.Simulator import SimulatorBackend
+
+  backend_types = {
+    'wiringpi': WiringPiBackend,
+    'simulator': SimulatorBackend
+  }
+
+  return backend_types[config.get('gpio_backend', 'wiringpi')](config)
@@ -0,0 +1,22 @@
+import time
+
+'''
+A strip that only exists in memory. Every committed frame is kept with the time it was written and the number of Leds that
+changed, for tests and for benchmarking the LED code off the device. Frames are immutable, so keeping them costs a reference
+'''
+
+
+class RecordingBackend():
+  def __init__(self, config, clock=time.monotonic):
+    self.num_leds = config.get('num_leds', 8)
+    self.clock = clock
+    self.frames = []
+
+  def begin(self):
+    self.frames = []
+
+  def write(self, frame, changed):
+    self.frames.append((self.clock(), frame, len(changed)))
+
+  def timestamps(self):
+    return [t for t, frame, changed in self.frames]
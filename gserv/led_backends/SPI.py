@@ -0,0 +1,23 @@
+from gserv.WS2812Encoder import WS2812Encoder
+
+'''
+Drives the strip by bit banging the ws2812b timing out of the SPI port with wiringpi, for the Orange Pi. wiringpi is only
+imported when the strip is started
+'''
+
+
+class SPIBackend():
+  def __init__(self, config):
+    self.spi_port = config['spi_port']
+    self.encoder = WS2812Encoder(config.get('num_leds', 8))
+    self.wiringpi = None
+
+  def begin(self):
+    import wiringpi
+    self.wiringpi = wiringpi
+    wiringpi.wiringPiSPISetup(self.spi_port, 2500000)
+
+  def write(self, frame, changed):
+    # SPI has to clock out the whole strip, but only the changed Leds are re-encoded.
+    # wiringPiSPIDataRW reads back into the data it is given, so it gets a copy of the encoder's buffer
+    self.wiringpi.wiringPiSPIDataRW(self.spi_port, bytes(self.encoder.encode(frame, changed)))
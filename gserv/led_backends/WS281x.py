@@ -0,0 +1,23 @@
+'''
+Drives the strip through rpi_ws281x on the Raspberry Pi. The library is only imported when the strip is started, so the
+module can be loaded (and the rest of the LED code profiled) on a machine without it
+'''
+
+
+class WS281xBackend():
+  def __init__(self, config):
+    self.neopixel_pin = config['neopixel_pin']
+    self.num_leds = config.get('num_leds', 8)
+    self.strip = None
+
+  def begin(self):
+    from rpi_ws281x import Adafruit_NeoPixel
+    self.strip = Adafruit_NeoPixel(self.num_leds, self.neopixel_pin, 800000, 10, False, 255, 0)
+    self.strip.begin()
+
+  def write(self, frame, changed):
+    for led_index in changed:
+      idx = led_index * 3
+      self.strip.setPixelColorRGB(led_index, frame[idx + 1], frame[idx], frame[idx + 2])
+
+    self.strip.show()
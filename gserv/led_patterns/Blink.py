@@ -0,0 +1,21 @@
+from gserv.led_patterns.FrameTable import FrameTable, fill, num_leds
+
+'''
+Blink the whole strip, on_time seconds in the color and off_time seconds dark
+'''
+
+
+class BlinkPattern():
+  required = ('color', 'on_time', 'off_time')
+  frame_period = 0.1
+
+  @classmethod
+  def compile(cls, pattern_name, spec, config):
+    leds = num_leds(config)
+    period = spec.get('period', cls.frame_period)
+    on = fill(leds, spec['color'])
+    off = fill(leds, (0, 0, 0))
+    on_frames = max(1, int(round(spec['on_time'] / period)))
+    off_frames = max(1, int(round(spec['off_time'] / period)))
+
+    return FrameTable([on] * on_frames + [off] * off_frames, period)
@@ -0,0 +1,22 @@
+from gserv.led_patterns.FrameTable import FrameTable, FrameInterner, fill, num_leds, fade, fade_table
+
+'''
+Fade the whole strip from its color down to off and back up again, over cycle seconds
+'''
+
+
+class FadePattern():
+  required = ('color', 'cycle', 'steps')
+
+  @classmethod
+  def compile(cls, pattern_name, spec, config):
+    steps = spec['steps']
+    full = fill(num_leds(config), spec['color'])
+    interner = FrameInterner()
+
+    frames = []
+    for k in range(steps):
+      brightness = abs(1.0 - 2.0 * k / steps)
+      frames.append(interner.freeze(fade(full, fade_table(lambda v: v * brightness))))
+
+    return FrameTable(frames, spec['cycle'] / steps)
@@ -0,0 +1,120 @@
+'''
+Precompiled LED frames. Each named pattern is run once at startup and its output kept as an
+immutable table of frames. Looping patterns (the spins) are stored as one full cycle, one shot
+patterns (the countdown) as one frame per tick for the whole run, along with the pattern to
+hand off to when the table runs out. Playing a pattern back is then an index lookup from the
+time elapsed since it started, so what's displayed follows the clock rather than a tick count.
+
+A frame is a bytes object holding 3 bytes per Led in grb order, so a 144 Led strip is one 432
+byte buffer rather than 144 little lists. Rotating and fading work on the whole buffer at once,
+by slicing and by bytes.translate. Equal frames within a table are the same object.
+'''
+import math
+
+
+class FrameTable():
+  def __init__(self, frames, frame_period, loop=True, next_pattern=None):
+    self.frames = tuple(frames)
+    self.frame_period = frame_period
+    self.loop = loop
+    self.next_pattern = next_pattern
+
+  def __len__(self):
+    return len(self.frames)
+
+  def duration(self):
+    return len(self.frames) * self.frame_period
+
+
+'''
+FramePlayer plays a table from its start, or from offset seconds into it, for a pattern that
+was already running before it was asked for again
+'''
+
+
+class FramePlayer():
+  def __init__(self, pattern_name, table, clock, offset=0.0):
+    self.pattern_name = pattern_name
+    self.table = table
+    self.clock = clock
+    self.frame_period = table.frame_period
+    self.next_pattern = None
+    self.start_time = clock() - offset
+
+  def frame_at(self, elapsed):
+    # Round to the nearest tick, so a frame rendered a hair early still gets its own index
+    idx = int(elapsed / self.frame_period + 0.5)
+    if self.table.loop:
+      return self.table.frames[idx % len(self.table.frames)]
+
+    if idx >= len(self.table.frames):
+      self.next_pattern = self.table.next_pattern
+      idx = len(self.table.frames) - 1
+
+    return self.table.frames[idx]
+
+  def next_frame(self):
+    return self.frame_at(self.clock() - self.start_time)
+
+
+class FrameInterner():
+  def __init__(self):
+    self.frames = {}
+
+  def freeze(self, frame):
+    frozen = bytes(frame)
+    return self.frames.setdefault(frozen, frozen)
+
+
+def num_leds(config):
+  return config.get('num_leds', 8)
+
+
+def fill(leds, grb):
+  return bytes(grb) * leds
+
+
+'''
+rotate moves every Led in the frame the given number of positions up the strip, wrapping
+around the end. Negative values rotate the other way
+'''
+
+
+def rotate(frame, leds):
+  count = len(frame) // 3
+  if count == 0:
+    return frame
+  shift = (leds % count) * 3
+  if shift == 0:
+    return frame
+  return frame[-shift:] + frame[:-shift]
+
+
+'''
+spin_frames is one full turn of a frame, moving an eighth of the strip per step. Clockwise
+moves up the strip, counterclockwise down it
+'''
+
+
+def spin_frames(base, direction, interner):
+  leds = len(base) // 3
+  shift = max(1, leds // 8)
+  if direction != 'clockwise':
+    shift = -shift
+
+  count = leds // math.gcd(leds, abs(shift))
+  return [interner.freeze(rotate(base, (k + 1) * shift)) for k in range(count)]
+
+
+'''
+fade_table builds the 256 byte translation that applies a brightness function to every
+channel of a frame in one bytes.translate call
+'''
+
+
+def fade_table(function):
+  return bytes(max(0, min(255, int(function(v)))) for v in range(256))
+
+
+def fade(frame, table):
+  return frame.translate(table)
@@ -0,0 +1,30 @@
+from gserv.led_patterns.FrameTable import FrameTable, FrameInterner, num_leds, spin_frames
+
+'''
+Blend from one color at the first Led to another at the last. With a direction the gradient spins the same way the spin
+patterns do, otherwise it holds still
+'''
+
+
+class GradientPattern():
+  required = ('from', 'to')
+  frame_period = 0.15
+  still_period = 60
+
+  @classmethod
+  def compile(cls, pattern_name, spec, config):
+    leds = num_leds(config)
+    start = spec['from']
+    end = spec['to']
+
+    base = bytearray()
+    for p in range(leds):
+      t = p / (leds - 1) if leds > 1 else 0.0
+      base += bytes(int(round(a + (b - a) * t)) for a, b in zip(start, end))
+    base = bytes(base)
+
+    if 'direction' not in spec:
+      return FrameTable([base], cls.still_period)
+
+    frames = spin_frames(base, spec['direction'], FrameInterner())
+    return FrameTable(frames, spec.get('period', cls.frame_period))
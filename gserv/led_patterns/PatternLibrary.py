@@ -0,0 +1,147 @@
+from gserv.led_patterns.Solid import SolidPattern
+from gserv.led_patterns.Spin import SpinPattern
+from gserv.led_patterns.Fade import FadePattern
+from gserv.led_patterns.Blink import BlinkPattern
+from gserv.led_patterns.Gradient import GradientPattern
+from gserv.led_patterns.Countdown import CountdownPattern
+from gserv.led_patterns.FrameTable import FrameTable
+import hashlib
+import inspect
+import logging
+import pickle
+import yaml
+import os
+
+'''
+Loads the declarative pattern file (config/led_patterns.yaml) and compiles every entry into a FrameTable. The compiled
+tables are pickled to pattern_cache under a hash of the pattern file, the strip settings and the compiler and
+FrameTable source, so a restart with nothing changed just loads them back instead of recompiling the 10 minute
+countdown.
+'''
+
+pattern_types = {
+  'solid': SolidPattern,
+  'spin': SpinPattern,
+  'fade': FadePattern,
+  'blink': BlinkPattern,
+  'gradient': GradientPattern,
+  'countdown': CountdownPattern
+}
+
+
+color_keys = ('color', 'start_color', 'from', 'to')
+# Times and divisors, which have to be above 0. falloff divides each step of a spin's tail, so must be at least 1
+positive_keys = ('period', 'cycle', 'on_time', 'off_time', 'step_seconds', 'final_second', 'tail', 'falloff')
+
+
+def is_number(value):
+  return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_channel(value):
+  return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 255
+
+
+'''
+validate_patterns checks every entry has a known type and the options that type needs, that colors are three
+values from 0 to 255, that times, periods and step counts are above 0, and that any pattern a countdown hands off
+to exists. Raises ValueError describing the first problem found
+'''
+
+
+def validate_patterns(specs):
+  if not isinstance(specs, dict) or not specs:
+    raise ValueError("No patterns defined")
+
+  for name, spec in specs.items():
+    if not isinstance(spec, dict) or not isinstance(spec.get('type'), str) or spec['type'] not in pattern_types:
+      raise ValueError("Pattern {} has an unknown type".format(name))
+
+    for key in pattern_types[spec['type']].required:
+      if key not in spec:
+        raise ValueError("Pattern {} is missing {}".format(name, key))
+
+    for key in color_keys:
+      if key in spec and not (isinstance(spec[key], (list, tuple)) and len(spec[key]) == 3 and
+          all(is_channel(v) for v in spec[key])):
+        raise ValueError("Pattern {} {} must be three values from 0 to 255".format(name, key))
+
+    for key in positive_keys:
+      if key in spec and not (is_number(spec[key]) and spec[key] > 0):
+        raise ValueError("Pattern {} {} must be a number above 0".format(name, key))
+    if 'falloff' in spec and spec['falloff'] < 1:
+      raise ValueError("Pattern {} falloff must be at least 1".format(name))
+    if 'tail' in spec and not isinstance(spec['tail'], int):
+      raise ValueError("Pattern {} tail must be a whole number of steps".format(name))
+
+    steps = spec.get('steps')
+    if spec['type'] == 'fade' and not (isinstance(steps, int) and not isinstance(steps, bool) and steps > 0):
+      raise ValueError("Pattern {} steps must be a whole number above 0".format(name))
+    if spec['type'] == 'countdown' and not (isinstance(steps, (list, tuple)) and all(is_channel(v) for v in steps)):
+      raise ValueError("Pattern {} steps must be green values from 0 to 255".format(name))
+
+    if 'then' in spec and spec['then'] not in specs:
+      raise ValueError("Pattern {} hands off to unknown pattern {}".format(name, spec['then']))
+
+
+def compile_patterns(specs, config):
+  validate_patterns(specs)
+  return {name: pattern_types[spec['type']].compile(name, spec, config) for name, spec in specs.items()}
+
+
+'''
+cache_sources is the source files the cached tables depend on: the compilers, this module, and FrameTable, whose
+objects are what gets pickled
+'''
+
+
+def cache_sources():
+  sources = set(inspect.getsourcefile(c) for c in pattern_types.values())
+  sources.update((inspect.getsourcefile(FrameTable), inspect.getsourcefile(compile_patterns)))
+  return sorted(sources)
+
+
+def cache_key(pattern_text, config):
+  digest = hashlib.sha256(pattern_text.encode('utf-8'))
+  digest.update(repr((config.get('num_leds', 8), config.get('top_led'))).encode('utf-8'))
+  for source in cache_sources():
+    with open(source, 'rb') as f:
+      digest.update(f.read())
+
+  return digest.hexdigest()
+
+
+def load_patterns(patterns_file, config, cache_dir=None):
+  logger = logging.getLogger(__name__)
+  with open(patterns_file, 'r') as f:
+    pattern_text = f.read()
+
+  cache_file = None
+  if cache_dir is not None:
+    cache_file = os.path.join(cache_dir, 'led_patterns-{}.pickle'.format(cache_key(pattern_text, config)[:32]))
+    try:
+      with open(cache_file, 'rb') as f:
+        return pickle.load(f)
+    except FileNotFoundError:
+      pass
+    except Exception as err:
+      logger.warning("Discarding unreadable LED pattern cache {}: {}".format(cache_file, err))
+
+  specs = yaml.safe_load(pattern_text)
+  tables = compile_patterns(specs.get('patterns') if isinstance(specs, dict) else None, config)
+
+  if cache_file is not None:
+    try:
+      os.makedirs(cache_dir, exist_ok=True)
+      tmp_file = cache_file + '.tmp'
+      with open(tmp_file, 'wb') as f:
+        pickle.dump(tables, f, pickle.HIGHEST_PROTOCOL)
+      os.replace(tmp_file, cache_file)
+      # Tables compiled from older versions of the pattern file are no use any more
+      for name in os.listdir(cache_dir):
+        if name.startswith('led_patterns-') and name.endswith('.pickle') and name != os.path.basename(cache_file):
+          os.remove(os.path.join(cache_dir, name))
+    except OSError as err:
+      logger.warning("Cannot write LED pattern cache {}: {}".format(cache_file, err))
+
+  return tables
@@ -1,55 +1,36 @@
-import threading
+from gserv.led_patterns.FrameTable import FrameTable, FrameInterner, num_leds, spin_frames
 
+'''
+Spin a fading tail of light around the ring. The tail is 8 steps long by default, each step dimmer than the one before by a
+factor of 1.5, and on a strip longer than the tail each step is stretched over an equal share of the strip. Every frame moves
+the tail an eighth of the way around (one Led on the 8 Led ring), so a full turn takes the same time whatever the strip length.
+'''
 
-class SpinPattern():
-  def __init__(self, parent, pattern_name, config):
-    self.parent = parent
-    self.config = config
-    self.pattern_name = pattern_name
-    self.patterns = {
-      "GREEN_CLOCKWISE": [[0x05, 0x00, 0x00], [0x08, 0x00, 0x00], [0x0C, 0x00, 0x00], [0x13, 0x00, 0x00],
-        [0x1D, 0x00, 0x00], [0x2C, 0x00, 0x00], [0x42, 0x00, 0x00], [0x64, 0x00, 0x00]],
-      "GREEN_COUNTERCLOCKWISE": [[0x64, 0x00, 0x00], [0x42, 0x00, 0x00], [0x2C, 0x00, 0x00], [0x1D, 0x00, 0x00],
-        [0x13, 0x00, 0x00], [0x0C, 0x00, 0x00], [0x08, 0x00, 0x00], [0x05, 0x00, 0x00]],
-      "RED_CLOCKWISE": [[0x00, 0x05, 0x00], [0x00, 0x08, 0x00], [0x00, 0x0C, 0x00], [0x00, 0x13, 0x00],
-        [0x00, 0x1D, 0x00], [0x00, 0x2C, 0x00], [0x00, 0x42, 0x00], [0x00, 0x64, 0x00]],
-      "RED_COUNTERCLOCKWISE": [[0x00, 0x64, 0x00], [0x00, 0x42, 0x00], [0x00, 0x2C, 0x00], [0x00, 0x1D, 0x00],
-        [0x00, 0x13, 0x00], [0x00, 0x0C, 0x00], [0x00, 0x08, 0x00], [0x00, 0x05, 0x00]],
-      "BLUE_CLOCKWISE": [[0x00, 0x00, 0x05], [0x00, 0x00, 0x08], [0x00, 0x00, 0x0C], [0x00, 0x00, 0x13],
-        [0x00, 0x00, 0x1D], [0x00, 0x00, 0x2C], [0x00, 0x00, 0x42], [0x00, 0x00, 0x64]],
-      "BLUE_COUNTERCLOCKWISE": [[0x00, 0x00, 0x64], [0x00, 0x00, 0x42], [0x00, 0x00, 0x2C], [0x00, 0x00, 0x1D],
-        [0x00, 0x00, 0x13], [0x00, 0x00, 0x0C], [0x00, 0x00, 0x08], [0x00, 0x00, 0x05]],
-      "CYAN_CLOCKWISE": [[0x05, 0x00, 0x05], [0x08, 0x00, 0x08], [0x0C, 0x00, 0x0C], [0x13, 0x00, 0x13],
-        [0x1D, 0x00, 0x1D], [0x2C, 0x00, 0x2C], [0x42, 0x00, 0x42], [0x64, 0x00, 0x64]],
-      "CYAN_COUNTERCLOCKWISE": [[0x64, 0x00, 0x64], [0x42, 0x00, 0x42], [0x2C, 0x00, 0x2C], [0x1D, 0x00, 0x1D],
-        [0x13, 0x00, 0x13], [0x0C, 0x00, 0x0C], [0x08, 0x00, 0x08], [0x05, 0x00, 0x05]]
-    }
-    self.timer = None
-    self.current_color = None
-    if pattern_name in self.patterns:
-      self.current_color = self.patterns[self.pattern_name]
-    self.timer_period = 0.15
-    self.stop_run = False
 
-  def start(self):
-    self._write_leds()
+class SpinPattern():
+  required = ('color', 'direction')
+  frame_period = 0.15
 
-  def stop(self):
-    self.stop_run = True
-    if self.timer:
-      self.timer.cancel()
+  @classmethod
+  def compile(cls, pattern_name, spec, config):
+    leds = num_leds(config)
+    tail = spec.get('tail', 8)
+    falloff = spec.get('falloff', 1.5)
 
-  def _write_leds(self):
-    if self.stop_run:
-      return
+    # Brightness of each channel at each step of the tail, brightest first
+    levels = []
+    for channel in spec['color']:
+      steps = [channel]
+      while len(steps) < tail:
+        steps.append(int(steps[-1] / falloff))
+      levels.append(steps)
 
-    if self.current_color is not None:
-      for l in self.current_color:
-        for x in range(0, 3):
-          l[x] = int(l[x] / 1.5)
-          if l[x] != 0 and l[x] < 4:
-            l[x] = 0x64
+    base = bytearray()
+    for p in range(leds):
+      step = p * tail // leds
+      if spec['direction'] == 'clockwise':
+        step = tail - 1 - step
+      base += bytes(levels[c][step] for c in range(3))
 
-      self.timer_period = .15
-      self.parent.writeSPIData(self.current_color)
-      self.timer = threading.Timer(self.timer_period, self._write_leds).start()
+    frames = spin_frames(bytes(base), spec['direction'], FrameInterner())
+    return FrameTable(frames, spec.get('period', cls.frame_period))
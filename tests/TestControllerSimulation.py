@@ -0,0 +1,306 @@
+from gserv.ControllerSimulation import ControllerSimulation, load_configs, run_scenario
+import json
+import pytest
+import time
+import yaml
+
+with open('config/controller_scenarios.yaml', 'r') as f:
+  scenarios = yaml.safe_load(f)
+
+config, texter_config = load_configs()
+
+
+@pytest.mark.parametrize('scenario', scenarios, ids=[s['name'] for s in scenarios])
+def test_scenario(scenario):
+  assert run_scenario(scenario, config, texter_config) == []
+
+
+def test_failed_expectation_is_reported():
+  scenario = {'name': 'wrong', 'steps': [
+    {'input': [['gserv/gpioinput/close_hall', 'LOW'], ['gserv/gpioinput/open_hall', 'HIGH']]},
+    {'expect': [['gserv/leds', 'COUNTDOWN']], 'absent': [['gserv/leds', 'GREEN_CLOCKWISE']]}
+  ]}
+  failures = run_scenario(scenario, config, texter_config)
+  assert len(failures) == 2
+
+
+def test_auto_close_takes_virtual_time():
+  start = time.monotonic()
+  sim = ControllerSimulation(config, texter_config)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.advance(610)
+  assert time.monotonic() - start < 1.0
+
+  when = {(topic, payload): t for t, topic, payload in sim.client.published}
+  assert when[('gserv/gpiooutput/piezo', 'HIGH')] == 570
+  assert when[('gserv/gpiooutput/door', 'HIGH')] == 600
+  assert when[('gserv/leds', 'RED_CLOCKWISE')] == 610
+  assert sim.controller.doors[0].error_state
+
+
+def test_controller_publishes_its_own_queries():
+  sim = ControllerSimulation(config, texter_config)
+  topics = [(topic, payload) for t, topic, payload in sim.client.published]
+  assert topics[:2] == [('gserv/gpioinput/close_hall', '?'), ('gserv/gpioinput/open_hall', '?')]
+
+
+def three_doors():
+  doors = dict(config)
+  doors['doors'] = [{'name': name, 'close_input': 'close_hall_' + name, 'open_input': 'open_hall_' + name,
+    'door_control_topic': 'gserv/gpiooutput/door_' + name} for name in ('left', 'middle', 'right')]
+  return ControllerSimulation(doors, texter_config)
+
+
+def test_doors_close_on_their_own_timers():
+  sim = three_doors()
+  for name in ('left', 'middle', 'right'):
+    sim.input('gserv/gpioinput/close_hall_' + name, 'LOW')
+    sim.input('gserv/gpioinput/open_hall_' + name, 'HIGH')
+  sim.input('gserv/gpioinput/close_hall_left', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall_left', 'LOW')
+  sim.advance(100)
+  sim.input('gserv/gpioinput/close_hall_right', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall_right', 'LOW')
+  sim.advance(600)
+
+  doors = [(t, topic) for t, topic, payload in sim.client.published if topic.startswith('gserv/gpiooutput/door') and
+    payload == 'HIGH']
+  assert doors == [(600, 'gserv/gpiooutput/door_left'), (700, 'gserv/gpiooutput/door_right')]
+  assert [d.state.name for d in sim.controller.doors] == ['OPENED', 'CLOSED', 'OPENED']
+  # After the wait for the camera
+  sim.advance(120)
+  assert sorted(text for t, text, picture in sim.texts) == ['left: Garage Door did not respond to close command',
+    'right: Garage Door did not respond to close command']
+
+
+def test_shared_hold_button_holds_every_door():
+  sim = three_doors()
+  sim.input('gserv/gpioinput/hold', 'LOW')
+  assert all(d.on_hold for d in sim.controller.doors)
+
+
+def test_doors_are_slotted():
+  sim = three_doors()
+  assert not hasattr(sim.controller.doors[0], '__dict__')
+  assert [door.name for door, handler in sim.controller.routes['close_hall_middle']] == ['middle']
+
+
+def with_snapshot(tmp_path, start=0.0):
+  snapshot = dict(config, snapshot_file=str(tmp_path / 'controller_state.json'))
+  return ControllerSimulation(snapshot, texter_config, start=start)
+
+
+def published_after(sim, since):
+  return [(topic, payload) for t, topic, payload in sim.client.published if t >= since]
+
+
+def test_restart_keeps_the_close_timer(tmp_path):
+  sim = with_snapshot(tmp_path)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.advance(300)
+
+  restarted = with_snapshot(tmp_path, start=320)
+  door = restarted.controller.doors[0]
+  assert door.state.name == 'OPENED'
+  # The countdown carries on from when the door opened, not from the restart
+  assert restarted.client.published[0][1:] == ('gserv/leds', 'COUNTDOWN@320.0')
+
+  # The input module answers the '?' with what the door was already doing
+  restarted.input('gserv/gpioinput/close_hall', 'HIGH')
+  restarted.input('gserv/gpioinput/open_hall', 'LOW')
+  assert door.restoring is None
+  restarted.advance(300)
+  when = {(topic, payload): t for t, topic, payload in restarted.client.published}
+  assert when[('gserv/gpiooutput/piezo', 'HIGH')] == 570
+  assert when[('gserv/gpiooutput/door', 'HIGH')] == 600
+
+
+def test_restart_during_the_alarm(tmp_path):
+  sim = with_snapshot(tmp_path)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.advance(580)
+
+  restarted = with_snapshot(tmp_path, start=585)
+  assert published_after(restarted, 585)[:2] == [('gserv/gpiooutput/piezo', 'HIGH'), ('gserv/leds', 'COUNTDOWN@585.0')]
+  restarted.advance(20)
+  when = {(topic, payload): t for t, topic, payload in restarted.client.published}
+  assert when[('gserv/gpiooutput/door', 'HIGH')] == 600
+
+
+def test_restart_keeps_hold(tmp_path):
+  sim = with_snapshot(tmp_path)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.input('gserv/gpioinput/hold', 'LOW')
+
+  restarted = with_snapshot(tmp_path, start=5)
+  assert restarted.controller.doors[0].on_hold
+  assert published_after(restarted, 5)[:2] == [('gserv/leds', 'BLUE_CLOCKWISE'), ('gserv/gpiooutput/hold_led', 'HIGH')]
+  restarted.input('gserv/gpioinput/close_hall', 'HIGH')
+  restarted.input('gserv/gpioinput/open_hall', 'LOW')
+  restarted.advance(1200)
+  assert ('gserv/gpiooutput/door', 'HIGH') not in published_after(restarted, 5)
+
+
+def test_restart_after_hours_on_hold(tmp_path):
+  sim = with_snapshot(tmp_path)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.input('gserv/gpioinput/hold', 'LOW')
+  # No door events for longer than snapshot_max_age
+  sim.advance(3 * 3600)
+
+  restarted = with_snapshot(tmp_path, start=3 * 3600 + 30)
+  assert restarted.controller.doors[0].on_hold
+  assert published_after(restarted, 3 * 3600 + 30)[:2] == [('gserv/leds', 'BLUE_CLOCKWISE'),
+    ('gserv/gpiooutput/hold_led', 'HIGH')]
+
+
+def test_restart_sees_the_door_moved(tmp_path):
+  sim = with_snapshot(tmp_path)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+
+  # Closed by hand while the controller was down
+  restarted = with_snapshot(tmp_path, start=60)
+  restarted.input('gserv/gpioinput/close_hall', 'LOW')
+  restarted.input('gserv/gpioinput/open_hall', 'HIGH')
+  assert restarted.controller.doors[0].state.name == 'CLOSED'
+  assert restarted.controller.doors[0].door_close_timer is None
+  restarted.advance(600)
+  assert ('gserv/gpiooutput/piezo', 'HIGH') not in published_after(restarted, 60)
+
+
+def test_restart_after_the_deadline_sounds_the_alarm(tmp_path):
+  sim = with_snapshot(tmp_path)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+
+  restarted = with_snapshot(tmp_path, start=580)
+  restarted.advance(0)
+  when = {(topic, payload): t for t, topic, payload in restarted.client.published}
+  assert when[('gserv/gpiooutput/piezo', 'HIGH')] == 580
+  restarted.advance(30)
+  assert ('gserv/gpiooutput/door', 'HIGH') in published_after(restarted, 610)
+
+
+def test_old_snapshot_is_ignored(tmp_path):
+  sim = with_snapshot(tmp_path)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+
+  restarted = with_snapshot(tmp_path, start=config.get('snapshot_max_age', 3600) + 10)
+  assert restarted.controller.doors[0].state.name == 'UNKNOWN'
+
+
+def test_journal_query(tmp_path):
+  journal = dict(config, journal_dir=str(tmp_path))
+  sim = ControllerSimulation(journal, texter_config, start=1000)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.input('gserv/gpioinput/hold', 'LOW')
+  sim.input('gserv/gpioinput/hold', 'LOW')
+  sim.advance(620)
+
+  sim.input('gserv/journal/query', json.dumps({'id': 'opens', 'since': 1000, 'kinds': ['TRANSITION'],
+    'states': ['OPENED']}))
+  sim.input('gserv/journal/query', json.dumps({'id': 'recent', 'last': 3}))
+  sim.input('gserv/journal/query', json.dumps({'id': 'bad', 'kinds': ['NOPE']}))
+  replies = {r['id']: r for r in (json.loads(payload) for t, topic, payload in sim.client.published
+    if topic == 'gserv/journal/response')}
+
+  assert [(e['from'], e['to']) for e in replies['opens']['entries']] == [('UNKNOWN', 'OPENED')]
+  assert [e['kind'] for e in replies['recent']['entries']] == ['HOLD_OFF', 'FORCED_CLOSE', 'MOVE_FAILED']
+  assert replies['recent']['entries'][1]['time'] == 1600
+  assert 'error' in replies['bad']
+
+
+def test_journal_answers_are_capped(tmp_path):
+  journal = dict(config, journal_dir=str(tmp_path))
+  sim = ControllerSimulation(journal, texter_config, start=1000)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  for x in range(1200):
+    sim.input('gserv/gpioinput/hold', 'LOW')
+
+  sim.input('gserv/journal/query', json.dumps({'id': 'all', 'last': 10000000}))
+  sim.input('gserv/journal/query', json.dumps({'id': 'many', 'limit': 10000000}))
+  sim.input('gserv/journal/query', json.dumps({'id': 'float', 'last': 1.5}))
+  sim.input('gserv/journal/query', json.dumps({'id': 'text', 'limit': 'lots'}))
+  replies = {r['id']: r for r in (json.loads(payload) for t, topic, payload in sim.client.published
+    if topic == 'gserv/journal/response')}
+
+  assert len(replies['all']['entries']) == 1000
+  assert replies['all']['entries'][-1]['kind'] == 'HOLD_OFF'
+  assert len(replies['many']['entries']) == 1000
+  assert 'error' in replies['float'] and 'error' in replies['text']
+
+
+def open_and_close(sim, travel):
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.advance(travel)
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.advance(60)
+  sim.input('gserv/gpioinput/open_hall', 'HIGH')
+  sim.advance(travel)
+  sim.input('gserv/gpioinput/close_hall', 'LOW')
+  sim.advance(60)
+
+
+def test_slow_door_is_reported():
+  sim = ControllerSimulation(config, texter_config)
+  sim.input('gserv/gpioinput/close_hall', 'LOW')
+  sim.input('gserv/gpioinput/open_hall', 'HIGH')
+  for i in range(12):
+    open_and_close(sim, 12)
+  assert sim.controller.travel.summary()['open']['p50'] == 12
+  assert not [p for t, topic, p in sim.client.published if topic == 'gserv/error']
+
+  open_and_close(sim, 20)
+  errors = [p for t, topic, p in sim.client.published if topic == 'gserv/error']
+  assert errors == ["Garage Door opening took 20.0 s, +32.0 sd from the usual 12.0 s",
+    "Garage Door closing took 20.0 s, +32.0 sd from the usual 12.0 s"]
+
+
+def test_close_command_response_time():
+  sim = ControllerSimulation(config, texter_config)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.advance(602)
+  sim.input('gserv/gpioinput/open_hall', 'HIGH')
+  assert sim.controller.travel.summary()['command']['max'] == 2
+
+
+def test_close_command_hops():
+  sim = ControllerSimulation(config, texter_config, start=1000)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.advance(600)
+  command = [json.loads(p) for t, topic, p in sim.client.published if topic == 'gserv/gpiooutput/door/id'][0]
+  assert command['sent'] == 1600
+
+  sim.advance(0.05)
+  sim.input('gserv/timing/gpiooutput', json.dumps({'id': command['id'], 'received': 1600.01, 'written': 1600.012}))
+  sim.advance(1.45)
+  # An edge from before the pin was written isn't the door answering
+  sim.input('gserv/timing/gpioinput/open_hall', json.dumps({'edge': 1600.0, 'published': 1600.1}))
+  sim.input('gserv/timing/gpioinput/open_hall', json.dumps({'edge': 1601.412, 'published': 1601.462}))
+  sim.advance(0.1)
+  sim.input('gserv/gpioinput/open_hall', 'HIGH')
+
+  latency = [json.loads(p) for t, topic, p in sim.client.published if topic == 'gserv/metrics/controller/latency']
+  assert latency == [{'id': command['id'], 'door': None, 'outcome': 'moved', 'hops_ms': {'to_output': 10.0,
+    'pin_write': 2.0, 'movement': 1400.0, 'debounce': 50.0, 'to_controller': 138.0, 'total': 1600.0, 'ack': 38.0}}]
+
+
+def test_close_command_without_movement():
+  sim = ControllerSimulation(config, texter_config)
+  sim.input('gserv/gpioinput/close_hall', 'HIGH')
+  sim.input('gserv/gpioinput/open_hall', 'LOW')
+  sim.advance(610)
+  latency = [json.loads(p) for t, topic, p in sim.client.published if topic == 'gserv/metrics/controller/latency']
+  assert latency[0]['outcome'] == 'no movement'
+  assert set(latency[0]['hops_ms'].values()) == {None}
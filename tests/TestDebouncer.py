@@ -0,0 +1,52 @@
+from gserv.Debouncer import Debouncer
+import time
+
+
+def make_debouncer(pin):
+  published = []
+  debouncer = Debouncer(0.01, lambda: pin[0], published.append)
+  return debouncer, published
+
+
+def test_bounce_is_one_publish():
+  pin = [1]
+  debouncer, published = make_debouncer(pin)
+  for x in range(5):
+    debouncer.edge()
+
+  debouncer.finish(*debouncer.settle())
+  assert published == [1]
+  stats = debouncer.stats()
+  assert stats['edges'] == 5
+  assert stats['suppressed'] == 4
+  assert stats['published'] == 1
+  assert stats['latency_max_ms'] >= 10
+
+
+def test_changed_state_is_suppressed():
+  pin = [1]
+  debouncer, published = make_debouncer(pin)
+  debouncer.edge()
+  debouncer.edge()
+  pin[0] = 0
+
+  debouncer.finish(*debouncer.settle())
+  assert published == []
+  assert debouncer.stats()['suppressed'] == 2
+
+
+def test_edges_rearm_the_wait():
+  pin = [1]
+  debouncer, published = make_debouncer(pin)
+  debouncer.start()
+  start = time.monotonic()
+  for x in range(4):
+    debouncer.edge()
+    time.sleep(0.005)
+
+  while not published and time.monotonic() - start < 1:
+    time.sleep(0.001)
+
+  # The last edge was ~15ms in, so the publish can't happen before ~25ms
+  assert published == [1]
+  assert time.monotonic() - start >= 0.025
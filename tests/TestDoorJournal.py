@@ -0,0 +1,82 @@
+from gserv.DoorJournal import DoorJournal, JournalKinds, RECORD
+from gserv.DoorStateMachine import DoorStates, DoorEvents
+import os
+import pytest
+
+K = JournalKinds
+S = DoorStates
+
+
+def opens_and_closes(journal, count, start=1000.0, door=None):
+  for i in range(count):
+    t = start + i * 100
+    journal.append(t, K.TRANSITION, door, DoorEvents.SENSE_OPENED, S.CLOSED, S.OPENED)
+    journal.append(t + 50, K.TRANSITION, door, DoorEvents.SENSE_CLOSED, S.OPENED, S.CLOSED)
+
+
+def test_query_a_time_range(tmp_path):
+  journal = DoorJournal(str(tmp_path))
+  opens_and_closes(journal, 10)
+  entries = journal.query(since=1200, until=1500, states=[S.OPENED])
+  assert [e.time for e in entries] == [1200, 1300, 1400]
+  assert entries[0].as_dict() == {'time': 1200, 'kind': 'TRANSITION', 'event': 'SENSE_OPENED', 'from': 'CLOSED',
+    'to': 'OPENED', 'door': None}
+
+
+def test_last_entries(tmp_path):
+  journal = DoorJournal(str(tmp_path))
+  opens_and_closes(journal, 10)
+  journal.append(3000, K.HOLD_ON, None, None, S.CLOSED)
+  assert [e.time for e in journal.query(last=3, kinds=[K.TRANSITION])] == [1850, 1900, 1950]
+  assert [e.kind for e in journal.query(last=1)] == [K.HOLD_ON]
+  assert len(journal.query(limit=5)) == 5
+
+
+def test_segments_rotate(tmp_path):
+  journal = DoorJournal(str(tmp_path), segment_records=8)
+  opens_and_closes(journal, 20)
+  assert len(journal.segments) == 5
+  assert [e.time for e in journal.query(since=1350, until=2250, states=[S.OPENED])] == [1400 + i * 100 for i in range(9)]
+  assert [e.time for e in journal.query(last=3)] == [2850, 2900, 2950]
+
+
+def test_old_segments_are_deleted(tmp_path):
+  journal = DoorJournal(str(tmp_path), segment_records=8, max_segments=2)
+  opens_and_closes(journal, 20)
+  assert sorted(os.listdir(str(tmp_path))) == ['00000003.journal', '00000004.journal']
+  assert journal.query()[0].time == 1000 + 12 * 100
+
+
+def test_reopen_drops_a_cut_short_record(tmp_path):
+  journal = DoorJournal(str(tmp_path), segment_records=8)
+  opens_and_closes(journal, 6)
+  journal.close()
+  path = str(tmp_path / '00000001.journal')
+  with open(path, 'ab') as f:
+    f.write(RECORD.pack(5000, 1, 1, 1, 2, b'')[:10])
+
+  journal = DoorJournal(str(tmp_path), segment_records=8)
+  assert os.path.getsize(path) == RECORD.size * 5
+  journal.append(4000, K.FORCED_CLOSE, 'left', None, S.OPENED)
+  assert [(e.time, e.door) for e in journal.query(last=2)] == [(1550, None), (4000, 'left')]
+
+
+def test_time_never_goes_back(tmp_path):
+  journal = DoorJournal(str(tmp_path))
+  journal.append(2000, K.HOLD_ON)
+  journal.append(1000, K.HOLD_OFF)
+  assert [e.time for e in journal.query()] == [2000, 2000]
+
+
+def test_not_a_journal(tmp_path):
+  (tmp_path / '00000000.journal').write_bytes(b'something else entirely')
+  with pytest.raises(ValueError):
+    DoorJournal(str(tmp_path))
+
+
+def test_doors(tmp_path):
+  journal = DoorJournal(str(tmp_path))
+  for t in (1000, 1100, 1200):
+    journal.append(t, K.TRANSITION, 'left', DoorEvents.SENSE_OPENED, S.CLOSED, S.OPENED)
+    journal.append(t + 10, K.TRANSITION, 'right', DoorEvents.SENSE_OPENED, S.CLOSED, S.OPENED)
+  assert [e.time for e in journal.query(doors=['right'], states=[S.OPENED])] == [1010, 1110, 1210]
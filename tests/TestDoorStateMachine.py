@@ -0,0 +1,220 @@
+from gserv.ControllerModule import ControllerModule
+from gserv.DoorStateMachine import DoorStateMachine, DoorStates, DoorEvents, door_rules, hall_event
+import pytest
+import random
+
+
+class FakeDoor():
+  def __init__(self, state=DoorStates.UNKNOWN):
+    self.state = state
+    self.force_close = False
+    self.on_hold = False
+    self.timer = False
+
+
+class Recorder():
+  '''
+  Stands in for the ControllerModule: each action is recorded, and the ones that change the
+  flags the guards read change them on the door the way the controller's do
+  '''
+  def __init__(self):
+    self.calls = []
+
+  def force_closing(self, door):
+    return door.force_close
+
+  def held(self, door):
+    return door.on_hold
+
+  def __getattr__(self, name):
+    if name.startswith('_'):
+      raise AttributeError(name)
+    return lambda door: self._action(door, name)
+
+  def _action(self, door, name):
+    self.calls.append(name)
+    if name == 'stop_timer':
+      door.on_hold = False
+      door.timer = False
+    elif name == 'start_timer':
+      if not door.on_hold:
+        door.timer = True
+    elif name == 'hold_on':
+      door.on_hold = True
+    elif name == 'release_hold':
+      door.on_hold = False
+    elif name in ('confirm_force_close', 'fail_force_close', 'move_failed'):
+      door.force_close = False
+    elif name == 'close_door':
+      door.force_close = True
+
+
+class Legacy(Recorder):
+  '''
+  The controller's door handling as it was written before the table, calling the same actions
+  '''
+  def dispatch(self, door, event):
+    def act(name):
+      self._action(door, name)
+
+    if event.name.startswith('SENSE_'):
+      act('cancel_move_timer')
+      if event == DoorEvents.SENSE_CLOSED:
+        door.state = DoorStates.CLOSED
+        act('stop_timer')
+        if door.force_close:
+          act('confirm_force_close')
+      elif event == DoorEvents.SENSE_OPENED:
+        door.state = DoorStates.OPENED
+        if door.force_close:
+          act('fail_force_close')
+        else:
+          act('start_timer')
+      else:
+        act('stop_timer')
+        door.state = {DoorEvents.SENSE_OPENING: DoorStates.OPENING, DoorEvents.SENSE_CLOSING: DoorStates.CLOSING,
+          DoorEvents.SENSE_UNKNOWN: DoorStates.UNKNOWN}[event]
+      act('show_state')
+    elif event == DoorEvents.HOLD:
+      act('clear_error')
+      if not door.on_hold:
+        act('stop_timer')
+        act('hold_on')
+      else:
+        act('release_hold')
+        if door.state == DoorStates.OPENED:
+          act('start_timer')
+        act('show_hold_off')
+    elif event == DoorEvents.ALARM_TIMER:
+      act('sound_alarm')
+    elif event == DoorEvents.CLOSE_TIMER:
+      act('close_door')
+    elif event == DoorEvents.MOVE_TIMEOUT:
+      act('move_failed')
+
+
+def test_table_covers_every_state_and_event():
+  machine = DoorStateMachine(Recorder())
+  pairs = {(state, event) for state, event, guard, target, actions in machine.transitions()}
+  assert pairs == {(state, event) for state in DoorStates for event in DoorEvents}
+
+
+@pytest.mark.parametrize('state', list(DoorStates))
+@pytest.mark.parametrize('event', list(DoorEvents))
+@pytest.mark.parametrize('force_close', [False, True])
+@pytest.mark.parametrize('on_hold', [False, True])
+def test_every_transition_matches_the_old_controller(state, event, force_close, on_hold):
+  handler = Recorder()
+  machine = DoorStateMachine(handler)
+  legacy = Legacy()
+  door = FakeDoor(state)
+  legacy_door = FakeDoor(state)
+  for d in (door, legacy_door):
+    d.force_close = force_close
+    d.on_hold = on_hold
+
+  machine.dispatch(door, event)
+  legacy.dispatch(legacy_door, event)
+
+  assert door.state == legacy_door.state
+  if event in (DoorEvents.ALARM_TIMER, DoorEvents.CLOSE_TIMER) and state != DoorStates.OPENED:
+    # A close timer outside OPENED lost the race with being cancelled, and is now ignored
+    assert handler.calls == []
+  else:
+    assert handler.calls == legacy.calls
+
+
+def test_random_event_sequences_match_the_old_controller():
+  rng = random.Random(7)
+  levels = ("LOW", "HIGH")
+  for run in range(200):
+    handler = Recorder()
+    machine = DoorStateMachine(handler)
+    legacy = Legacy()
+    door = FakeDoor()
+    legacy_door = FakeDoor()
+    close_state = open_state = "XX"
+    for step in range(50):
+      if rng.random() < 0.6:
+        close_changed = rng.random() < 0.5
+        if close_changed:
+          close_state = rng.choice(levels)
+        else:
+          open_state = rng.choice(levels)
+        event = hall_event(close_state, open_state, close_changed)
+      elif rng.random() < 0.3:
+        event = DoorEvents.HOLD
+      else:
+        # Timers only fire while they are pending, the way the scheduler runs them
+        if not legacy_door.timer or legacy_door.state != DoorStates.OPENED:
+          continue
+        event = rng.choice((DoorEvents.ALARM_TIMER, DoorEvents.CLOSE_TIMER, DoorEvents.MOVE_TIMEOUT))
+
+      machine.dispatch(door, event)
+      legacy.dispatch(legacy_door, event)
+      assert door.state == legacy_door.state
+      assert handler.calls == legacy.calls
+
+
+def test_doors_keep_their_own_state():
+  handler = Recorder()
+  machine = DoorStateMachine(handler)
+  left = FakeDoor()
+  right = FakeDoor()
+  machine.dispatch(left, DoorEvents.SENSE_OPENED)
+  machine.dispatch(right, DoorEvents.SENSE_CLOSED)
+  machine.dispatch(left, DoorEvents.HOLD)
+  assert (left.state, left.on_hold) == (DoorStates.OPENED, True)
+  assert (right.state, right.on_hold) == (DoorStates.CLOSED, False)
+
+
+def test_hall_events():
+  assert hall_event("LOW", "HIGH", True) == DoorEvents.SENSE_CLOSED
+  assert hall_event("HIGH", "LOW", False) == DoorEvents.SENSE_OPENED
+  assert hall_event("HIGH", "HIGH", True) == DoorEvents.SENSE_OPENING
+  assert hall_event("HIGH", "HIGH", False) == DoorEvents.SENSE_CLOSING
+  assert hall_event("LOW", "LOW", True) == DoorEvents.SENSE_UNKNOWN
+  assert hall_event("XX", "HIGH", False) == DoorEvents.SENSE_UNKNOWN
+
+
+def test_missing_pair_is_rejected():
+  rules = tuple(r for r in door_rules if r[1] != DoorEvents.MOVE_TIMEOUT)
+  with pytest.raises(ValueError, match='No door rule for MOVE_TIMEOUT'):
+    DoorStateMachine(Recorder(), rules=rules)
+
+
+def test_guarded_only_pair_is_rejected():
+  rules = tuple(r for r in door_rules if not (r[1] == DoorEvents.HOLD and r[2] is None))
+  with pytest.raises(ValueError, match="isn't always taken"):
+    DoorStateMachine(Recorder(), rules=rules)
+
+
+def test_unreachable_rule_is_rejected():
+  rules = door_rules + ((None, DoorEvents.MOVE_TIMEOUT, None, None, ()),)
+  with pytest.raises(ValueError, match='can never be reached'):
+    DoorStateMachine(Recorder(), rules=rules)
+
+
+def test_unknown_action_is_rejected():
+  class Strict():
+    def force_closing(self):
+      return False
+
+  with pytest.raises(ValueError, match="doesn't have"):
+    DoorStateMachine(Strict())
+
+
+def test_handler_time_is_recorded():
+  machine = DoorStateMachine(Recorder())
+  door = FakeDoor()
+  machine.dispatch(door, DoorEvents.SENSE_OPENED)
+  machine.dispatch(door, DoorEvents.HOLD)
+  machine.dispatch(door, DoorEvents.HOLD)
+  stats = machine.handler_stats()
+  assert stats['UNKNOWN/SENSE_OPENED']['count'] == 1
+  assert stats['OPENED/HOLD']['count'] == 2
+  assert stats['OPENED/HOLD']['max_us'] >= stats['OPENED/HOLD']['mean_us'] > 0
+
+
+def test_controller_has_every_guard_and_action():
+  DoorStateMachine(ControllerModule.__new__(ControllerModule))
@@ -0,0 +1,53 @@
+from gserv.EdgeRecorder import EdgeRecorder
+import json
+
+MS = 1000000
+
+
+def test_pulse_widths_and_bounces():
+  recorder = EdgeRecorder(0.005)
+  t = 10 * MS
+  for x in range(10):
+    recorder.record(t, 1)
+    recorder.record(t + 20 * MS, 0)
+    t += 100 * MS
+
+  # One bounce: 1ms high
+  recorder.record(t, 1)
+  recorder.record(t + 1 * MS, 0)
+
+  stats = recorder.stats(t + MS)
+  assert stats['raw_edges'] == 22
+  assert stats['bounces'] == 1
+  assert stats['high']['count'] == 11
+  assert stats['high']['min_ms'] == 1.0
+  assert stats['high']['max_ms'] == 20.0
+  assert stats['low']['count'] == 10
+  assert stats['low']['mean_ms'] == 80.0
+  assert stats['low']['std_ms'] == 0.0
+
+
+def test_flush_is_compact_record():
+  recorder = EdgeRecorder(0.005)
+  assert recorder.flush() is None
+  recorder.record(5 * MS, 1)
+  recorder.record(5 * MS + 1520000, 0)
+  recorder.record(5 * MS + 1558000, 1)
+  record = recorder.flush()
+  assert ' ' not in record
+  assert json.loads(record) == {'t0': 5 * MS, 'us': [0, 1520, 38], 'v': '101'}
+  assert recorder.flush() is None
+
+
+def test_full_batch_asks_for_flush():
+  recorder = EdgeRecorder(0.005, batch_size=4)
+  assert [recorder.record(x * MS, x % 2) for x in range(4)] == [False, False, False, True]
+
+
+def test_edge_rate_decays():
+  recorder = EdgeRecorder(0.0, rate_window=1.0)
+  for x in range(1000):
+    recorder.record(x * MS, x % 2)
+
+  assert 550 < recorder.rate(1000 * MS) < 700
+  assert recorder.rate(10000 * MS) < 1
@@ -0,0 +1,63 @@
+from gserv.led_patterns.FrameTable import FramePlayer
+from gserv.led_patterns.PatternLibrary import compile_patterns
+import yaml
+
+with open('./config/led_patterns.yaml', 'r') as f:
+  pattern_classes = yaml.safe_load(f)['patterns']
+config = {'top_led': 2}
+
+
+def led(frame, idx):
+  return tuple(frame[idx * 3:idx * 3 + 3])
+
+
+def test_spin_is_a_rotation():
+  frames = compile_patterns(pattern_classes, config)['GREEN_CLOCKWISE'].frames
+  assert len(frames) == 8
+  assert [led(frames[0], i)[0] for i in range(8)] == [0x64, 0x05, 0x08, 0x0C, 0x13, 0x1D, 0x2C, 0x42]
+  for a, b in zip(frames, frames[1:] + frames[:1]):
+    assert b == a[-3:] + a[:-3]
+
+
+def test_frames_are_immutable():
+  table = compile_patterns(pattern_classes, config)['RED_COUNTERCLOCKWISE']
+  assert isinstance(table.frames, tuple)
+  assert all(isinstance(frame, bytes) and len(frame) == 24 for frame in table.frames)
+
+
+def test_long_strip():
+  tables = compile_patterns(pattern_classes, {'top_led': 2, 'num_leds': 144})
+  assert all(len(frame) == 144 * 3 for table in tables.values() for frame in table.frames)
+  # The tail moves an eighth of the strip per frame, so a turn still takes 8 frames
+  assert len(tables['GREEN_CLOCKWISE']) == 8
+  first = tables['COUNTDOWN'].frames[0]
+  assert led(first, 2) == (0, 0, 0) and led(first, 19) == (0, 0, 0)
+  assert led(first, 20) == (0x42, 0x80, 0x00)
+
+
+def test_countdown_follows_elapsed_time():
+  table = compile_patterns(pattern_classes, config)['COUNTDOWN']
+  assert not table.loop
+  assert table.next_pattern == 'RED_CLOCKWISE'
+  assert 575 < table.duration() < 576
+
+  now = [0.0]
+  player = FramePlayer('COUNTDOWN', table, lambda: now[0])
+  first = player.next_frame()
+  assert led(first, 2) == (0, 0, 0)
+  assert led(first, 3) == (0x42, 0x80, 0x00)
+
+  # All red for the final stretch, after 23 of the 24 colour steps and the 570 second step
+  now[0] = 571.6
+  frame = player.next_frame()
+  assert all(led(frame, i) == (0x00, 0x80, 0x00) for i in range(8))
+  assert player.next_pattern is None
+
+  now[0] = 600.0
+  player.next_frame()
+  assert player.next_pattern == 'RED_CLOCKWISE'
+
+
+def test_repeated_frames_are_shared():
+  table = compile_patterns(pattern_classes, config)['COUNTDOWN']
+  assert len(set(id(f) for f in table.frames)) < 250
@@ -0,0 +1,142 @@
+from gserv.GPIOInputEngine import GPIOInputEngine
+from gserv.PinStateTable import PinStateTable
+from gserv.GPIOLines import PipeLine, EVENT_REQUEST, EVENT_DATA, GPIOEVENT_EVENT_RISING_EDGE, \
+  GPIOEVENT_EVENT_FALLING_EDGE, chip_line
+import json
+import os
+import pytest
+import time
+
+
+def wait_for(sent, count):
+  start = time.monotonic()
+  while len(sent) < count and time.monotonic() - start < 1:
+    time.sleep(0.001)
+
+
+def test_struct_sizes():
+  assert EVENT_REQUEST.size == 48
+  assert EVENT_DATA.size == 16
+
+
+def test_pipe_line_events():
+  line = PipeLine()
+  line.set(1)
+  line.set(1)
+  line.set(0)
+  events = line.read_events()
+  assert [rising for ts, rising in events] == [True, False]
+  assert events[0][0] <= events[1][0]
+  assert line.read_events() == []
+  line.close()
+
+
+def test_engine_debounces_each_input():
+  sent = []
+  engine = GPIOInputEngine(sent.append, stats_interval=0.05)
+  hall = PipeLine()
+  pir = PipeLine()
+  engine.add_input('gserv/gpioinput/close_hall', hall, 0.01, 'gserv/metrics/gpioinput/close_hall')
+  engine.add_input('gserv/gpioinput/pir', pir, 0.01)
+  engine.start()
+  assert sent == [['gserv/gpioinput/close_hall', 'LOW'], ['gserv/gpioinput/pir', 'LOW']]
+
+  for x in range(5):
+    hall.set(1)
+    hall.set(0)
+  hall.set(1)
+  pir.set(1)
+  wait_for(sent, 4)
+  assert ['gserv/gpioinput/close_hall', 'HIGH'] in sent[2:4]
+  assert ['gserv/gpioinput/pir', 'HIGH'] in sent[2:4]
+
+  wait_for(sent, 5)
+  engine.stop()
+  stats = [json.loads(payload) for topic, payload in sent if topic == 'gserv/metrics/gpioinput/close_hall']
+  assert stats[0]['edges'] == 11
+  assert stats[0]['suppressed'] == 10
+
+
+def test_chip_line_mapping():
+  with pytest.raises(KeyError):
+    chip_line({'pin': 0, 'edge_type': 'INT_EDGE_SETUP', 'pupdown': 'PUD_OFF'})
+
+  with pytest.raises(FileNotFoundError):
+    chip_line({'pin': 0, 'gpiochip': '/nonexistent/gpiochip0', 'edge_type': 'INT_EDGE_BOTH', 'pupdown': 'PUD_OFF'})
+
+
+def test_engine_records_settled_state():
+  sent = []
+  table = PinStateTable(['gserv/gpioinput/pir'])
+  engine = GPIOInputEngine(sent.append, state_table=table)
+  pir = PipeLine()
+  engine.add_input('gserv/gpioinput/pir', pir, 0.01)
+  engine.start()
+  assert table.read('gserv/gpioinput/pir')[0] == 0
+
+  pir.set(1)
+  wait_for(sent, 2)
+  engine.stop()
+  assert table.read('gserv/gpioinput/pir')[0] == 1
+
+
+def test_engine_publishes_edge_batches():
+  sent = []
+  engine = GPIOInputEngine(sent.append, edges_interval=0.02)
+  pir = PipeLine()
+  engine.add_input('gserv/gpioinput/pir', pir, 0.01, edges_topic='gserv/edges/gpioinput/pir')
+  engine.start()
+  pir.set(1)
+  pir.set(0)
+  pir.set(1)
+  wait_for(sent, 3)
+  engine.stop()
+
+  records = [json.loads(payload) for topic, payload in sent if topic == 'gserv/edges/gpioinput/pir']
+  assert ''.join(r['v'] for r in records) == '101'
+
+
+class RealtimeLine(PipeLine):
+  # Kernels before 5.7 stamp events with CLOCK_REALTIME
+  def set(self, level):
+    self.level = level
+    os.write(self.write_fd, EVENT_DATA.pack(time.time_ns(),
+      GPIOEVENT_EVENT_RISING_EDGE if level else GPIOEVENT_EVENT_FALLING_EDGE))
+
+
+def test_engine_takes_realtime_event_stamps():
+  sent = []
+  engine = GPIOInputEngine(sent.append, stats_interval=0.05)
+  hall = RealtimeLine()
+  engine.add_input('gserv/gpioinput/close_hall', hall, 0.01, 'gserv/metrics/gpioinput/close_hall')
+  engine.start()
+  hall.set(1)
+  hall.set(0)
+  time.sleep(0.12)
+  engine.stop()
+
+  stats = [json.loads(payload) for topic, payload in sent if topic == 'gserv/metrics/gpioinput/close_hall']
+  assert stats and stats[0]['raw_edges'] == 2
+  assert 0 < stats[0]['edge_rate'] < 1000
+
+
+def test_rising_only_line_rejects_a_glitch():
+  sent = []
+  table = PinStateTable(['gserv/gpioinput/pir'])
+  engine = GPIOInputEngine(sent.append, state_table=table)
+  pir = PipeLine(0, edges=(1,))
+  engine.add_input('gserv/gpioinput/pir', pir, 0.02, both_edges=False)
+  engine.start()
+
+  # The line only queues the rising edge, and the pin is back LOW before debounce settles
+  pir.set(1)
+  pir.set(0)
+  time.sleep(0.06)
+  assert sent == [['gserv/gpioinput/pir', 'LOW']]
+  assert table.read('gserv/gpioinput/pir')[0] == 0
+
+  pir.set(1)
+  wait_for(sent, 2)
+  engine.stop()
+  assert sent[1] == ['gserv/gpioinput/pir', 'HIGH']
+  assert table.read('gserv/gpioinput/pir')[0] == 1
@@ -0,0 +1,69 @@
+from gserv.GPIOInput import GPIOInput
+from gserv.GPIOInputEngine import GPIOInputEngine
+from gserv.gpio_backends import gpio_backend
+from gserv.gpio_backends.Simulator import SimulatorBackend
+from multiprocessing import Pipe
+import time
+
+
+def wait_for(sent, count):
+  start = time.monotonic()
+  while len(sent) < count and time.monotonic() - start < 2:
+    time.sleep(0.001)
+
+
+def test_backend_selection():
+  assert isinstance(gpio_backend({'gpio_backend': 'simulator'}), SimulatorBackend)
+
+
+def test_edges_follow_edge_type():
+  sim = SimulatorBackend({})
+  rising = []
+  both = []
+  sim.input(3, 'PUD_OFF')
+  sim.on_edge(3, 'INT_EDGE_RISING', lambda: rising.append(sim.read(3)))
+  sim.on_edge(3, 'INT_EDGE_BOTH', lambda: both.append(sim.read(3)))
+  sim.run_step({'pin': 3, 'level': 1, 'bounce': 3, 'spacing': 0.0001})
+  sim.set(3, 1)
+
+  assert both == [1, 0, 1, 0, 1, 0, 1]
+  assert rising == [1, 1, 1, 1]
+
+
+def test_writes_are_recorded():
+  sim = SimulatorBackend({})
+  sim.output(16, 0)
+  sim.write(16, 1)
+  assert [(pin, value) for t, pin, value in sim.writes] == [(16, 0), (16, 1)]
+  assert sim.writes[0][0] <= sim.writes[1][0]
+
+
+def test_gpio_input_process_debounces_script():
+  sim = SimulatorBackend({'gpio_script': [
+    {'at': 0.05, 'pin': 0, 'level': 1, 'bounce': 10, 'spacing': 0.0002},
+    {'at': 0.15, 'pin': 0, 'level': 0, 'bounce': 4, 'spacing': 0.0002}]})
+  parent_pipe, child_pipe = Pipe()
+  p = GPIOInput(0, 'INT_EDGE_BOTH', 0.005, 'PUD_OFF', 'gserv/gpioinput/close_hall', child_pipe, backend=sim)
+  p.start()
+
+  received = []
+  while len(received) < 3 and parent_pipe.poll(2):
+    received.append(parent_pipe.recv())
+  p.terminate()
+
+  assert received == [['gserv/gpioinput/close_hall', 'LOW'], ['gserv/gpioinput/close_hall', 'HIGH'],
+    ['gserv/gpioinput/close_hall', 'LOW']]
+
+
+def test_engine_on_simulated_lines():
+  sim = SimulatorBackend({'gpio_script': [{'at': 0.01, 'pin': 2, 'level': 1, 'bounce': 20, 'spacing': 0.0001}]})
+  sent = []
+  engine = GPIOInputEngine(sent.append)
+  engine.add_input('gserv/gpioinput/open_hall', sim.line({'pin': 2, 'pupdown': 'PUD_OFF'}), 0.005)
+  engine.start()
+  sim.begin_lines()
+  wait_for(sent, 2)
+  time.sleep(0.02)
+  engine.stop()
+
+  assert sent == [['gserv/gpioinput/open_hall', 'LOW'], ['gserv/gpioinput/open_hall', 'HIGH']]
@@ -0,0 +1,88 @@
+from gserv.LedRenderer import LedRenderer, frame_diff
+from gserv.led_patterns.PatternLibrary import load_patterns
+from gserv.led_backends.Recording import RecordingBackend
+
+frame_tables = load_patterns('./config/led_patterns.yaml', {'top_led': 2})
+
+
+class Clock():
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+def make_renderer():
+  writes = []
+  clock = Clock()
+  renderer = LedRenderer(frame_tables, lambda frame, changed: writes.append((frame, changed)), clock=clock)
+  return renderer, writes, clock
+
+
+def test_frame_diff():
+  a = bytes([1, 2, 3, 0, 0, 0])
+  assert frame_diff(None, a) == [0, 1]
+  assert frame_diff(a, bytes(a)) == []
+  assert frame_diff(a, bytes([1, 2, 3, 0, 0, 1])) == [1]
+
+
+def test_unchanged_frames_are_not_pushed():
+  renderer, writes, clock = make_renderer()
+  renderer.change_pattern('BLANK')
+  renderer._swap_pattern()
+  for x in range(5):
+    renderer.render_frame()
+    clock.now += 60
+
+  assert len(writes) == 1
+  assert renderer.stats()['frames_rendered'] == 5
+  assert renderer.stats()['frames_pushed'] == 1
+
+
+def test_only_changed_pixels_are_pushed():
+  renderer, writes, clock = make_renderer()
+  renderer.change_pattern('COUNTDOWN')
+  renderer._swap_pattern()
+  for x in range(20):
+    renderer.render_frame()
+    clock.now += 0.05
+
+  # Spin steps blank one Led and restore the one before it, then nothing changes for the rest of the second
+  assert writes[0][1] == list(range(8))
+  assert all(len(changed) <= 2 for frame, changed in writes[1:])
+  assert renderer.stats()['frames_rendered'] == 20
+  assert renderer.stats()['frames_pushed'] == 9
+
+
+def test_countdown_hands_off():
+  renderer, writes, clock = make_renderer()
+  renderer.change_pattern('COUNTDOWN')
+  renderer._swap_pattern()
+  clock.now = 580
+  renderer.render_frame()
+  renderer._swap_pattern()
+  assert renderer.current_pattern.pattern_name == 'RED_CLOCKWISE'
+
+
+def test_pattern_started_part_way_in():
+  renderer, writes, clock = make_renderer()
+  renderer.change_pattern('COUNTDOWN', 580)
+  renderer._swap_pattern()
+  renderer.render_frame()
+  renderer._swap_pattern()
+  assert renderer.current_pattern.pattern_name == 'RED_CLOCKWISE'
+
+
+def test_tick_into_recording_backend():
+  clock = Clock()
+  backend = RecordingBackend({'num_leds': 8}, clock)
+  renderer = LedRenderer(frame_tables, backend.write, clock=clock)
+  renderer.change_pattern('RED_CLOCKWISE')
+  for x in range(10):
+    clock.now = renderer.tick()
+
+  stamps = backend.timestamps()
+  assert len(stamps) == 10
+  assert all(abs((b - a) - 0.15) < 1e-9 for a, b in zip(stamps, stamps[1:]))
+  assert backend.frames[0][2] == 8
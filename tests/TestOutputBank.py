@@ -0,0 +1,76 @@
+from gserv.OutputBank import OutputBank
+from gserv.Scheduler import Scheduler
+from gserv.gpio_backends.Simulator import SimulatorBackend
+import pytest
+import time
+
+door = {'topic': 'gserv/gpiooutput/door', 'pin': 16, 'type': 'momentary', 'initial_state': 'LOW', 'active_time': 0.05}
+light = {'topic': 'gserv/gpiooutput/light', 'pin': 1, 'type': 'momentary', 'initial_state': 'LOW', 'active_time': 0.05,
+  'pulse_overlap': 'merge'}
+hold_led = {'topic': 'gserv/gpiooutput/hold_led', 'pin': 5, 'type': 'toggle', 'initial_state': 'LOW'}
+
+
+def make_bank():
+  sim = SimulatorBackend({})
+  bank = OutputBank(sim, Scheduler())
+  for o in (door, light, hold_led):
+    bank.add(o)
+  return bank, sim
+
+
+def writes(sim, pin):
+  return [value for t, p, value in sim.writes if p == pin]
+
+
+def test_redundant_writes_are_skipped():
+  bank, sim = make_bank()
+  bank.set('gserv/gpiooutput/hold_led', 'HIGH')
+  bank.set('gserv/gpiooutput/hold_led', 'HIGH')
+  bank.set('hold_led', 'LOW')
+  assert writes(sim, 5) == [0, 1, 0]
+  assert bank.stats()['hold_led']['skipped'] == 1
+
+
+def test_overlapping_pulse_is_rejected():
+  bank, sim = make_bank()
+  assert bank.set('gserv/gpiooutput/door', 'HIGH')
+  time.sleep(0.02)
+  assert not bank.set('gserv/gpiooutput/door', 'HIGH')
+  assert not bank.set('gserv/gpiooutput/door', 'LOW')
+  time.sleep(0.1)
+  assert writes(sim, 16) == [0, 1, 0]
+  stats = bank.stats()['door']
+  assert stats['pulses'] == 1
+  assert stats['rejected'] == 1
+
+
+def test_overlapping_pulse_is_merged():
+  bank, sim = make_bank()
+  bank.set('light', 'HIGH')
+  start = time.monotonic()
+  time.sleep(0.03)
+  bank.set('light', 'HIGH')
+  while bank.stats()['light']['pulses'] == 0 and time.monotonic() - start < 1:
+    time.sleep(0.001)
+
+  # The pulse ran on to 50ms after the second request
+  assert time.monotonic() - start >= 0.08
+  assert writes(sim, 1) == [0, 1, 0]
+  assert bank.stats()['light']['merged'] == 1
+
+
+def test_batch_is_all_or_nothing():
+  bank, sim = make_bank()
+  assert bank.set_many({'hold_led': 'HIGH', 'nope': 'HIGH'}) == "Unknown output nope in batch"
+  assert bank.set_many({'hold_led': 'HIGH', 'door': 'ON'}) is not None
+  assert writes(sim, 5) == [0]
+
+  assert bank.set_many({'hold_led': 'HIGH', 'gserv/gpiooutput/door': 'HIGH'}) is None
+  assert writes(sim, 5) == [0, 1]
+  assert writes(sim, 16) == [0, 1]
+  assert bank.stats()['batches'] == 1
+
+
+def test_bad_overlap_setting():
+  with pytest.raises(ValueError):
+    OutputBank(SimulatorBackend({}), Scheduler()).add(dict(door, pulse_overlap='stack'))
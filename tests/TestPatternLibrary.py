@@ -0,0 +1,80 @@
+import inspect
+import os
+import pytest
+from gserv.led_patterns.FrameTable import FrameTable
+from gserv.led_patterns.PatternLibrary import cache_sources, compile_patterns, load_patterns, validate_patterns
+
+patterns_file = './config/led_patterns.yaml'
+config = {'top_led': 2, 'num_leds': 8}
+
+
+def test_rejects_bad_patterns():
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'sparkle'}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'spin', 'color': [1, 2, 3]}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'countdown', 'start_color': [0, 0, 0], 'steps': [0], 'step_seconds': 1,
+      'final_second': 2, 'then': 'MISSING'}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'fade', 'color': [1, 2, 3], 'cycle': 1.0, 'steps': 0}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'solid', 'color': [0, 256, 0]}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'gradient', 'from': [0, 0, 0], 'to': [-1, 0, 0]}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'countdown', 'start_color': [0, 0, 0], 'steps': [300], 'step_seconds': 1,
+      'final_second': 2, 'then': 'X'}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': ['spin']}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'spin', 'color': [1, 2, 3], 'direction': 'clockwise', 'falloff': 0}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'fade', 'color': [1, 2, 3], 'cycle': 0, 'steps': 10}})
+  with pytest.raises(ValueError):
+    validate_patterns({'X': {'type': 'countdown', 'start_color': [0, 0, 0], 'steps': [0], 'step_seconds': 0,
+      'final_second': 2, 'then': 'X'}})
+  for spec in ({'type': 'spin', 'color': [1, 2, 3], 'direction': 'clockwise'},
+      {'type': 'blink', 'color': [1, 2, 3], 'on_time': 0.1, 'off_time': 0.1},
+      {'type': 'gradient', 'from': [0, 0, 0], 'to': [1, 2, 3], 'direction': 'clockwise'}):
+    for period in (0, -0.1, 'fast'):
+      with pytest.raises(ValueError):
+        validate_patterns({'X': dict(spec, period=period)})
+
+
+def test_new_pattern_types():
+  tables = compile_patterns({
+    'F': {'type': 'fade', 'color': [0, 100, 0], 'cycle': 1.0, 'steps': 10},
+    'B': {'type': 'blink', 'color': [10, 20, 30], 'on_time': 0.3, 'off_time': 0.1},
+    'G': {'type': 'gradient', 'from': [0, 0, 0], 'to': [70, 0, 0]}
+  }, config)
+
+  fade = tables['F']
+  assert fade.frame_period == 0.1
+  assert fade.frames[0][1] == 100 and fade.frames[5] == bytes(24)
+
+  blink = tables['B'].frames
+  assert blink == (bytes([10, 20, 30]) * 8,) * 3 + (bytes(24),)
+
+  gradient = tables['G'].frames
+  assert len(gradient) == 1
+  assert [gradient[0][i * 3] for i in range(8)] == [0, 10, 20, 30, 40, 50, 60, 70]
+
+
+def test_cache_round_trip(tmp_path):
+  cache_dir = str(tmp_path)
+  compiled = load_patterns(patterns_file, config, cache_dir)
+  cached = os.listdir(cache_dir)
+  assert len(cached) == 1
+
+  again = load_patterns(patterns_file, config, cache_dir)
+  assert again['COUNTDOWN'].frames == compiled['COUNTDOWN'].frames
+  # Shared frames stay shared after being pickled
+  assert len(set(id(f) for f in again['COUNTDOWN'].frames)) < 250
+
+  # The tables are FrameTables, so a change to FrameTable.py has to be a new key too
+  assert inspect.getsourcefile(FrameTable) in cache_sources()
+
+  load_patterns(patterns_file, {'top_led': 2, 'num_leds': 16}, cache_dir)
+  assert len(os.listdir(cache_dir)) == 1
+  assert os.listdir(cache_dir) != cached
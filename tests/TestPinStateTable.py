@@ -0,0 +1,38 @@
+from gserv.PinStateTable import PinStateTable, UNKNOWN
+import multiprocessing
+import time
+
+topics = ['gserv/gpioinput/close_hall', 'gserv/gpioinput/open_hall']
+
+
+def test_unknown_until_written():
+  table = PinStateTable(topics)
+  assert table.read(topics[0]) == (UNKNOWN, 0)
+  assert table.snapshot()[topics[1]] == {'state': None, 'age': None}
+
+
+def test_update_and_snapshot():
+  table = PinStateTable(topics)
+  table.update(topics[1], 1, time.monotonic_ns() - 2000000000)
+  assert table.read(topics[1])[0] == 1
+  assert table.read(topics[0])[0] == UNKNOWN
+  snapshot = table.snapshot()
+  assert snapshot[topics[1]]['state'] == 'HIGH'
+  assert 1.9 < snapshot[topics[1]]['age'] < 3
+
+
+def _writer(table):
+  for x in range(1000):
+    table.update(topics[0], x % 2, x)
+  table.update(topics[0], 0, 12345)
+
+
+def test_shared_with_forked_writer():
+  table = PinStateTable(topics)
+  p = multiprocessing.get_context('fork').Process(target=_writer, args=(table,))
+  p.start()
+  while p.is_alive():
+    state, edge_ns = table.read(topics[0])
+    assert state == UNKNOWN or state == edge_ns % 2 or edge_ns == 12345
+  p.join()
+  assert table.read(topics[0]) == (0, 12345)
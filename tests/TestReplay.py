@@ -0,0 +1,132 @@
+from gserv.ControllerSimulation import ControllerSimulation, load_configs
+from gserv.MQTTRecording import RecordingWriter, read_recording
+from gserv.Replay import replay, diff_publishes, controller, light, gpiooutput
+import json
+import pytest
+
+START = 1500000000.0
+
+config, texter_config = load_configs()
+
+
+def record_door_cycle(path):
+  '''
+  Runs an auto close in the controller simulation and writes what the broker would have seen
+  '''
+  sim = ControllerSimulation(config, texter_config)
+  writer = RecordingWriter(str(path))
+  seen = 0
+
+  def flush():
+    nonlocal seen
+    for t, topic, payload in sim.client.published[seen:]:
+      writer.write(START + t, topic, payload)
+    seen = len(sim.client.published)
+
+  flush()
+  for at, topic, payload in ((1, 'gserv/gpioinput/close_hall', 'LOW'), (1, 'gserv/gpioinput/open_hall', 'HIGH'),
+      (30, 'gserv/gpioinput/close_hall', 'HIGH'), (35, 'gserv/gpioinput/open_hall', 'LOW'),
+      (700, 'gserv/gpioinput/open_hall', 'HIGH'), (705, 'gserv/gpioinput/close_hall', 'LOW')):
+    sim.advance(at - sim.scheduler.now)
+    flush()
+    writer.write(START + at, topic, payload)
+    sim.input(topic, payload)
+    flush()
+  writer.close()
+
+
+def test_recording_round_trip(tmp_path):
+  path = tmp_path / 'bus.rec'
+  writer = RecordingWriter(str(path))
+  writer.write(1.5, 'gserv/leds', 'COUNTDOWN')
+  writer.write(2.5, 'gserv/sensors/lux', b'12.5')
+  writer.close()
+  # Appending carries on with the topics already in the file
+  writer = RecordingWriter(str(path))
+  writer.write(3.5, 'gserv/leds', 'GREEN_CLOCKWISE')
+  writer.close()
+  assert list(read_recording(str(path))) == [(1.5, 'gserv/leds', b'COUNTDOWN'), (2.5, 'gserv/sensors/lux', b'12.5'),
+    (3.5, 'gserv/leds', b'GREEN_CLOCKWISE')]
+
+
+def test_cut_off_record_is_dropped(tmp_path):
+  path = tmp_path / 'bus.rec'
+  writer = RecordingWriter(str(path))
+  writer.write(1.0, 'gserv/leds', 'COUNTDOWN')
+  writer.write(2.0, 'gserv/leds', 'GREEN_CLOCKWISE')
+  writer.close()
+  with open(str(path), 'r+b') as f:
+    f.truncate(path.stat().st_size - 3)
+  assert [m[2] for m in read_recording(str(path))] == [b'COUNTDOWN']
+
+  writer = RecordingWriter(str(path))
+  writer.write(3.0, 'gserv/leds', 'HOLD')
+  writer.close()
+  assert [m[2] for m in read_recording(str(path))] == [b'COUNTDOWN', b'HOLD']
+
+
+def test_not_a_recording(tmp_path):
+  path = tmp_path / 'bus.rec'
+  path.write_bytes(b'something else')
+  with pytest.raises(ValueError):
+    list(read_recording(str(path)))
+
+
+def test_controller_replay_matches_recording(tmp_path):
+  path = tmp_path / 'bus.rec'
+  record_door_cycle(path)
+  messages = list(read_recording(str(path)))
+  build, outputs = controller('config/controller.yaml', 'config/secure.yaml.sample')
+  result = replay(build, messages)
+
+  assert result.delivered == len(messages)
+  assert ('gserv/gpiooutput/door', 'HIGH') in [(topic, payload) for t, topic, payload in result.published]
+  assert diff_publishes(messages, result.published, outputs) == ([], [])
+
+
+def test_diff_finds_changed_behaviour(tmp_path):
+  path = tmp_path / 'bus.rec'
+  record_door_cycle(path)
+  messages = list(read_recording(str(path)))
+  build, outputs = controller('config/controller.yaml', 'config/secure.yaml.sample')
+
+  def shorter(client, scheduler):
+    module = build(client, scheduler)
+    module.set_alarm_times(300, 30, 10, 120)
+    return module
+
+  missing, extra = diff_publishes(messages, replay(shorter, messages).published, outputs)
+  assert (START + 635, 'gserv/gpiooutput/door', 'HIGH') in missing
+  assert (START + 365, 'gserv/gpiooutput/door', 'HIGH') in extra
+
+
+def test_light_replay():
+  messages = [(START, 'gserv/sensors/lux', b'2.0'), (START + 1, 'gserv/light', b'ON'),
+    (START + 3, 'gserv/sensors/lux', b'40.0')]
+  build, outputs = light('config/light.yaml', 'config/secure.yaml.sample')
+  result = replay(build, messages, tail=700)
+  assert [(t - START, topic, payload) for t, topic, payload in result.published] == [
+    (1, 'gserv/gpiooutput/light', 'HIGH'), (601 + 5, 'gserv/gpiooutput/light', 'HIGH')]
+
+
+def test_gpiooutput_acks_a_command_id():
+  messages = [(START, 'gserv/gpiooutput/door/id', json.dumps({'id': 'door-1', 'sent': START - 0.01}).encode()),
+    (START + 0.005, 'gserv/gpiooutput/door', b'HIGH'), (START + 60, 'gserv/gpiooutput/door', b'HIGH')]
+  build, outputs = gpiooutput('config/gpiooutput.yaml', 'config/secure.yaml.sample')
+  result = replay(build, messages)
+  acks = [json.loads(payload) for t, topic, payload in result.published if topic == 'gserv/timing/gpiooutput']
+  assert acks == [{'id': 'door-1', 'topic': 'gserv/gpiooutput/door', 'received': START + 0.005,
+    'written': START + 0.005}]
+
+
+def test_gpiooutput_does_not_ack_a_rejected_pulse():
+  messages = [(START, 'gserv/gpiooutput/door/id', json.dumps({'id': 'door-1', 'sent': START}).encode()),
+    (START, 'gserv/gpiooutput/door', b'HIGH'),
+    (START + 0.2, 'gserv/gpiooutput/door/id', json.dumps({'id': 'door-2', 'sent': START + 0.2}).encode()),
+    (START + 0.2, 'gserv/gpiooutput/door', b'HIGH'),
+    (START + 60, 'gserv/gpiooutput/door', b'HIGH')]
+  build, outputs = gpiooutput('config/gpiooutput.yaml', 'config/secure.yaml.sample')
+  result = replay(build, messages)
+  acks = [json.loads(payload)['id'] for t, topic, payload in result.published if topic == 'gserv/timing/gpiooutput']
+  # door-2 came while door-1's pulse was still running, and the pulse at 60s had no id
+  assert acks == ['door-1']
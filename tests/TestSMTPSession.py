@@ -0,0 +1,113 @@
+from gserv.SMTPSession import SMTPSession
+import smtplib
+import time
+
+
+class FakeServer():
+  '''
+  Stands in for the SMTP server, with each connection a FakeSMTP
+  '''
+  def __init__(self, reachable=True):
+    self.reachable = reachable
+    self.connections = []
+    self.mail = []
+    self.drop_on_noop = False
+    self.drop_on_send = False
+
+  def connect(self, server, port, timeout=None):
+    if not self.reachable:
+      raise OSError("Connection refused")
+    smtp = FakeSMTP(self)
+    self.connections.append(smtp)
+    return smtp
+
+
+class FakeSMTP():
+  def __init__(self, server):
+    self.server = server
+    self.calls = []
+    self.noops = 0
+
+  def starttls(self):
+    self.calls.append('starttls')
+
+  def login(self, user, password):
+    self.calls.append('login')
+
+  def noop(self):
+    self.noops += 1
+    if self.server.drop_on_noop:
+      self.server.drop_on_noop = False
+      raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+    return 250, b'OK'
+
+  def sendmail(self, from_addr, to_addrs, message):
+    if self.server.drop_on_send:
+      self.server.drop_on_send = False
+      raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+    self.server.mail.append((from_addr, to_addrs, message))
+
+  def quit(self):
+    self.calls.append('quit')
+
+  def close(self):
+    self.calls.append('close')
+
+
+def wait_for(condition):
+  deadline = time.monotonic() + 2
+  while not condition() and time.monotonic() < deadline:
+    time.sleep(0.005)
+  return condition()
+
+
+def test_logs_in_before_the_first_send():
+  server = FakeServer()
+  session = SMTPSession('smtp', 587, 'user', 'password', connect=server.connect)
+  session.start()
+  assert wait_for(lambda: session.connects == 1)
+  assert server.connections[0].calls == ['starttls', 'login']
+  session.close()
+
+
+def test_burst_uses_one_session():
+  server = FakeServer()
+  session = SMTPSession('smtp', 587, 'user', 'password', connect=server.connect)
+  for i in range(5):
+    session.send('user', ['phone'], 'alert {}'.format(i))
+  session.close()
+  assert [m[2] for m in server.mail] == ['alert {}'.format(i) for i in range(5)]
+  assert len(server.connections) == 1
+  assert server.connections[0].calls == ['starttls', 'login', 'quit']
+
+
+def test_keepalive_reconnects_a_dropped_session():
+  server = FakeServer()
+  session = SMTPSession('smtp', 587, 'user', 'password', keepalive=0.02, connect=server.connect)
+  session.start()
+  assert wait_for(lambda: session.connects == 1 and server.connections[0].noops > 0)
+  server.drop_on_noop = True
+  assert wait_for(lambda: session.connects == 2)
+  session.send('user', ['phone'], 'alert')
+  session.close()
+  assert len(server.mail) == 1
+
+
+def test_session_lost_while_sending_is_retried():
+  server = FakeServer()
+  session = SMTPSession('smtp', 587, starttls=False, connect=server.connect)
+  server.drop_on_send = True
+  session.send('user', ['phone'], 'alert')
+  session.close()
+  assert len(server.mail) == 1
+  assert session.connects == 2
+  assert server.connections[0].calls == ['close']
+
+
+def test_unreachable_server():
+  server = FakeServer(reachable=False)
+  session = SMTPSession('smtp', 587, 'user', 'password', connect=server.connect)
+  session.send('user', ['phone'], 'alert')
+  session.close()
+  assert session.failed == 1
+  assert session.sent == 0
@@ -0,0 +1,72 @@
+import threading
+import time
+from gserv.Scheduler import Scheduler, VirtualScheduler
+
+
+def test_runs_in_deadline_order():
+  scheduler = Scheduler()
+  fired = []
+  done = threading.Event()
+  scheduler.call_later(0.06, lambda: (fired.append('c'), done.set()))
+  scheduler.call_later(0.02, fired.append, 'a')
+  scheduler.call_later(0.04, fired.append, 'b')
+  assert done.wait(2)
+  assert fired == ['a', 'b', 'c']
+
+
+def test_cancel():
+  scheduler = Scheduler()
+  fired = []
+  done = threading.Event()
+  handle = scheduler.call_later(0.02, fired.append, 'cancelled')
+  scheduler.call_later(0.05, done.set)
+  handle.cancel()
+  handle.cancel()
+  assert done.wait(2)
+  assert fired == []
+  assert scheduler.pending() == 0
+
+
+def test_handle_keeps_args():
+  scheduler = Scheduler()
+  handle = scheduler.call_later(10, print, 'message text')
+  assert handle.args[0] == 'message text'
+  assert 9 < handle.remaining() <= 10
+  handle.cancel()
+
+
+def test_exception_does_not_stop_thread():
+  scheduler = Scheduler()
+  done = threading.Event()
+
+  def fail():
+    raise RuntimeError('boom')
+
+  scheduler.call_later(0.01, fail)
+  scheduler.call_later(0.02, done.set)
+  assert done.wait(2)
+
+
+def test_one_thread_for_many_timers():
+  scheduler = Scheduler()
+  before = threading.active_count()
+  handles = [scheduler.call_later(5, print) for x in range(200)]
+  assert threading.active_count() <= before + 1
+  for h in handles:
+    h.cancel()
+  assert scheduler.pending() == 0
+
+
+def test_virtual_scheduler_runs_on_advance():
+  scheduler = VirtualScheduler()
+  fired = []
+  scheduler.call_later(600, lambda: fired.append(('b', scheduler.clock())))
+  scheduler.call_later(30, lambda: fired.append(('a', scheduler.clock())))
+  cancelled = scheduler.call_later(60, fired.append, 'cancelled')
+  cancelled.cancel()
+  scheduler.advance(599)
+  assert fired == [('a', 30)]
+  assert scheduler.next_deadline() == 600
+  scheduler.advance(1)
+  assert fired == [('a', 30), ('b', 600)]
+  assert scheduler.next_deadline() is None
@@ -0,0 +1,64 @@
+from gserv.OutputBank import OutputBank
+from gserv.Scheduler import Scheduler
+from gserv.SequencePlayer import compile_sequence
+from gserv.gpio_backends.Simulator import SimulatorBackend
+import pytest
+import time
+
+piezo = {'topic': 'gserv/gpiooutput/piezo', 'pin': 4, 'type': 'sequence', 'initial_state': 'LOW', 'sequences': {
+  'CHIRP': [{'high': 0.01, 'low': 0.01, 'repeat': 2}],
+  'ERROR': {'repeat': 0, 'steps': [{'high': 0.005}, {'low': 0.005}]}}}
+
+
+def wait_until(check):
+  start = time.monotonic()
+  while not check() and time.monotonic() - start < 1:
+    time.sleep(0.001)
+
+
+def test_compile_merges_levels():
+  schedule = compile_sequence('BEEP', [{'high': 0.1}, {'high': 0.1, 'low': 0.3}])
+  assert schedule.transitions == ((0.0, 1), (0.2, 0))
+  assert schedule.duration == pytest.approx(0.5)
+  assert schedule.repeat == 1
+
+
+def test_compile_pwm():
+  schedule = compile_sequence('PWM', {'repeat': 0, 'steps': [{'pwm': 0.25, 'hz': 100, 'seconds': 0.1}]})
+  assert len(schedule.transitions) == 20
+  assert schedule.transitions[1][0] == pytest.approx(0.0025)
+  assert schedule.duration == pytest.approx(0.1)
+
+
+def test_compile_rejects_bad_steps():
+  for spec in ([], [{'on': 0.1}], [{'pwm': 2, 'hz': 10, 'seconds': 1}], [{'high': -1}]):
+    with pytest.raises(ValueError):
+      compile_sequence('BAD', spec)
+
+
+def test_sequence_plays_and_returns_to_initial():
+  sim = SimulatorBackend({})
+  bank = OutputBank(sim, Scheduler())
+  bank.add(piezo)
+  assert bank.set('piezo', 'CHIRP')
+  wait_until(lambda: bank.outputs['gserv/gpiooutput/piezo'].playing is None)
+
+  stamps = [t for t, pin, value in sim.writes]
+  assert [value for t, pin, value in sim.writes] == [0, 1, 0, 1, 0]
+  assert stamps[-1] - stamps[1] == pytest.approx(0.03, abs=0.01)
+  assert bank.stats()['piezo']['sequences'] == 1
+
+
+def test_low_stops_a_looping_sequence():
+  sim = SimulatorBackend({})
+  bank = OutputBank(sim, Scheduler())
+  bank.add(piezo)
+  bank.set('piezo', 'ERROR')
+  time.sleep(0.03)
+  bank.set('piezo', 'LOW')
+  count = len(sim.writes)
+  time.sleep(0.03)
+
+  assert len(sim.writes) == count
+  assert sim.writes[-1][2] == 0
+  assert not bank.set('piezo', 'NOPE')
@@ -0,0 +1,31 @@
+from gserv.StateSnapshot import save_snapshot, load_snapshot
+import os
+
+
+def test_round_trip(tmp_path):
+  path = str(tmp_path / 'state.json')
+  save_snapshot(path, {'saved': 12.5, 'doors': {'door': {'state': 'OPENED'}}})
+  assert load_snapshot(path) == {'saved': 12.5, 'doors': {'door': {'state': 'OPENED'}}}
+  assert not os.path.exists(path + '.tmp')
+
+
+def test_missing_snapshot(tmp_path):
+  assert load_snapshot(str(tmp_path / 'state.json')) is None
+
+
+def test_unreadable_snapshot(tmp_path):
+  path = tmp_path / 'state.json'
+  path.write_text('{"saved": 12.5, "doo')
+  assert load_snapshot(str(path)) is None
+  path.write_text('[1, 2]')
+  assert load_snapshot(str(path)) is None
+
+
+def test_failed_save_keeps_the_old_snapshot(tmp_path):
+  path = str(tmp_path / 'state.json')
+  save_snapshot(path, {'saved': 1})
+  try:
+    save_snapshot(path, {'saved': object()})
+  except TypeError:
+    pass
+  assert load_snapshot(path) == {'saved': 1}
@@ -0,0 +1,126 @@
+from gserv.BaseModule import BaseModule
+from gserv.ControllerSimulation import ControllerSimulation, SimMessage, load_configs
+from gserv.Texter import Texter
+from gserv.Tracing import Tracer, read_trace, merge_traces
+import json
+
+config, texter_config = load_configs()
+
+
+class Client():
+  def __init__(self):
+    self.published = []
+
+  def publish(self, topic, payload=None, qos=0, retain=False):
+    self.published.append((topic, payload))
+
+
+class Relay(BaseModule):
+  '''
+  Hands whatever it gets on gserv/in on to gserv/out
+  '''
+  def on_message(self, client, userdata, message):
+    with self.tracer.span('relay'):
+      self.publish_traced('gserv/out', message.payload.decode('utf-8'))
+
+
+def spans(path):
+  return {e['name']: e for e in read_trace(str(path)) if e['ph'] == 'X'}
+
+
+def test_spans_nest(tmp_path):
+  tracer = Tracer('test', str(tmp_path / 'test.json'))
+  with tracer.span('outer') as outer:
+    with tracer.span('inner') as inner:
+      assert tracer.current() is inner
+    assert tracer.current() is outer
+  assert tracer.current() is None
+
+  events = spans(tmp_path / 'test.json')
+  assert events['inner']['args']['parent'] == events['outer']['args']['span']
+  assert events['inner']['args']['trace'] == events['outer']['args']['trace']
+  assert events['outer']['args']['parent'] is None
+  assert events['outer']['ts'] <= events['inner']['ts']
+  assert events['outer']['dur'] >= events['inner']['dur']
+  with open(str(tmp_path / 'test.json')) as f:
+    assert f.readline() == '[\n'
+
+
+def test_disabled_tracer_writes_nothing(tmp_path):
+  tracer = Tracer('test')
+  client = Client()
+  with tracer.span('outer') as outer:
+    tracer.inject(client, 'gserv/out')
+    assert tracer.current() is outer
+  assert client.published == []
+  assert list(tmp_path.iterdir()) == []
+
+
+def test_trace_file_rotates(tmp_path):
+  tracer = Tracer('test', str(tmp_path / 'test.json'), max_bytes=2000)
+  for i in range(40):
+    with tracer.span('span {}'.format(i)):
+      pass
+  assert (tmp_path / 'test.json.1').exists()
+  merged = merge_traces([str(tmp_path / 'test.json.1'), str(tmp_path / 'test.json')])
+  # Only the last file moved aside is kept
+  names = [e['name'] for e in merged if e['ph'] == 'X']
+  assert names == ['span {}'.format(i) for i in range(40 - len(names), 40)]
+  assert 10 < len(names) < 40
+
+
+def test_cut_off_line_is_dropped(tmp_path):
+  path = tmp_path / 'test.json'
+  tracer = Tracer('test', str(path))
+  with tracer.span('whole'):
+    pass
+  with open(str(path), 'a') as f:
+    f.write('{"name": "cut')
+  assert list(spans(path)) == ['whole']
+
+
+def test_trace_crosses_modules(tmp_path):
+  client = Client()
+  relay = Relay({'mqtt_client_name': 'Relay', 'trace_dir': str(tmp_path)}, None, mqtt_client=client)
+  sender = Tracer('Sender', str(tmp_path / 'Sender.json'))
+  with sender.span('send') as context:
+    sender.inject(client, 'gserv/in')
+  sidecar = client.published.pop()
+  assert sidecar[0] == 'gserv/trace/gserv/in'
+
+  relay.receive(client, None, SimMessage(*sidecar))
+  relay.receive(client, None, SimMessage('gserv/in', 'hello'))
+  assert [topic for topic, payload in client.published] == ['gserv/trace/gserv/out', 'gserv/out']
+  assert json.loads(client.published[0][1])['trace'] == context.trace_id
+
+  events = merge_traces([str(tmp_path / 'Sender.json'), str(tmp_path / 'Relay.json')])
+  received = [e for e in events if e['name'] == 'on_message gserv/in'][0]
+  assert received['args']['parent'] == context.span_id
+  flows = [e for e in events if e['ph'] in ('s', 'f')]
+  assert [e['ph'] for e in flows if e['name'] == 'mqtt gserv/in'] == ['s', 'f']
+  assert len({e['id'] for e in flows if e['name'] == 'mqtt gserv/in'}) == 1
+
+
+def test_motion_snapshot_is_traced(tmp_path):
+  sim = ControllerSimulation(dict(config, trace_dir=str(tmp_path)), texter_config)
+  sim.input('gserv/gpioinput/pir', 'HIGH')
+  sim.advance(config['snapshot_delay'])
+  topics = [topic for t, topic, payload in sim.client.published]
+  assert topics[-2:] == ['gserv/trace/gserv/camera', 'gserv/camera']
+  assert 'snapshot delay' in spans(tmp_path / 'ControllerModule.json')
+
+
+def test_text_with_picture_is_traced(tmp_path):
+  client = Client()
+  texts = []
+  tracer = Tracer('Texter', str(tmp_path / 'Texter.json'))
+  texter = Texter(client, config=texter_config, mailer=lambda text, picture: texts.append((text, picture)),
+    tracer=tracer)
+  texter.send_text("Garage Door Closed Successfully", True)
+  assert [topic for topic, payload in client.published] == ['gserv/trace/gserv/camera', 'gserv/camera']
+  texter.receive_picture('/tmp/picture.jpg')
+
+  events = spans(tmp_path / 'Texter.json')
+  assert texts == [("Garage Door Closed Successfully", '/tmp/picture.jpg')]
+  assert events['picture wait']['args']['trace'] == events['send text']['args']['trace']
+  assert events['send text']['args']['picture'] is True
@@ -0,0 +1,53 @@
+from gserv.TravelStats import Histogram, Baseline, TravelStats
+import random
+
+
+def test_quantiles_within_a_bucket():
+  rng = random.Random(1)
+  values = [rng.uniform(8, 16) for i in range(10000)]
+  histogram = Histogram()
+  for v in values:
+    histogram.add(v)
+  values.sort()
+  for q in (0.1, 0.5, 0.9, 0.99):
+    exact = values[int(q * (len(values) - 1))]
+    assert abs(histogram.quantile(q) - exact) / exact < 0.1
+  assert histogram.quantile(0) >= histogram.min
+  assert histogram.quantile(1) == histogram.max
+
+
+def test_out_of_range_values():
+  histogram = Histogram(low=1.0, high=10.0)
+  for v in (0.01, 0.02, 500.0):
+    histogram.add(v)
+  assert histogram.quantile(0.5) <= 1.0
+  assert histogram.quantile(1) == 500.0
+  assert Histogram().quantile(0.5) is None
+
+
+def test_memory_is_fixed():
+  histogram = Histogram()
+  buckets = len(histogram.counts)
+  for i in range(100000):
+    histogram.add(i / 100.0)
+  assert len(histogram.counts) == buckets
+  assert histogram.count == 100000
+
+
+def test_baseline_warms_up():
+  baseline = Baseline(warmup=5)
+  assert [baseline.update(12.0) for i in range(5)] == [None] * 5
+  assert baseline.update(12.0) == 0.0
+  assert baseline.update(22.0) == 40.0
+
+
+def test_slow_door_is_reported():
+  rng = random.Random(2)
+  travel = TravelStats(sigma=3.0, warmup=10)
+  assert [travel.add('open', rng.gauss(12, 0.3)) for i in range(50)].count(None) >= 49
+  deviation, usual = travel.add('open', 18.0)
+  assert deviation > 3.0
+  assert abs(usual - 12) < 0.5
+  summary = travel.summary()['open']
+  assert summary['count'] == 51
+  assert summary['max'] == 18.0
@@ -0,0 +1,52 @@
+import random
+from gserv.WS2812Encoder import WS2812Encoder, SPI_TABLE, grb_to_spi_reference
+
+
+def reference_frame(frame):
+  outbytes = [0] * (1 + len(frame) * 9)
+  byte_idx = 1
+  for l in frame:
+    outbytes[byte_idx:byte_idx + 9] = grb_to_spi_reference(l)
+    byte_idx += 9
+  return bytes(outbytes)
+
+
+def to_bytes(frame):
+  return bytes(c for grb in frame for c in grb)
+
+
+'''
+Every color byte encodes to 3 whole SPI bytes, so covering all 256 values in each of the
+3 positions covers the encoder. A random sample of full grb values is checked on top
+'''
+
+
+def test_every_byte_in_every_position():
+  for v in range(256):
+    for grb in ((v, 0, 0), (0, v, 0), (0, 0, v), (v, 0xFF - v, v)):
+      assert bytes(WS2812Encoder(1).encode(to_bytes([grb]))) == reference_frame([grb])
+
+
+def test_sampled_grb_values():
+  rng = random.Random(2812)
+  encoder = WS2812Encoder(8)
+  for x in range(4096):
+    frame = [tuple(rng.randrange(256) for c in range(3)) for led in range(8)]
+    assert bytes(encoder.encode(to_bytes(frame))) == reference_frame(frame)
+
+
+def test_table_shape():
+  assert len(SPI_TABLE) == 256
+  assert all(len(entry) == 3 for entry in SPI_TABLE)
+
+
+def test_only_changed_leds_are_reencoded():
+  encoder = WS2812Encoder(8)
+  frame = [(0x42, 0x80, 0x00)] * 8
+  buffer = encoder.encode(to_bytes(frame))
+  frame[3] = (0x00, 0x00, 0x00)
+  frame[5] = (0x01, 0x02, 0x03)
+  assert encoder.encode(to_bytes(frame), [3]) is buffer
+  assert bytes(buffer) != reference_frame(frame)
+  encoder.encode(to_bytes(frame), [5])
+  assert bytes(buffer) == reference_frame(frame)